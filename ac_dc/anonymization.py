@@ -1,4 +1,5 @@
 import re, regex
+from bisect import bisect_left
 
 
 trannum = str.maketrans("0123456789", "1111111111")
@@ -414,59 +415,170 @@ tag_2_regex = [
 ]
 
 
-# Code below needs to be updated/completed.
+word_char = regex.compile(r"\w")
+
+
+def is_word(text, start, end):
+    """Whether `text[start:end]` is not preceded nor followed by a word character in `text`."""
+    return (start == 0 or not word_char.match(text, start - 1)) and (
+        end == len(text) or not word_char.match(text, end)
+    )
+
+
+class RegexAnonymizer:
+    """Anonymizer compiled for a language, which finds the entities of all the tags
+    in at most two scans of the sentence.
+
+    The regexes of the language are merged into one alternation with a named group
+    per regex, by order of priority of the tags: one for the tags which are anonymized,
+    and one for the tags which are only reported, so that they do not hide the former.
+    The context words of all the regexes are found as whole words in a single scan of the sentence,
+    with a list of keywords matched by the regex engine as with an Aho-Corasick
+    automaton. The regexes with context words are only part of the alternations when
+    one of their context words is in the sentence, and the alternation of each set of
+    regexes is compiled once. The matches are then kept only if an occurrence of a
+    context word is within `context_window` characters, and the output is built from
+    the spans of the matches.
+    """
+
+    def __init__(self, lang_id: str, context_window: int = 20):
+        # `lang_id` can be regional, as `en_US`, for the regexes grouped by region
+        self.regex_lang_id = lang_id
+        self.lang_id = lang_id.split("_")[0]
+        self.context_window = context_window
+        self.rules = []
+        for tag, (regex_group, anonymize_condition) in tag_2_regex:
+            regex_list = regex_group.get(self.lang_id, regex_group.get("default", []))
+            if isinstance(regex_list, dict):
+                regex_list = regex_list.get(self.regex_lang_id, [])
+            for compiled_regex, context in regex_list:
+                if context:
+                    context = tuple(c.lower() for c in context)
+                self.rules.append(
+                    (tag, compiled_regex.pattern, context, anonymize_condition)
+                )
+        self.patterns = {}
+
+        keywords = sorted({c for _, _, context, _ in self.rules for c in context or ()})
+        self.keyword_pattern = None
+        if keywords:
+            # Whole words only, as "ph" is not a context word in "graphic"
+            self.keyword_pattern = regex.compile(
+                r"(?<!\w)\L<keywords>(?!\w)", keywords=keywords, flags=regex.IGNORECASE
+            )
+        # The scan only reports the longest keyword starting at each position, the keywords
+        # it contains as whole words are added with their offsets
+        self.sub_keywords = {
+            keyword: [
+                (sub_keyword, offset)
+                for sub_keyword in keywords
+                for offset in range(len(keyword) - len(sub_keyword) + 1)
+                if keyword.startswith(sub_keyword, offset)
+                and is_word(keyword, offset, offset + len(sub_keyword))
+            ]
+            for keyword in keywords
+        }
+
+    def find_keywords(self, sentence):
+        """Sorted start positions of the occurrences of each context word in the sentence."""
+        keywords = {}
+        if self.keyword_pattern is None:
+            return keywords
+        for match in self.keyword_pattern.finditer(sentence, overlapped=True):
+            for sub_keyword, offset in self.sub_keywords[match.group().lower()]:
+                keywords.setdefault(sub_keyword, []).append(match.start() + offset)
+        for positions in keywords.values():
+            positions.sort()
+        return keywords
+
+    def get_pattern(self, rule_ids):
+        if rule_ids not in self.patterns:
+            self.patterns[rule_ids] = regex.compile(
+                "|".join(f"(?P<rule_{i}>{self.rules[i][1]})" for i in rule_ids)
+            )
+        return self.patterns[rule_ids]
+
+    def find_context(self, keywords, start, end, context):
+        for c in context:
+            positions = keywords.get(c, [])
+            # First occurrences starting in the left and right windows
+            left = bisect_left(positions, start - self.context_window)
+            if left < len(positions) and positions[left] + len(c) <= start:
+                return True
+            right = bisect_left(positions, end)
+            if (
+                right < len(positions)
+                and positions[right] + len(c) <= end + self.context_window
+            ):
+                return True
+        return False
+
+    def find_entities(self, sentence, keywords, rule_ids):
+        """Non overlapping matches of the rules, as (start, end, rule id)."""
+        if not rule_ids:
+            return
+        pattern = self.get_pattern(rule_ids)
+        pos = 0
+        while pos <= len(sentence):
+            match = pattern.search(sentence, pos)
+            if match is None:
+                break
+            start = match.start()
+            candidates = rule_ids
+            while match is not None:
+                i = next(i for i in candidates if match.start(f"rule_{i}") != -1)
+                end = match.end()
+                context = self.rules[i][2]
+                if end > start and (
+                    not context or self.find_context(keywords, start, end, context)
+                ):
+                    break
+                # The rules of lower priority are tried at the same position
+                candidates = candidates[candidates.index(i) + 1 :]
+                match = None
+                if candidates:
+                    match = self.get_pattern(candidates).match(sentence, start)
+            if match is None:
+                # Let the other matches start in the rejected one
+                pos = start + 1
+                continue
+            yield start, end, i
+            pos = end
+
+    def __call__(self, sentence: str):
+        keywords = self.find_keywords(sentence)
+        rule_ids = [
+            i
+            for i, (_, _, context, _) in enumerate(self.rules)
+            if not context or any(c in keywords for c in context)
+        ]
+
+        ner = {}
+        reported_ids = tuple(i for i in rule_ids if not self.rules[i][3])
+        for start, end, i in self.find_entities(sentence, keywords, reported_ids):
+            ner[sentence[start:end].strip()] = self.rules[i][0]
+
+        output = []
+        last_end = 0
+        anonymized_ids = tuple(i for i in rule_ids if self.rules[i][3])
+        for start, end, i in self.find_entities(sentence, keywords, anonymized_ids):
+            tag = self.rules[i][0]
+            output.append(sentence[last_end:start])
+            output.append(f" <{tag}> ")
+            last_end = end
+            ner[f"<{tag}>"] = tag
+        output.append(sentence[last_end:])
+        return "".join(output), ner
+
+
+regex_anonymizers = {}
 
 
 def apply_regex_anonymization(
     sentence: str, lang_id: str, context_window: int = 20
 ) -> str:
-    ner = {}
-    lang_id = regex_lang_id.split("_")[0]
-    if lang_id in ("zh", "ko", "ja"):
-        sentence_set = set(sentence.lower())
-    else:
-        sentence_set = set(sentence.lower().split(" "))
-    for tag, regex_group_and_anonymize_condition in tag_2_regex:
-        regex_group, anonymize_condition = regex_group_and_anonymize_condition
-        for regex_dict in regex_group.get(lang_id, regex_group.get("default", [])):
-            if isinstance(regex_dict, dict):
-                regex_list = regex_dict.get(regex_lang_id, [])
-            else:
-                regex_list = regex_dict
-            match = False
-            for regex, context in regex_list:
-                found_context = False
-                if context:
-                    for c in context:
-                        if c in sentence_set:
-                            found_context = True
-                            break
-                    if not found_context:
-                        continue
-                for ent in regex.findall(sentence):
-                    if not isinstance(ent, str):
-                        continue
-                    if found_context:
-                        i = sentence.index(ent)
-                        j = i + len(ent)
-                        len_sentence = len(sentence)
-                        left = sentence[max(0, i - context_window) : i].lower()
-                        right = sentence[
-                            j : min(len_sentence, j + context_window)
-                        ].lower()
-                        found_context = False
-                        for c in context:
-                            if c in left or c in right:
-                                found_context = True
-                                break
-                        if not found_context:
-                            continue
-                    if anonymize_condition:
-                        sentence = sentence.replace(ent, f" <{tag}> ")
-                        ner[f"<{tag}>"] = tag
-                    else:
-                        ner[ent.strip()] = tag
-                    match = True
-                if match:
-                    break
-    return sentence, ner
+    if (lang_id, context_window) not in regex_anonymizers:
+        regex_anonymizers[(lang_id, context_window)] = RegexAnonymizer(
+            lang_id, context_window
+        )
+    return regex_anonymizers[(lang_id, context_window)](sentence)
@@ -0,0 +1,119 @@
+"""Benchmark of the scaling of the deduplication steps with the number of processes."""
+import logging
+import os
+import time
+from multiprocessing import Manager
+from typing import List
+
+import numpy as np
+import typer
+from mpire import WorkerPool
+
+from deduplicate import query_index
+from simhash_index import SimhashIndex
+
+app = typer.Typer()
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
+
+
+def synthetic_hashes(num_records: int, seed: int) -> np.ndarray:
+    """Random hashes, half of them being copies of the other half with up to 3 bits flipped."""
+    rng = np.random.default_rng(seed)
+    num_originals = num_records - num_records // 2
+    originals = rng.integers(0, 2**64, size=num_originals, dtype=np.uint64)
+    copies = originals[rng.integers(0, num_originals, size=num_records // 2)]
+    for _ in range(3):
+        flips = rng.integers(0, 65, size=len(copies)).astype(np.uint64)
+        # A flip of bit 64 is no flip
+        copies ^= np.where(
+            flips < 64, np.uint64(1) << (flips % np.uint64(64)), np.uint64(0)
+        )
+    return np.concatenate([originals, copies])
+
+
+def gather_with_manager(ids: np.ndarray, hashes: np.ndarray, num_proc: int) -> int:
+    """The former way to gather the hashes: one append to a Manager list per record."""
+    manager = Manager()
+    gathered = manager.list()
+
+    def process(id, hash):
+        gathered.append((id, hash))
+
+    with WorkerPool(n_jobs=num_proc) as pool:
+        pool.map(
+            process,
+            [{"id": int(id), "hash": int(hash)} for id, hash in zip(ids, hashes)],
+        )
+    return len(gathered)
+
+
+@app.command()
+def benchmark(
+    num_procs: List[int] = typer.Option(
+        [1, 2, 4, 8], help="Numbers of processes to benchmark"
+    ),
+    num_records: int = typer.Option(1_000_000, help="Number of synthetic hashes"),
+    num_records_manager: int = typer.Option(
+        20_000,
+        help="Number of hashes gathered through a Manager list, for comparison (0 to skip)",
+    ),
+    threshold: int = typer.Option(3, help="Maximum hamming distance for duplicates"),
+    seed: int = typer.Option(0, help="Seed of the synthetic hashes"),
+):
+    """
+    Measure, for each number of processes, the time to build the index (sorting its tables in parallel),
+    the throughput of `query_index` (used by `find-duplicates` and `merge-meta`) and, for comparison,
+    the throughput of gathering records through a `multiprocessing.Manager` list, which the previous
+    versions of `build-index`, `remove-duplicates` and `merge-meta` did.
+
+    Example:
+
+    ```bash
+    python ac_dc/benchmark_deduplicate.py --num-procs 1 --num-procs 4 --num-records 10000000
+    ```
+    """
+    hashes = synthetic_hashes(num_records, seed)
+    ids = np.arange(num_records, dtype=np.int64)
+    logger.info(f"{os.cpu_count()} processors available")
+
+    rows = []
+    for num_proc in num_procs:
+        start = time.perf_counter()
+        index = SimhashIndex.build(
+            ids, hashes, max_threshold=threshold, num_threads=num_proc
+        )
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        queries, _, _ = query_index(index, hashes, threshold, num_proc)
+        query_time = time.perf_counter() - start
+        num_matches = len(queries)
+
+        manager_throughput = float("nan")
+        if num_records_manager:
+            start = time.perf_counter()
+            gather_with_manager(
+                ids[:num_records_manager], hashes[:num_records_manager], num_proc
+            )
+            manager_throughput = num_records_manager / (time.perf_counter() - start)
+
+        rows.append(
+            (num_proc, build_time, num_records / query_time, manager_throughput)
+        )
+        logger.info(
+            f"{num_proc} processes: {num_matches} matches within {threshold} bits"
+        )
+
+    print(
+        f"{'num_proc':>10}{'build (s)':>12}{'queries/s':>14}{'manager records/s':>20}"
+    )
+    for num_proc, build_time, query_throughput, manager_throughput in rows:
+        print(
+            f"{num_proc:>10}{build_time:>12.2f}{query_throughput:>14.0f}{manager_throughput:>20.0f}"
+        )
+
+
+if __name__ == "__main__":
+
+    app()
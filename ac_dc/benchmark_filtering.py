@@ -0,0 +1,412 @@
+"""Benchmark of the filtering.
+
+Measure the throughput of the hot path of the filtering
+(normalization, tokenization, each check of Filtering.filtering and
+FunctionDatasetFiltering.__call__) for every language of parameters_filtering.py,
+on a synthetic multilingual corpus and with small fastText, SentencePiece
+and KenLM models trained on this corpus, so that it runs offline.
+The results can be saved as a baseline and compared to a later run
+to catch regressions of the throughput."""
+
+import argparse
+
+import json
+import os
+import random
+import sys
+import time
+
+import fasttext
+import sentencepiece
+
+from filtering import (
+    LoadParameters,
+    ModifyingDocuments,
+    FunctionDatasetModifyingDocuments,
+    FunctionDatasetFiltering,
+    SchedulingChecks,
+)
+from languages_id import langs_id
+from parameters_filtering import parameters_filtering
+from stopwords import stopwords
+from flagged_words import flagged_words
+
+
+class SyntheticCorpus:
+    # Ranges of letters for the languages without stopwords or flagged words
+    letters_ranges = {
+        "arz": (0x0621, 0x064A),
+        "as": (0x0985, 0x09B9),
+        "gu": (0x0A85, 0x0AB9),
+    }
+    default_letters_range = (0x0061, 0x007A)
+
+    @staticmethod
+    def get_vocabulary(lang_dataset_id, rng, vocabulary_size=200):
+        """Stopwords and flagged words of the language, or random words
+        written with the letters of the language if it has none."""
+        row = langs_id.loc[langs_id["dataset_id"] == lang_dataset_id].iloc[0]
+        vocabulary = []
+        if row["stopwords_id"]:
+            vocabulary += stopwords[row["stopwords_id"]]
+        if row["flagged_words_id"]:
+            vocabulary += flagged_words[row["flagged_words_id"]]
+        vocabulary = sorted(set(vocabulary))
+        if vocabulary:
+            return vocabulary
+        first_letter, last_letter = SyntheticCorpus.letters_ranges.get(
+            lang_dataset_id, SyntheticCorpus.default_letters_range
+        )
+        letters = [chr(i) for i in range(first_letter, last_letter + 1)]
+        return [
+            "".join(rng.choices(letters, k=rng.randint(2, 8)))
+            for _ in range(vocabulary_size)
+        ]
+
+    @staticmethod
+    def get_vocabularies(langs_dataset_id, seed):
+        rng = random.Random(seed)
+        return {
+            lang_dataset_id: SyntheticCorpus.get_vocabulary(lang_dataset_id, rng)
+            for lang_dataset_id in langs_dataset_id
+        }
+
+    @staticmethod
+    def get_document(vocabulary, rng, min_number_words=5, max_number_words=400):
+        """A document with sentences on several lines, and some noise
+        (repetitions, special characters, digits) so that all the checks
+        have documents to remove."""
+        number_words = rng.randint(min_number_words, max_number_words)
+        words = rng.choices(vocabulary, k=number_words)
+        kind = rng.random()
+        if kind < 0.1:
+            words = words[:10] * (number_words // 10 + 1)
+        elif kind < 0.2:
+            words = [word + rng.choice("#$%&*@^~|") for word in words]
+        elif kind < 0.3:
+            words = [str(rng.randint(0, 10000)) for _ in words]
+        lines = []
+        for ind in range(0, len(words), 15):
+            lines.append(" ".join(words[ind : ind + 15]) + ".")
+        return "\n".join(lines)
+
+    @staticmethod
+    def get_documents(vocabulary, num_documents, seed):
+        rng = random.Random(seed)
+        return [
+            SyntheticCorpus.get_document(vocabulary, rng) for _ in range(num_documents)
+        ]
+
+
+class StubModels:
+    """Small models trained on the synthetic corpus, shared by all the
+    languages. They are saved in path_dir_models and reused by the next runs."""
+
+    @staticmethod
+    def get_paths(path_dir_models):
+        return {
+            "fasttext": os.path.join(path_dir_models, "lid.bin"),
+            "sentencepiece": os.path.join(path_dir_models, "stub.sp.model"),
+            "kenlm": os.path.join(path_dir_models, "stub.arpa"),
+        }
+
+    @staticmethod
+    def train_fasttext_model(path_fasttext_model, vocabularies, rng, path_dir_models):
+        path_train = os.path.join(path_dir_models, "lid.txt")
+        with open(path_train, "w", encoding="utf-8") as f:
+            for lang_dataset_id, vocabulary in vocabularies.items():
+                fasttext_id = langs_id.loc[
+                    langs_id["dataset_id"] == lang_dataset_id, "fasttext_id"
+                ].iloc[0]
+                if not fasttext_id:
+                    continue
+                for _ in range(200):
+                    words = rng.choices(vocabulary, k=12)
+                    f.write(f"__label__{fasttext_id} {' '.join(words)}\n")
+        # A single thread, for a deterministic model
+        model = fasttext.train_supervised(
+            path_train, epoch=5, minCount=1, thread=1, verbose=0
+        )
+        model.save_model(path_fasttext_model)
+
+    @staticmethod
+    def train_sentencepiece_model(
+        path_sentencepiece_model, vocabularies, rng, path_dir_models
+    ):
+        path_train = os.path.join(path_dir_models, "sp.txt")
+        with open(path_train, "w", encoding="utf-8") as f:
+            for vocabulary in vocabularies.values():
+                for _ in range(100):
+                    f.write(" ".join(rng.choices(vocabulary, k=12)) + "\n")
+        sentencepiece.SentencePieceTrainer.train(
+            input=path_train,
+            model_prefix=path_sentencepiece_model[: -len(".model")],
+            vocab_size=2000,
+            hard_vocab_limit=False,
+            character_coverage=1.0,
+            minloglevel=2,
+        )
+
+    @staticmethod
+    def write_kenlm_model(path_kenlm_model, path_sentencepiece_model, rng):
+        """A bigram language model in the ARPA format on the pieces
+        of the SentencePiece model, with random probabilities."""
+        sentencepiece_model = sentencepiece.SentencePieceProcessor()
+        sentencepiece_model.load(path_sentencepiece_model)
+        special_tokens = ["<unk>", "<s>", "</s>"]
+        tokens = special_tokens + [
+            sentencepiece_model.id_to_piece(i)
+            for i in range(sentencepiece_model.get_piece_size())
+            if sentencepiece_model.id_to_piece(i) not in special_tokens
+        ]
+        with open(path_kenlm_model, "w", encoding="utf-8") as f:
+            f.write(f"\\data\\\nngram 1={len(tokens)}\nngram 2=1\n\n\\1-grams:\n")
+            for token in tokens:
+                log_prob = -99 if token == "<s>" else -1 - rng.random()
+                f.write(f"{log_prob:.4f}\t{token}\t-0.3\n")
+            f.write(f"\n\\2-grams:\n-0.5\t<s> {tokens[3]}\n\n\\end\\\n")
+
+    @staticmethod
+    def build(path_dir_models, vocabularies, seed):
+        os.makedirs(path_dir_models, exist_ok=True)
+        paths = StubModels.get_paths(path_dir_models)
+        rng = random.Random(seed)
+        if not os.path.exists(paths["fasttext"]):
+            StubModels.train_fasttext_model(
+                paths["fasttext"], vocabularies, rng, path_dir_models
+            )
+        if not os.path.exists(paths["sentencepiece"]):
+            StubModels.train_sentencepiece_model(
+                paths["sentencepiece"], vocabularies, rng, path_dir_models
+            )
+        if not os.path.exists(paths["kenlm"]):
+            StubModels.write_kenlm_model(paths["kenlm"], paths["sentencepiece"], rng)
+        return paths
+
+
+class BenchmarkFiltering:
+    @staticmethod
+    def best_time(function, documents, num_repeats):
+        """Best time over the repeats to process all the documents,
+        which is less noisy than the average."""
+        best_time = float("inf")
+        for _ in range(num_repeats):
+            start = time.perf_counter()
+            for document in documents:
+                function(document)
+            best_time = min(best_time, time.perf_counter() - start)
+        return best_time
+
+    @staticmethod
+    def benchmark_lang(lang_dataset_id, documents, paths_models, num_repeats):
+        num_documents = len(documents)
+        param = LoadParameters.load_parameters(lang_dataset_id)
+        func_modifying_documents = FunctionDatasetModifyingDocuments(lang_dataset_id)
+        func_filtering = FunctionDatasetFiltering(
+            lang_dataset_id,
+            paths_models["fasttext"],
+            paths_models["sentencepiece"],
+            paths_models["kenlm"],
+        )
+        sentencepiece_model_tok = func_filtering.sentencepiece_model_tok
+
+        def normalization(document):
+            return ModifyingDocuments.normalization(
+                document=document,
+                remove_non_printing_characters=True,
+                strip=True,
+                lower_case=True,
+                uniform_whitespace=True,
+                replace_digits_with_zeros=True,
+                replace_unicode_punctuation=True,
+            )
+
+        def get_words_from_document(document):
+            return ModifyingDocuments.get_words_from_document(
+                document,
+                sentencepiece_model_tok,
+                lower_case=True,
+                strip_characters=param["strip_characters"],
+            )
+
+        def filtering(document):
+            return func_filtering({"text": document})
+
+        docs_per_sec = {}
+        for name, function in [
+            ("normalization", normalization),
+            ("modifying_documents", func_modifying_documents.modifying_document),
+            ("get_words_from_document", get_words_from_document),
+            ("filtering", filtering),
+        ]:
+            total_time = BenchmarkFiltering.best_time(function, documents, num_repeats)
+            docs_per_sec[name] = num_documents / max(total_time, 1e-9)
+
+        checks_profile, tokenization_time = SchedulingChecks.profile_checks(
+            documents, func_filtering.filtering_parameters
+        )
+        checks_time = {
+            check_name: 1000 * check_profile["time"]
+            for check_name, check_profile in checks_profile.items()
+        }
+        checks_time["tokenization"] = 1000 * tokenization_time
+        rejection_rates = {
+            check_name: check_profile["rejection_rate"]
+            for check_name, check_profile in checks_profile.items()
+        }
+        return {
+            "docs_per_sec": docs_per_sec,
+            "checks_time_ms": checks_time,
+            "rejection_rates": rejection_rates,
+        }
+
+    @staticmethod
+    def benchmark(langs_dataset_id, num_documents, num_repeats, path_dir_models, seed):
+        vocabularies = SyntheticCorpus.get_vocabularies(langs_dataset_id, seed)
+        paths_models = StubModels.build(path_dir_models, vocabularies, seed)
+        results = {}
+        for lang_dataset_id in langs_dataset_id:
+            documents = SyntheticCorpus.get_documents(
+                vocabularies[lang_dataset_id], num_documents, seed
+            )
+            results[lang_dataset_id] = BenchmarkFiltering.benchmark_lang(
+                lang_dataset_id, documents, paths_models, num_repeats
+            )
+        return results
+
+    @staticmethod
+    def report(results):
+        names = list(next(iter(results.values()))["docs_per_sec"])
+        lines = [
+            "Documents per second:",
+            f"{'lang':<8}" + "".join(f"{name:>26}" for name in names),
+        ]
+        for lang_dataset_id, results_lang in results.items():
+            lines.append(
+                f"{lang_dataset_id:<8}"
+                + "".join(
+                    f"{results_lang['docs_per_sec'][name]:>26.1f}" for name in names
+                )
+            )
+        lines.append("Time per document of the checks (ms):")
+        for lang_dataset_id, results_lang in results.items():
+            lines.append(
+                f"{lang_dataset_id:<8}"
+                + ", ".join(
+                    f"{check_name}: {check_time:.3f}"
+                    for check_name, check_time in results_lang["checks_time_ms"].items()
+                )
+            )
+        return "\n".join(lines)
+
+    @staticmethod
+    def compare(results, baseline, tolerance):
+        """Return the regressions of the throughput compared to the baseline,
+        that is when the number of documents per second is lower than
+        (1 - tolerance) times the one of the baseline."""
+        regressions = []
+        for lang_dataset_id, results_lang in results.items():
+            if lang_dataset_id not in baseline:
+                continue
+            for name, docs_per_sec in results_lang["docs_per_sec"].items():
+                baseline_docs_per_sec = baseline[lang_dataset_id]["docs_per_sec"].get(
+                    name
+                )
+                if baseline_docs_per_sec is None:
+                    continue
+                if docs_per_sec < (1 - tolerance) * baseline_docs_per_sec:
+                    regressions.append(
+                        f"{lang_dataset_id} {name}: {docs_per_sec:.1f} docs/sec "
+                        f"(baseline: {baseline_docs_per_sec:.1f} docs/sec)"
+                    )
+        return regressions
+
+
+def parseArgs():
+    parser = argparse.ArgumentParser(description="Benchmark of the filtering.")
+    parser.add_argument(
+        "--langs_dataset_id",
+        type=str,
+        nargs="+",
+        default=[
+            lang_dataset_id
+            for lang_dataset_id in parameters_filtering
+            if lang_dataset_id != "default"
+        ],
+        help="Dataset ids of the languages to benchmark. By default, all the languages of parameters_filtering.py.",
+    )
+    parser.add_argument(
+        "--num_documents",
+        type=int,
+        default=200,
+        help="Number of synthetic documents per language.",
+    )
+    parser.add_argument(
+        "--num_repeats",
+        type=int,
+        default=3,
+        help="Number of repeats of each measure, the best time being kept.",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the synthetic corpus and of the stub models.",
+    )
+    parser.add_argument(
+        "--path_dir_models",
+        type=str,
+        default="benchmark_models",
+        help="Directory of the stub models, created on the first run.",
+    )
+    parser.add_argument(
+        "--path_save_results",
+        type=str,
+        default=None,
+        help="Path of the json file to save the results, that can be used as a baseline.",
+    )
+    parser.add_argument(
+        "--path_baseline",
+        type=str,
+        default=None,
+        help="Path of the json file of the results of a previous run to compare with.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Relative drop of the throughput compared to the baseline above which it is a regression.",
+    )
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = parseArgs()
+
+    results = BenchmarkFiltering.benchmark(
+        langs_dataset_id=args.langs_dataset_id,
+        num_documents=args.num_documents,
+        num_repeats=args.num_repeats,
+        path_dir_models=args.path_dir_models,
+        seed=args.seed,
+    )
+    print(BenchmarkFiltering.report(results))
+
+    if args.path_save_results:
+        with open(args.path_save_results, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.path_baseline:
+        with open(args.path_baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = BenchmarkFiltering.compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions of the throughput compared to the baseline:")
+            print("\n".join(regressions))
+            sys.exit(1)
+        print("No regression of the throughput compared to the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,36 @@
-"""Creating simhashes and removing near duplicates with annoy."""
+"""Creating simhashes and removing near duplicates with an exact simhash index."""
+import array
 import datetime
 import logging
 import os
 import re
-from collections import defaultdict
-from multiprocessing import Manager, cpu_count
-from typing import List, Optional, Tuple
+import tempfile
+from multiprocessing import cpu_count, get_context
+from typing import Iterator, List, Optional, Tuple, Union
 
-import networkx as nx
 import numpy as np
-import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import typer
-from annoy import AnnoyIndex
 from datasets import (
     Dataset,
     DatasetDict,
+    Features,
+    Value,
     concatenate_datasets,
     load_dataset,
     load_from_disk,
 )
+from datasets.arrow_writer import ArrowWriter
 from mpire import WorkerPool
 from simhash import Simhash
+from simhash_index import (
+    SegmentedSimhashIndex,
+    SimhashIndex,
+    bits_to_uint64,
+    load_index,
+    nearest_k,
+)
 from tqdm import tqdm
 
 app = typer.Typer()
@@ -56,6 +66,80 @@ def create_shingles(text: str, window: int = 4) -> List[str]:
     return [text[i : i + window] for i in range(len(text) - window + 1)]
 
 
+def hash_shingles(text: str, window: int = 4) -> np.ndarray:
+    """
+    Hash the same shingles as `create_shingles` with a fast non-cryptographic 64-bit hash,
+    computed on all the windows of code points at once instead of building the list of shingles.
+
+    Parameters
+    ----------
+    text : str
+        Input text string
+    window : int, optional
+        The size of the window, by default 4
+
+    Returns
+    -------
+    np.ndarray
+        Hashes (uint64) of the shingles
+    """
+    if len(text) > window:
+        text = re.sub(r"[^\w]+", "", text.lower())
+    codepoints = np.frombuffer(
+        text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+    ).astype(np.uint64)
+    if len(text) <= window:
+        # The whole text is a single shingle, like in `create_shingles`
+        window = len(codepoints)
+        num_shingles = 1
+    else:
+        # No shingle if the cleaned text is shorter than the window
+        num_shingles = max(len(codepoints) - window + 1, 0)
+    hashes = np.full(num_shingles, window, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for i in range(window):
+            hashes = (hashes ^ codepoints[i : i + num_shingles]) * np.uint64(
+                0x100000001B3
+            )
+        # Finalizer of splitmix64, so that every bit depends on every code point
+        hashes ^= hashes >> np.uint64(30)
+        hashes *= np.uint64(0xBF58476D1CE4E5B9)
+        hashes ^= hashes >> np.uint64(27)
+        hashes *= np.uint64(0x94D049BB133111EB)
+        hashes ^= hashes >> np.uint64(31)
+    return hashes
+
+
+def compute_simhashes(texts: List[str], window: int = 4) -> np.ndarray:
+    """
+    Simhashes of a batch of texts, from the shingle hashes of `hash_shingles`. Like `Simhash`, each bit
+    is set when it is set in more than half of the shingles of the text (so all the bits of a text
+    without shingle are 0), but the bit sums are computed with NumPy on all the shingles of a text at once.
+
+    Parameters
+    ----------
+    texts : List[str]
+        Input texts
+    window : int, optional
+        The size of the window, by default 4
+
+    Returns
+    -------
+    np.ndarray
+        Simhashes (uint64) of the texts
+    """
+    num_shingles = np.zeros(len(texts), dtype=np.int64)
+    bit_sums = np.zeros((len(texts), 64), dtype=np.int64)
+    for i, text in enumerate(texts):
+        shingle_hashes = hash_shingles(text, window)
+        num_shingles[i] = len(shingle_hashes)
+        bits = np.unpackbits(
+            shingle_hashes.astype(">u8").view(np.uint8).reshape(-1, 8), axis=1
+        )
+        bit_sums[i] = bits.sum(axis=0)
+    return bits_to_uint64(bit_sums > num_shingles[:, None] / 2)
+
+
 def check_num_proc(num_proc: int = -1) -> int:
     """
     Check the number of processors. Return a safe-checked value.
@@ -179,9 +263,22 @@ def build_hashes(
     text_column_name: Optional[str] = typer.Option(
         "text", help="Column name of the text"
     ),
+    save_hashes_file: bool = typer.Option(
+        False,
+        help="Also save the ids and hashes of each split in a `<split>_hashes.npy` file",
+    ),
+    hash_backend: str = typer.Option(
+        "simhash",
+        help="`simhash` (md5 of each shingle with the simhash library) or `numpy` (faster batched hashing, not compatible with `simhash` hashes)",
+    ),
+    batch_size: int = typer.Option(
+        1000, help="Number of records hashed at once with the `numpy` backend"
+    ),
 ):
     """
-    Create a single dataset with an extra `hash` column from all data files.
+    Create a single dataset with an extra `hash` column (uint64) from all data files.
+    With `--save-hashes-file`, the ids and hashes are also saved in a `<split>_hashes.npy` file sorted by id,
+    which is memory-mapped instead of reading the dataset when building the index.
 
     The time complexity for this function call is rounghly O(N * L // C) where N is the number
     of records in the data, L is the average length of each record text and C is the number of processes.
@@ -215,28 +312,101 @@ def build_hashes(
         Number of processes to use
     text_column_name : Optional[str], optional
         Column name of the text
+    save_hashes_file : bool, optional
+        Also save the ids and hashes of each split in a `<split>_hashes.npy` file
+    hash_backend : str, optional
+        `simhash` (md5 of each shingle with the simhash library) or `numpy` (faster batched hashing). The hashes
+        of both backends have the same distribution of distances, so the same thresholds apply, but they are
+        different: all the data indexed together must be hashed with the same backend
+    batch_size : int, optional
+        Number of records hashed at once with the `numpy` backend
     """
     num_proc = check_num_proc(num_proc)
+    if hash_backend not in ["simhash", "numpy"]:
+        raise ValueError(f"Unknown hash backend {hash_backend}")
     ds = load_dataset(path=path, name=name, data_files=data_files, data_dir=data_dir)
 
     def process(record):
         return {
-            "hash": np.array(
-                list(
-                    np.binary_repr(
-                        Simhash(
-                            create_shingles(record[text_column_name], shingle_size)
-                        ).value
-                    ).zfill(64)
-                )
-            ).astype(np.int8)
+            "hash": np.uint64(
+                Simhash(create_shingles(record[text_column_name], shingle_size)).value
+            )
         }
 
+    def process_batch(batch):
+        return {"hash": compute_simhashes(batch[text_column_name], shingle_size)}
+
+    features = Features({"hash": Value("uint64")})
     splits = [split] if split is not None else list(ds.keys())
     for s in splits:
-        ds[s] = ds[s].map(process, num_proc=num_proc)
+        if hash_backend == "numpy":
+            ds[s] = ds[s].map(
+                process_batch,
+                batched=True,
+                batch_size=batch_size,
+                num_proc=num_proc,
+                features=Features({**ds[s].features, **features}),
+            )
+        else:
+            ds[s] = ds[s].map(
+                process,
+                num_proc=num_proc,
+                features=Features({**ds[s].features, **features}),
+            )
     ds.save_to_disk(output_dir)
 
+    if save_hashes_file:
+        for s in splits:
+            ids, hashes = get_hashes(ds[s])
+            save_hashes_file_split(
+                os.path.join(output_dir, f"{s}_hashes.npy"), ids, hashes
+            )
+
+
+def hashes_file_path(data_dir: str, split: str) -> str:
+    return os.path.join(data_dir, f"{split}_hashes.npy")
+
+
+def save_hashes_file_split(path: str, ids: np.ndarray, hashes: np.ndarray):
+    """Save ids and hashes, sorted by id, as a structured array in a `.npy` file."""
+    records = np.empty(len(ids), dtype=[("id", np.int64), ("hash", np.uint64)])
+    records["id"] = ids
+    records["hash"] = hashes
+    records.sort(order="id", kind="stable")
+    np.save(path, records)
+
+
+def get_hashes(ds: Dataset) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Read the `id` and `hash` columns of a dataset as arrays, without iterating over the records.
+    Hashes stored as 64-element bit arrays by previous versions are packed into uint64.
+
+    Parameters
+    ----------
+    ds : Dataset
+        Dataset with `id` and `hash` columns
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Ids (int64) and hashes (uint64)
+    """
+    columns = ds.select_columns(["id", "hash"]).with_format("numpy")
+    ids = np.asarray(columns["id"], dtype=np.int64)
+    hashes = np.asarray(columns["hash"])
+    if hashes.ndim == 2:
+        hashes = bits_to_uint64(hashes)
+    return ids, hashes.astype(np.uint64)
+
+
+def load_hashes(data_dir: str, split: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Ids and hashes of a split, memory-mapped from `<split>_hashes.npy` if it exists, else read from the dataset."""
+    path = hashes_file_path(data_dir, split)
+    if os.path.exists(path):
+        records = np.load(path, mmap_mode="r")
+        return records["id"], records["hash"]
+    return get_hashes(load_from_disk(data_dir)[split])
+
 
 @app.command()
 def build_index(
@@ -244,46 +414,46 @@ def build_index(
     data_dirs: List[str],
     split: Optional[str] = typer.Option(None, help="Which split of the data to load"),
     num_proc: int = typer.Option(-1, help="Number of processes to use"),
-    num_trees: int = typer.Option(
-        100, help="Number of trees to build in the annoy index"
+    max_threshold: int = typer.Option(
+        3, help="Maximum hamming distance supported by the queries of the index"
+    ),
+    num_blocks: Optional[int] = typer.Option(
+        None,
+        help="Number of blocks the hashes are split into, by default max_threshold + 3",
     ),
 ):
     """
-    Merging all hashes and build an index. The time complexity and space complexity for this function is at least O(N).
-    Building the index is not paralleled in this implementation since the index needs access to all hashes.
+    Merging all hashes and build an exact simhash index. The time complexity for this function is O(T * N log N)
+    and the space complexity O(T * N), where T = C(num_blocks, max_threshold) is the number of tables of the index.
+    More blocks means more tables, but fewer candidates to check per query.
 
     Example:
 
     ```bash
-    python deduplicate.py build-index "cache/en_simhash_index.pkl" "cache/en_hashes_00001" --split "train"
+    python deduplicate.py build-index "cache/en_simhash_index" "cache/en_hashes_00001" --split "train"
     ```
 
-    This builds an index to be stored at `cache/en_simhash_index.pkl` from `cache/en_hashes_00001`
+    This builds an index to be stored in the directory `cache/en_simhash_index` from `cache/en_hashes_00001`
 
     Parameters
     ----------
     output_file : str
-        Output path for the index file
+        Output directory for the index files
     data_dirs : List[str]
         Dataset directories with hashes to build the index from
     split : Optional[str], optional
         Which split of the data to load
     num_proc : int, optional
         Number of processes to use
-    num_trees : int, optional
-        Number of trees to build for the annoy index (10 ~ 1024)
+    max_threshold : int, optional
+        Maximum hamming distance supported by the queries of the index, by default 3
+    num_blocks : Optional[int], optional
+        Number of blocks the hashes are split into, by default max_threshold + 3
     """
     num_proc = check_num_proc(num_proc)
 
-    t = AnnoyIndex(64, "hamming")
-
-    manager = Manager()
-    hashes: List[Tuple[int, np.ndarray]] = manager.list()
-
-    def process(id, hash, text=None, meta=None):
-        hashes.append((int(id), hash))
-        return
-
+    ids = []
+    hashes = []
     for dir in data_dirs:
         ds = load_from_disk(dir)
         splits = [split] if split is not None else list(ds.keys())
@@ -291,20 +461,158 @@ def build_index(
             logger.warning(
                 f"Using all splits to build the index, please make sure the `id` is unique globally"
             )
-        for split in splits:
-            with WorkerPool(n_jobs=num_proc) as pool:
-                pool.map(
-                    process,
-                    ds[split],
-                    progress_bar=True,
-                )
+        for s in tqdm(splits, desc=f"Reading the hashes of {dir}"):
+            ids_split, hashes_split = load_hashes(dir, s)
+            ids.append(ids_split)
+            hashes.append(hashes_split)
+
+    index = SimhashIndex.build(
+        np.concatenate(ids),
+        np.concatenate(hashes),
+        max_threshold=max_threshold,
+        num_blocks=num_blocks,
+        num_threads=num_proc,
+    )
+    index.save(output_file)
+
+
+# Arguments of the workers of `query_index`, inherited through fork instead of being pickled
+_query_arguments = None
+
+
+def _set_query_arguments(
+    index: Union[SimhashIndex, SegmentedSimhashIndex],
+    hashes: np.ndarray,
+    threshold: int,
+):
+    global _query_arguments
+    _query_arguments = (index, hashes, threshold)
+
+
+def _query_chunk(bounds: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    index, hashes, threshold = _query_arguments
+    start, end = bounds
+    queries, ids, distances = index.query(hashes[start:end], threshold)
+    return queries + start, ids, distances
+
+
+def query_index(
+    index: Union[SimhashIndex, SegmentedSimhashIndex],
+    hashes: np.ndarray,
+    threshold: int,
+    num_proc: int = 1,
+    chunk_size: int = 10_000,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Query the index with all the hashes as a map-reduce: each worker queries chunks of hashes and returns
+    arrays, which are concatenated by the parent process. The index and the hashes are inherited by the
+    forked workers, so only the bounds of the chunks and the results go through the pipes.
+
+    Parameters
+    ----------
+    index : Union[SimhashIndex, SegmentedSimhashIndex]
+        The index
+    hashes : np.ndarray
+        Query hashes (uint64)
+    threshold : int
+        Maximum hamming distance for duplicates
+    num_proc : int, optional
+        Number of processes to use, by default 1
+    chunk_size : int, optional
+        Number of hashes per chunk, by default 10_000
 
-    # Not paralleled
-    for id, hash in tqdm(hashes):
-        t.add_item(id, hash)
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        Positions of the queries in `hashes`, ids of the matching records and their distances,
+        sorted by query and then by distance
+    """
+    chunks = [
+        (start, min(start + chunk_size, len(hashes)))
+        for start in range(0, len(hashes), chunk_size)
+    ]
+    _set_query_arguments(index, hashes, threshold)
+    try:
+        if num_proc > 1 and len(chunks) > 1:
+            with get_context("fork").Pool(num_proc) as pool:
+                results = list(tqdm(pool.imap(_query_chunk, chunks), total=len(chunks)))
+        else:
+            results = [_query_chunk(chunk) for chunk in tqdm(chunks)]
+    finally:
+        _set_query_arguments(None, None, None)
+    if not results:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+    return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+
+def duplicates_array(
+    queries: np.ndarray, dup_ids: np.ndarray, start: int, stop: int
+) -> pa.ListArray:
+    """
+    Lists of the duplicates of the queries `start` to `stop`, from the results of `query_index`.
+
+    Parameters
+    ----------
+    queries : np.ndarray
+        Sorted indices of the queries
+    dup_ids : np.ndarray
+        Ids of the duplicates of each query
+    start : int
+        First query
+    stop : int
+        Query after the last one
+
+    Returns
+    -------
+    pa.ListArray
+        Ids of the duplicates of each query, or `[-1]` for the queries without duplicates
+    """
+    bounds = np.searchsorted(queries, np.arange(start, stop + 1))
+    counts = np.diff(bounds)
+    lengths = np.maximum(counts, 1)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    values = np.full(offsets[-1], -1, dtype=np.int64)
+    # Position of each duplicate in its list
+    ranks = np.arange(bounds[-1] - bounds[0]) - np.repeat(
+        bounds[:-1] - bounds[0], counts
+    )
+    values[np.repeat(offsets[:-1], counts) + ranks] = dup_ids[bounds[0] : bounds[-1]]
+    return pa.ListArray.from_arrays(offsets, values)
+
+
+def write_column(
+    ds: Dataset, name: str, batches: Iterator[pa.Array], cache_file: str
+) -> Dataset:
+    """
+    Add or replace a column of a dataset, written batch by batch in an Arrow file. The other columns
+    are kept by reference, so the dataset is never fully loaded in memory.
+
+    Parameters
+    ----------
+    ds : Dataset
+        Dataset to add the column to
+    name : str
+        Name of the column
+    batches : Iterator[pa.Array]
+        Consecutive batches of the column, of `len(ds)` values in total
+    cache_file : str
+        Path to the Arrow file to write the column in, which must exist until the dataset is saved
 
-    t.build(num_trees)
-    t.save(output_file)
+    Returns
+    -------
+    Dataset
+        Dataset with the column, memory-mapped
+    """
+    with ArrowWriter(path=cache_file) as writer:
+        for batch in batches:
+            writer.write_table(pa.table({name: batch}))
+        writer.finalize()
+    column = Dataset.from_file(cache_file)
+    if name in ds.column_names:
+        ds = ds.remove_columns(name)
+    return concatenate_datasets([ds, column], axis=1)
 
 
 @app.command()
@@ -313,20 +621,23 @@ def find_duplicates(
     index_file: str,
     split: Optional[str] = typer.Option(None, help="Which split of the data to load"),
     num_proc: int = typer.Option(-1, help="Number of processes to use"),
-    k: int = typer.Option(100, help="Number of nearest neighbors to search for"),
     threshold: int = typer.Option(3, help="Maximum hamming distance for duplicates"),
+    chunk_size: int = typer.Option(
+        100_000, help="Number of records whose duplicates are written at once"
+    ),
 ):
     """
     Find duplicates for given datasets. For each dataset directory `d`, it outputs a `d_duplicates` directory
-    with a new `duplicates` column, containing all the duplicate indices.
+    with a new `duplicates` column, containing all the duplicate indices. The search is exact: all the records
+    of the index within `threshold` bits are found, whatever the size of the cluster of duplicates.
 
     Example:
 
     ```bash
-    python deduplicate.py find-duplicates "cache/en_hashes_00001" "cache/en_simhash_index.pkl" --split "train" --k 100 --threshold 3
+    python deduplicate.py find-duplicates "cache/en_hashes_00001" "cache/en_simhash_index" --split "train" --threshold 3
     ```
 
-    This finds all duplicates in `cache/en_hashes_00001` with `cache/en_simhash_index.pkl`. It should outputs a directory named
+    This finds all duplicates in `cache/en_hashes_00001` with `cache/en_simhash_index`. It should outputs a directory named
     `cache/en_hashes_00001_duplicates`.
 
     Parameters
@@ -334,48 +645,160 @@ def find_duplicates(
     data_dirs : List[str]
         List of dataset directories to find duplicates
     index_file : str
-        Path to the index file
+        Path to the index directory, of `build-index` or `deduplicate-incremental`
     split : Optional[str], optional
         Which split of the data to load
     num_proc : int, optional
         Number of processes to use
-    k : int, optional
-        Number of nearest neighbors to search for, by default 100
     threshold : int, optional
         Maximum hamming distance for duplicates, by default 3
+    chunk_size : int, optional
+        Number of records whose duplicates are written at once, by default 100_000
     """
     num_proc = check_num_proc(num_proc)
 
-    index = AnnoyIndex(64, "hamming")
-    index.load(index_file)
-    logger.info(f"Querying with {index.get_n_items()} records")
-
-    def process(index, id, hash, text=None, meta=None):
-        candidates = index.get_nns_by_item(int(id), k, include_distances=True)
-        dups = {i for i, d in zip(*candidates) if d <= threshold}
-        record = {
-            "duplicates": list(dups) if dups else [-1],
-            "id": id,
-            "hash": hash,
-        }
-        if meta is not None:
-            record["meta"] = meta
-        if text is not None:
-            record["text"] = text
-        return record
+    index = load_index(index_file)
+    logger.info(f"Querying with {len(index)} records")
 
     for dir in data_dirs:
         ds = load_from_disk(dir)
         splits = [split] if split is not None else list(ds.keys())
-        for s in splits:
-            with WorkerPool(n_jobs=num_proc, shared_objects=index) as pool:
-                results = pool.map(process, ds[s], progress_bar=True)
-            ds[s] = Dataset.from_pandas(pd.DataFrame(results))
-            logger.info(
-                f"Found {len(ds[s].filter(lambda x: len(x['duplicates']) > 1))} duplicates in {dir}"
-            )
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for s in splits:
+                _, hashes = get_hashes(ds[s])
+                queries, dup_ids, _ = query_index(index, hashes, threshold, num_proc)
+                batches = (
+                    duplicates_array(
+                        queries, dup_ids, start, min(start + chunk_size, len(hashes))
+                    )
+                    for start in range(0, len(hashes), chunk_size)
+                )
+                ds[s] = write_column(
+                    ds[s], "duplicates", batches, os.path.join(cache_dir, f"{s}.arrow")
+                )
+                num_duplicates = (np.bincount(queries, minlength=len(hashes)) > 1).sum()
+                logger.info(f"Found {num_duplicates} duplicates in {dir}")
+
+            ds.save_to_disk(dir.rstrip("/") + "_duplicates")
 
-        ds.save_to_disk(dir.rstrip("/") + "_duplicates")
+
+class UnionFind:
+    """
+    Disjoint sets over the integers 0..n-1, stored in arrays, with path compression and union by rank.
+
+    Parameters
+    ----------
+    n : int
+        Number of elements
+    """
+
+    def __init__(self, n: int):
+        # array.array and bytearray are as compact as NumPy arrays, but faster to index one element at a time
+        self.parent = array.array("q", np.arange(n, dtype=np.int64).tobytes())
+        self.rank = bytearray(n)
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        # Path compression
+        while parent[x] != root:
+            next_x = parent[x]
+            parent[x] = root
+            x = next_x
+        return root
+
+    def union(self, x: int, y: int):
+        x = self.find(x)
+        y = self.find(y)
+        if x == y:
+            return
+        if self.rank[x] < self.rank[y]:
+            x, y = y, x
+        self.parent[y] = x
+        if self.rank[x] == self.rank[y]:
+            self.rank[x] += 1
+
+    def union_edges(self, sources: np.ndarray, targets: np.ndarray):
+        for x, y in zip(sources.tolist(), targets.tolist()):
+            self.union(x, y)
+
+    def representatives(self, candidates: np.ndarray) -> np.ndarray:
+        """
+        Smallest of the candidates in the set of each element, or n for the sets without candidate.
+
+        Parameters
+        ----------
+        candidates : np.ndarray
+            Elements which can represent their set
+
+        Returns
+        -------
+        np.ndarray
+            Representative of the set of each element
+        """
+        roots = self.roots()
+        representative_of_root = np.full(len(roots), len(roots), dtype=np.int64)
+        np.minimum.at(representative_of_root, roots[candidates], candidates)
+        return representative_of_root[roots]
+
+    def roots(self) -> np.ndarray:
+        """Root of every element, computed for all of them at once by pointer jumping."""
+        parent = np.frombuffer(self.parent, dtype=np.int64)
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                return parent
+            parent = grandparent
+
+
+def iter_duplicate_edges(
+    ds: Dataset, chunk_size: int
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Edges between the records and their duplicates, read from the `id` and `duplicates` columns by chunks.
+
+    Parameters
+    ----------
+    ds : Dataset
+        Dataset with `id` and `duplicates` columns
+    chunk_size : int
+        Number of records per chunk
+
+    Yields
+    ------
+    Tuple[np.ndarray, np.ndarray]
+        Ids of the records and ids of their duplicates, without the self-loops and the `-1` placeholders
+    """
+    columns = ds.select_columns(["id", "duplicates"]).with_format("arrow")
+    for table in columns.iter(batch_size=chunk_size):
+        duplicates = table["duplicates"].combine_chunks()
+        sources = np.asarray(table["id"].to_numpy(), dtype=np.int64)[
+            pc.list_parent_indices(duplicates).to_numpy()
+        ]
+        targets = np.asarray(pc.list_flatten(duplicates).to_numpy(), dtype=np.int64)
+        edges = (targets != sources) & (targets != -1)
+        yield sources[edges], targets[edges]
+
+
+def deduplicated_dir(dir: str) -> str:
+    """
+    Output directory of `remove-duplicates` for a data directory, which is never the data directory itself.
+
+    Examples
+    --------
+    >>> deduplicated_dir("cache/en_hashes_00001_duplicates/")
+    'cache/en_hashes_00001_deduplicated'
+    >>> deduplicated_dir("cache/en_hashes_00001")
+    'cache/en_hashes_00001_deduplicated'
+    """
+    head, name = os.path.split(dir.rstrip("/"))
+    if "_duplicates" in name:
+        name = name.replace("_duplicates", "_deduplicated")
+    else:
+        name += "_deduplicated"
+    return os.path.join(head, name)
 
 
 @app.command()
@@ -383,11 +806,21 @@ def remove_duplicates(
     data_dirs: List[str],
     split: Optional[str] = typer.Option(None, help="Which split of the data to load"),
     num_proc: int = typer.Option(-1, help="Number of processes to use"),
+    chunk_size: int = typer.Option(
+        100_000, help="Number of records whose duplicates are read at once"
+    ),
+    clusters_file: Optional[str] = typer.Option(
+        None,
+        help="Path to a `.npy` file to save the representative of the cluster of each id in",
+    ),
 ):
     """
     Remove duplicates based on the `duplicates` column by finding the connected components and only keep the first occurrence.
     For each data directory `d`, it outputs a `d_deduplicated` directory.
 
+    The connected components are found with a union-find over arrays, reading the edges by chunks, in O(E α(N)) time
+    and O(N) memory for N records and E edges. In each cluster, the record with the smallest id is kept.
+
     Example:
 
     ```bash
@@ -404,41 +837,314 @@ def remove_duplicates(
         Which split of the data to load
     num_proc : int, optional
         Number of processes to use
+    chunk_size : int, optional
+        Number of records whose duplicates are read at once
+    clusters_file : Optional[str], optional
+        Path to a `.npy` file to save the representative of the cluster of each id in, as an array of
+        (`id`, `representative`) sorted by id
     """
     num_proc = check_num_proc(num_proc)
 
-    # a and b are connected if they are duplicates
-    G = nx.Graph()
-    manager = Manager()
-    edges = manager.list()
-
-    def process(record):
-        for dup in record["duplicates"]:
-            if int(record["id"]) == dup or dup == -1:
-                continue
-            edges.append((int(record["id"]), dup))
-
+    datasets = []
     for dir in data_dirs:
         ds = load_from_disk(dir)
         splits = [split] if split is not None else list(ds.keys())
+        datasets.append((dir, ds, splits))
+    splits_ds = [ds[s] for _, ds, splits in datasets for s in splits]
+
+    # The nodes are the records and their duplicates, which can be in other datasets
+    ids = np.concatenate(
+        [np.asarray(ds.with_format("numpy")["id"], dtype=np.int64) for ds in splits_ds]
+    )
+    nodes = [ids]
+    for ds in splits_ds:
+        for _, targets in iter_duplicate_edges(ds, chunk_size):
+            nodes.append(np.unique(targets))
+    nodes = np.unique(np.concatenate(nodes))
+
+    # a and b are connected if they are duplicates
+    union_find = UnionFind(len(nodes))
+    for ds in splits_ds:
+        for sources, targets in tqdm(
+            iter_duplicate_edges(ds, chunk_size),
+            total=(len(ds) + chunk_size - 1) // chunk_size,
+        ):
+            union_find.union_edges(
+                np.searchsorted(nodes, sources), np.searchsorted(nodes, targets)
+            )
+
+    # Keep the record with the smallest id of each cluster among the records of the datasets
+    positions = np.searchsorted(nodes, ids)
+    present = np.unique(positions)
+    representatives = union_find.representatives(present)
+
+    if clusters_file is not None:
+        clusters = np.empty(
+            len(present), dtype=[("id", np.int64), ("representative", np.int64)]
+        )
+        clusters["id"] = nodes[present]
+        clusters["representative"] = nodes[representatives[present]]
+        np.save(clusters_file, clusters)
+
+    # Whether each row is kept, in the order of the rows of the datasets, so the filter only indexes it
+    kept = representatives[positions] == positions
+    offset = 0
+    for dir, ds, splits in datasets:
         for s in splits:
-            ds[s].map(process, num_proc=num_proc)
+            kept_split = kept[offset : offset + len(ds[s])]
+            offset += len(ds[s])
+            ds[s] = ds[s].filter(
+                lambda _, indices, kept_split=kept_split: kept_split[indices].tolist(),
+                input_columns="id",
+                with_indices=True,
+                batched=True,
+                num_proc=num_proc,
+            )
+        ds.save_to_disk(deduplicated_dir(dir))
+
+
+@app.command()
+def deduplicate_incremental(
+    data_dirs: List[str],
+    index_dir: str,
+    split: Optional[str] = typer.Option(None, help="Which split of the data to load"),
+    num_proc: int = typer.Option(-1, help="Number of processes to use"),
+    threshold: int = typer.Option(3, help="Maximum hamming distance for duplicates"),
+    max_threshold: int = typer.Option(
+        3, help="Maximum hamming distance supported by a new index"
+    ),
+    num_blocks: Optional[int] = typer.Option(
+        None, help="Number of blocks of a new index, by default max_threshold + 3"
+    ),
+    max_segments: Optional[int] = typer.Option(
+        None,
+        help="Merge the segments of the index when there are more, instead of leaving it to `merge-index-segments`",
+    ),
+):
+    """
+    Deduplicate new hashed datasets against a persistent index of the records already kept, and add
+    the records kept to the index. A record is removed if it is within `threshold` bits of a record
+    of the index, or of a record with a smaller id in the new datasets. The index is created in `index_dir`
+    if it does not exist, and the records kept are added as a new segment, so the cost of a run is
+    proportional to the size of the new datasets and to the number of segments. For each data directory `d`,
+    it outputs a `d_deduplicated` directory. The ids must be unique across all the datasets.
 
-    flags = defaultdict(lambda: False)
-    for x, y in tqdm(edges):
-        G.add_edge(x, y)
+    Example:
+
+    ```bash
+    python deduplicate.py deduplicate-incremental "cache/en_hashes_00042" "cache/en_simhash_index_incremental" --split "train"
+    python deduplicate.py merge-index-segments "cache/en_simhash_index_incremental" --max-segments 4
+    ```
 
-    for c in nx.connected_components(G):
-        for n in c:
-            flags[n] = False
-        flags[c.pop()] = True
+    Parameters
+    ----------
+    data_dirs : List[str]
+        Dataset directories with hashes to deduplicate
+    index_dir : str
+        Directory of the index of the records already kept
+    split : Optional[str], optional
+        Which split of the data to load
+    num_proc : int, optional
+        Number of processes to use
+    threshold : int, optional
+        Maximum hamming distance for duplicates, by default 3
+    max_threshold : int, optional
+        Maximum hamming distance supported by the index if it is created, by default 3
+    num_blocks : Optional[int], optional
+        Number of blocks of the index if it is created, by default max_threshold + 3
+    max_segments : Optional[int], optional
+        Merge the segments of the index when there are more, by default None (no merge)
+    """
+    num_proc = check_num_proc(num_proc)
+    index = SegmentedSimhashIndex.open(index_dir, max_threshold, num_blocks)
+    logger.info(f"Querying with {len(index)} records in {len(index.segments)} segments")
 
+    datasets = []
     for dir in data_dirs:
         ds = load_from_disk(dir)
         splits = [split] if split is not None else list(ds.keys())
+        datasets.append((dir, ds, splits))
+    ids, hashes = zip(
+        *(get_hashes(ds[s]) for _, ds, splits in datasets for s in splits)
+    )
+    ids = np.concatenate(ids)
+    hashes = np.concatenate(hashes)
+    order = np.argsort(ids, kind="stable")
+    ids = ids[order]
+    hashes = hashes[order]
+
+    # Duplicates of records already kept
+    queries, _, _ = query_index(index, hashes, threshold, num_proc)
+    known = np.zeros(len(ids), dtype=bool)
+    known[queries] = True
+
+    # Duplicates within the new records, the smallest id of each cluster being kept
+    new_index = SimhashIndex.build(
+        ids, hashes, max_threshold=threshold, num_threads=num_proc
+    )
+    queries, dup_ids, _ = query_index(new_index, hashes, threshold, num_proc)
+    union_find = UnionFind(len(ids))
+    union_find.union_edges(queries, np.searchsorted(ids, dup_ids))
+    positions = np.arange(len(ids))
+    keep = (union_find.representatives(positions) == positions) & ~known
+    logger.info(
+        f"Keeping {keep.sum()}/{len(ids)} records, {known.sum()} being duplicates of indexed records"
+    )
+
+    def keep_batch(batch_ids):
+        return keep[
+            np.searchsorted(ids, np.asarray(batch_ids, dtype=np.int64))
+        ].tolist()
+
+    for dir, ds, splits in datasets:
         for s in splits:
-            ds[s] = ds[s].filter(lambda x: flags.get(int(x["id"]), True))
-        ds.save_to_disk(dir.rstrip("/").replace("_duplicates", "_deduplicated"))
+            ds[s] = ds[s].filter(keep_batch, input_columns="id", batched=True)
+        ds.save_to_disk(dir.rstrip("/") + "_deduplicated")
+
+    index.add(ids[keep], hashes[keep], num_threads=num_proc)
+    if max_segments is not None:
+        index.merge(max_segments, num_threads=num_proc)
+
+
+@app.command()
+def merge_index_segments(
+    index_dir: str,
+    max_segments: int = typer.Option(
+        1, help="Maximum number of segments left after merging"
+    ),
+    num_proc: int = typer.Option(-1, help="Number of processes to use"),
+):
+    """
+    Merge the smallest segments of an index of `deduplicate-incremental`, which can run in the background
+    while new datasets are deduplicated: the segments added meanwhile are kept as they are.
+
+    Parameters
+    ----------
+    index_dir : str
+        Directory of the index
+    max_segments : int, optional
+        Maximum number of segments left after merging, by default 1
+    num_proc : int, optional
+        Number of processes to use
+    """
+    num_proc = check_num_proc(num_proc)
+    index = SegmentedSimhashIndex.open(index_dir)
+    num_segments = len(index.segments)
+    index.merge(max_segments, num_threads=num_proc)
+    logger.info(f"Merged {num_segments} segments into {len(index.segments)}")
+
+
+DEFAULT_METADATA = {
+    "headers": {
+        "warc-record-id": "",
+        "warc-date": datetime.datetime(1970, 1, 1),
+        "content-type": "",
+        "content-length": -1,
+        "warc-type": "",
+        "warc-identified-content-language": "",
+        "warc-refers-to": "",
+        "warc-target-uri": "",
+        "warc-block-digest": "",
+    },
+    "offset": -1,
+    "nb_sentences": -1,
+}
+
+
+class MetadataStore:
+    """
+    Metadata of records addressed by id, stored as an Arrow column which is looked up by batches.
+
+    Parameters
+    ----------
+    ids : np.ndarray
+        Ids of the records
+    metadata : pa.ChunkedArray
+        Metadata of the records, in the order of `ids`
+    default : dict, optional
+        Metadata of the records which are not found, by default DEFAULT_METADATA
+    """
+
+    def __init__(
+        self, ids: np.ndarray, metadata: pa.ChunkedArray, default: dict = None
+    ):
+        order = np.argsort(ids, kind="stable")
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.order = order
+        # The default metadata is appended after the records, so that it is taken like them
+        default = pa.array(
+            [DEFAULT_METADATA if default is None else default], type=metadata.type
+        )
+        self.metadata = pa.chunked_array(metadata.chunks + [default])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_datasets(
+        cls, data_dirs: List[str], split: Optional[str] = None, column: str = "meta"
+    ) -> "MetadataStore":
+        """
+        Load the ids and the metadata of datasets, without copying the metadata out of the memory-mapped tables.
+
+        Parameters
+        ----------
+        data_dirs : List[str]
+            Dataset directories with `id` and `column` columns
+        split : Optional[str], optional
+            Which split of the data to load, by default all of them
+        column : str, optional
+            Column of the metadata, by default "meta"
+
+        Returns
+        -------
+        MetadataStore
+            The metadata of all the records
+        """
+        ids = []
+        chunks = []
+        for dir in data_dirs:
+            ds = load_from_disk(dir)
+            splits = [split] if split is not None else list(ds.keys())
+            for s in splits:
+                table = ds[s].select_columns(["id", column]).with_format("arrow")[:]
+                ids.append(np.asarray(table["id"].to_numpy(), dtype=np.int64))
+                chunks.extend(table[column].chunks)
+        return cls(np.concatenate(ids), pa.chunked_array(chunks))
+
+    def find(self, ids: np.ndarray) -> np.ndarray:
+        """Rows of the metadata of the ids, or `len(self)` (the default metadata) for the ids not found."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self):
+            return np.full(ids.shape, len(self), dtype=np.int64)
+        positions = np.searchsorted(self.ids, ids).clip(max=len(self) - 1)
+        return np.where(self.ids[positions] == ids, self.order[positions], len(self))
+
+    def take(self, ids: np.ndarray) -> pa.Array:
+        """Metadata of the ids, the default metadata for the ids not found."""
+        return self.metadata.take(self.find(ids)).combine_chunks()
+
+    def take_first(self, candidates: np.ndarray) -> pa.Array:
+        """
+        Metadata of the first candidate found on each row.
+
+        Parameters
+        ----------
+        candidates : np.ndarray
+            Ids of the candidates of each record, of shape (num_records, num_candidates)
+
+        Returns
+        -------
+        pa.Array
+            Metadata of each record, the default metadata when no candidate is found
+        """
+        rows = self.find(candidates)
+        if not rows.shape[1]:
+            return self.metadata.take(np.full(len(rows), len(self))).combine_chunks()
+        # The first candidate found, or the first candidate, with the default metadata, if none is found
+        first = np.argmax(rows < len(self), axis=1)
+        rows = rows[np.arange(len(rows)), first]
+        return self.metadata.take(rows).combine_chunks()
 
 
 @app.command()
@@ -450,12 +1156,19 @@ def merge_meta(
     ),
     split: Optional[str] = typer.Option(None, help="Which split of the data to load"),
     num_proc: int = typer.Option(-1, help="Number of processes to use"),
-    k: int = typer.Option(1, help="Number of nearest neighbors to search for"),
+    k: int = typer.Option(
+        1,
+        help="Number of nearest neighbors within the threshold to look for metadata in",
+    ),
     threshold: int = typer.Option(1, help="Maximum hamming distance for duplicates"),
+    chunk_size: int = typer.Option(
+        10_000, help="Number of records whose metadata are written at once"
+    ),
 ):
     """
     Extracting metadata feature from `meta_data_dirs` and merging into data in `data_dirs`
-    For each data directory `d`, it outputs a `d_with_meta` directory.
+    For each data directory `d`, it outputs a `d_with_meta` directory (`_duplicates` is replaced by `_with_meta`
+    in the name of `d`), with the columns of `d` and a `meta` column.
 
     see examples/merge.sh for an example
 
@@ -470,69 +1183,64 @@ def merge_meta(
     num_proc : int, optional
         Number of processes to use
     k : int, optional
-        Number of nearest neighbors to search for, by default 1
+        Number of nearest neighbors within the threshold to look for metadata in, by default 1
     threshold : int, optional
         Maximum hamming distance for duplicates, by default 1
+    chunk_size : int, optional
+        Number of records whose metadata are written at once, by default 10_000
     """
     num_proc = check_num_proc(num_proc)
-    manager = Manager()
-    meta_data = manager.dict()
 
-    index = AnnoyIndex(64, "hamming")
-    index.load(index_file)
-    logger.info(f"Querying with {index.get_n_items()} records")
+    index = load_index(index_file)
+    logger.info(f"Querying with {len(index)} records")
+
+    meta_store = MetadataStore.from_datasets(meta_data_dirs, split)
+    logger.info(f"Loaded the metadata of {len(meta_store)} records")
 
-    def process_meta(record):
-        meta_data[int(record["id"])] = record["meta"]
+    def merge_batches(nearest_ids):
+        for start in range(0, len(nearest_ids), chunk_size):
+            yield meta_store.take_first(nearest_ids[start : start + chunk_size])
 
-    for dir in meta_data_dirs:
+    for dir in data_dirs:
         ds = load_from_disk(dir)
         splits = [split] if split is not None else list(ds.keys())
-        for s in splits:
-            ds[s].map(process_meta, num_proc=num_proc)
-
-    def merge(index, hash, id=None, text=None, meta=None):
-
-        metadata = {
-            "headers": {
-                "warc-record-id": "",
-                "warc-date": datetime.datetime(1970, 1, 1),
-                "content-type": "",
-                "content-length": -1,
-                "warc-type": "",
-                "warc-identified-content-language": "",
-                "warc-refers-to": "",
-                "warc-target-uri": "",
-                "warc-block-digest": "",
-            },
-            "offset": -1,
-            "nb_sentences": -1,
-        }
-
-        candidates = index.get_nns_by_vector(hash, k, include_distances=True)
-        dups = {i for i, d in zip(*candidates) if d <= threshold}
-
-        if not dups:
-            return {"meta": metadata}
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for s in splits:
+                _, hashes = get_hashes(ds[s])
+                # The k nearest records within the threshold, by increasing distance
+                nearest_ids, _ = nearest_k(
+                    *query_index(index, hashes, threshold, num_proc), len(hashes), k
+                )
+                ds[s] = write_column(
+                    ds[s],
+                    "meta",
+                    merge_batches(nearest_ids),
+                    os.path.join(cache_dir, f"{s}.arrow"),
+                )
+                offsets = pc.struct_field(ds[s].data.column("meta"), "offset")
+                num_matched = pc.sum(pc.not_equal(offsets, -1)).as_py() or 0
+                logger.info(f"Matched {num_matched}/{len(ds[s])} records in {dir}")
+            ds.save_to_disk(with_meta_dir(dir))
 
-        for dup in dups:
-            if dup in meta_data:
-                metadata = meta_data[dup]
-                break
 
-        return {"meta": metadata}
+def with_meta_dir(dir: str) -> str:
+    """
+    Output directory of `merge-meta` for a data directory, which is never the data directory itself,
+    since the columns of the output are kept memory-mapped from it.
 
-    for dir in data_dirs:
-        ds = load_from_disk(dir)
-        splits = [split] if split is not None else list(ds.keys())
-        for s in splits:
-            with WorkerPool(n_jobs=num_proc, shared_objects=index) as pool:
-                results = pool.map(merge, ds[s], progress_bar=True)
-            ds[s] = Dataset.from_pandas(pd.DataFrame(results))
-            logger.info(
-                f"Matched {len(ds[s].filter(lambda x: x['meta']['offset'] != -1))}/{len(ds[s])} records in {dir}"
-            )
-        ds.save_to_disk(dir.rstrip("/").replace("_duplicates", "_with_meta"))
+    Examples
+    --------
+    >>> with_meta_dir("cache/hashes_00000_duplicates/")
+    'cache/hashes_00000_with_meta'
+    >>> with_meta_dir("cache/hashes_00000")
+    'cache/hashes_00000_with_meta'
+    """
+    head, name = os.path.split(dir.rstrip("/"))
+    if "_duplicates" in name:
+        name = name.replace("_duplicates", "_with_meta")
+    else:
+        name += "_with_meta"
+    return os.path.join(head, name)
 
 
 @app.command()
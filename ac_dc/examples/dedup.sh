@@ -18,12 +18,12 @@ for lang in "${LANGUAGES[@]}"; do
     done
 
     echo "Creating index"
-    $PYTHON $SCRIPT build-index "cache/sharded_deduplicated_${lang}/simhash_index.ann" $(seq -s " " -f "cache/sharded_deduplicated_${lang}/hashes_%05g" 0 "$((SHARDS - 1))") --split "train"
+    $PYTHON $SCRIPT build-index "cache/sharded_deduplicated_${lang}/simhash_index" $(seq -s " " -f "cache/sharded_deduplicated_${lang}/hashes_%05g" 0 "$((SHARDS - 1))") --split "train"
 
     echo "Finding duplicates"
     for i in $(seq -f "%05g" 0 "$((SHARDS - 1))"); do
         echo "Querying shard ${i}"
-        $PYTHON -W ignore $SCRIPT find-duplicates "cache/sharded_deduplicated_${lang}/hashes_${i}" "cache/sharded_deduplicated_${lang}/simhash_index.ann" --split "train" --k 100 --threshold $THRESHOLD
+        $PYTHON -W ignore $SCRIPT find-duplicates "cache/sharded_deduplicated_${lang}/hashes_${i}" "cache/sharded_deduplicated_${lang}/simhash_index" --split "train" --threshold $THRESHOLD
     done
 
     echo "Removing duplicates"
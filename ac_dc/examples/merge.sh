@@ -20,12 +20,12 @@ for lang in "${LANGUAGES[@]}"; do
     done
 
     # Create the index file
-    # $PYTHON $SCRIPT build-index "cache/sharded_deduplicated_${lang}_v1/simhash_index.ann" $(seq -s " " -f "cache/sharded_deduplicated_${lang}_v1/hashes_%05g" 0 "$((SHARDS - 1))") --split "train"
-    $PYTHON $SCRIPT build-index "cache/sharded_deduplicated_${lang}_v2/simhash_index.ann" $(seq -s " " -f "cache/sharded_deduplicated_${lang}_v2/hashes_%05g" 0 "$((SHARDS - 1))") --split "train"
+    # $PYTHON $SCRIPT build-index "cache/sharded_deduplicated_${lang}_v1/simhash_index" $(seq -s " " -f "cache/sharded_deduplicated_${lang}_v1/hashes_%05g" 0 "$((SHARDS - 1))") --split "train"
+    $PYTHON $SCRIPT build-index "cache/sharded_deduplicated_${lang}_v2/simhash_index" $(seq -s " " -f "cache/sharded_deduplicated_${lang}_v2/hashes_%05g" 0 "$((SHARDS - 1))") --split "train"
 
-    # merge v2 metadata into v1
+    # merge v2 metadata into v1, outputs cache/sharded_deduplicated_${lang}_v1/hashes_XXXXX_with_meta
     $PYTHON $SCRIPT merge-meta \
-        "cache/sharded_deduplicated_${lang}_v2/simhash_index.ann" \
+        "cache/sharded_deduplicated_${lang}_v2/simhash_index" \
         $(seq -s " " -f "--data-dirs cache/sharded_deduplicated_${lang}_v1/hashes_%05g" 0 "$((SHARDS - 1))") \
         $(seq -s " " -f "--meta-data-dirs cache/sharded_deduplicated_${lang}_v2/hashes_%05g" 0 "$((SHARDS - 1))") \
         --k 1 \
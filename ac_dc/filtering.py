@@ -1,5 +1,12 @@
 import re
 
+import gzip
+import json
+import os
+import uuid
+
+import multiprocessing
+
 import numpy as np
 
 import fasttext
@@ -9,7 +16,9 @@ import kenlm
 
 import pathlib
 
-from languages_id import langs_id
+import time
+
+from languages_id import langs_id, fasttext_label_to_dataset_id
 from parameters_filtering import parameters_filtering
 from normalization import normalization
 from stopwords import stopwords
@@ -17,6 +26,18 @@ from flagged_words import flagged_words
 
 
 class LoadParameters:
+    # Models and lists of words already loaded, by kind and by path or
+    # language. The datasets library forks its workers when num_proc > 1,
+    # so they inherit this registry from the main process and reuse the
+    # models loaded there instead of loading them again.
+    registry = {}
+
+    @staticmethod
+    def load_from_registry(key, load_function):
+        if key not in LoadParameters.registry:
+            LoadParameters.registry[key] = load_function()
+        return LoadParameters.registry[key]
+
     @staticmethod
     def load_parameters(lang_dataset_id):
         if lang_dataset_id in parameters_filtering:
@@ -31,7 +52,10 @@ class LoadParameters:
             langs_id["dataset_id"] == lang_dataset_id, "stopwords_id"
         ].iloc[0]
         if stopwords_lang_id:
-            stopwords_lang = set(stopwords[stopwords_lang_id])
+            stopwords_lang = LoadParameters.load_from_registry(
+                ("stopwords", stopwords_lang_id),
+                lambda: set(stopwords[stopwords_lang_id]),
+            )
         else:
             stopwords_lang = None
         return stopwords_lang
@@ -42,7 +66,10 @@ class LoadParameters:
             langs_id["dataset_id"] == lang_dataset_id, "flagged_words_id"
         ].iloc[0]
         if flagged_words_lang_id:
-            flagged_words_lang = set(flagged_words[flagged_words_lang_id])
+            flagged_words_lang = LoadParameters.load_from_registry(
+                ("flagged_words", flagged_words_lang_id),
+                lambda: set(flagged_words[flagged_words_lang_id]),
+            )
         else:
             flagged_words_lang = None
         return flagged_words_lang
@@ -53,7 +80,10 @@ class LoadParameters:
             langs_id["dataset_id"] == lang_dataset_id, "fasttext_id"
         ].iloc[0]
         if fasttext_lang_id:
-            model_lang_id = fasttext.load_model(path_fasttext_model)
+            model_lang_id = LoadParameters.load_from_registry(
+                ("fasttext", path_fasttext_model),
+                lambda: fasttext.load_model(path_fasttext_model),
+            )
         else:
             model_lang_id = None
         return model_lang_id
@@ -64,19 +94,39 @@ class LoadParameters:
             langs_id["dataset_id"] == lang_dataset_id, "sentencepiece_id"
         ].iloc[0]
         if sentencepiece_lang_id:
-            sentencepiece_model = sentencepiece.SentencePieceProcessor()
-            sentencepiece_model.load(path_sentencepiece_model)
+
+            def load_function():
+                sentencepiece_model = sentencepiece.SentencePieceProcessor()
+                sentencepiece_model.load(path_sentencepiece_model)
+                return sentencepiece_model
+
+            sentencepiece_model = LoadParameters.load_from_registry(
+                ("sentencepiece", path_sentencepiece_model), load_function
+            )
         else:
             sentencepiece_model = None
         return sentencepiece_model
 
     @staticmethod
-    def load_kenlm_model(lang_dataset_id, path_kenlm_model):
+    def load_kenlm_model(
+        lang_dataset_id, path_kenlm_model, load_method=kenlm.LoadMethod.LAZY
+    ):
+        """With a binary KenLM model, the default load method maps the file
+        in memory lazily, so that the processes using the same model share
+        the pages of the file instead of each having its own copy."""
         kenlm_lang_id = langs_id.loc[
             langs_id["dataset_id"] == lang_dataset_id, "kenlm_id"
         ].iloc[0]
         if kenlm_lang_id:
-            kenlm_model = kenlm.Model(path_kenlm_model)
+
+            def load_function():
+                config = kenlm.Config()
+                config.load_method = load_method
+                return kenlm.Model(path_kenlm_model, config)
+
+            kenlm_model = LoadParameters.load_from_registry(
+                ("kenlm", path_kenlm_model, load_method), load_function
+            )
         else:
             kenlm_model = None
         return kenlm_model
@@ -200,13 +250,9 @@ class ModifyingDocuments:
         return document_stripped
 
     @staticmethod
-    def get_words_from_document(
-        document, sentencepiece_model_tok, lower_case, strip_characters
-    ):
-        """Get words from a document. Non reversible since the document
-        is split on multiple characters, words are stripped of
-        special characters and characters are converted to lower case.
-        Useful to compute ratios, like the stopwords ratio."""
+    def get_tokens_from_document(document, sentencepiece_model_tok):
+        """Split a document into raw tokens, before lowering and stripping.
+        This is the expensive part of get_words_from_document."""
         if sentencepiece_model_tok:
             document_normalized = ModifyingDocuments.normalization(
                 document=document,
@@ -217,13 +263,18 @@ class ModifyingDocuments:
                 replace_digits_with_zeros=True,
                 replace_unicode_punctuation=True,
             )
-            words = ModifyingDocuments.tokenization(
+            tokens = ModifyingDocuments.tokenization(
                 document_normalized, sentencepiece_model_tok, join_on_whitespace=False
             )
         else:
-            words = ModifyingDocuments.split_on_whitespace(
+            tokens = ModifyingDocuments.split_on_whitespace(
                 document, new_line=True, tab=True
             )
+        return tokens
+
+    @staticmethod
+    def get_words_from_tokens(tokens, lower_case, strip_characters):
+        words = tokens
         if lower_case:
             words = [word.lower() for word in words]
         if strip_characters:
@@ -231,6 +282,22 @@ class ModifyingDocuments:
             words = ModifyingDocuments.remove_empty_el_from_list(words)
         return words
 
+    @staticmethod
+    def get_words_from_document(
+        document, sentencepiece_model_tok, lower_case, strip_characters
+    ):
+        """Get words from a document. Non reversible since the document
+        is split on multiple characters, words are stripped of
+        special characters and characters are converted to lower case.
+        Useful to compute ratios, like the stopwords ratio."""
+        tokens = ModifyingDocuments.get_tokens_from_document(
+            document, sentencepiece_model_tok
+        )
+        words = ModifyingDocuments.get_words_from_tokens(
+            tokens, lower_case, strip_characters
+        )
+        return words
+
     @staticmethod
     def words_augmentation(words, group_size, join_char):
         """Augment words, especially for Chinese (without a space between words)
@@ -241,6 +308,16 @@ class ModifyingDocuments:
         ]
         return augmentation
 
+    @staticmethod
+    def get_augmentation(words, group_sizes, join_char):
+        """Concatenation of the augmentations for all the group sizes."""
+        augmentation = [
+            ModifyingDocuments.words_augmentation(words, group_size, join_char)
+            for group_size in group_sizes
+        ]
+        augmentation = [word for augm in augmentation for word in augm]
+        return augmentation
+
     @staticmethod
     def split_on_newline_tab_whitespace(document):
         """First split on "\n", then on "\t", then on " "."""
@@ -377,13 +454,23 @@ class ModifyingDocuments:
 
 
 class FunctionDatasetModifyingDocuments:
-    def __init__(self, lang_dataset_id):
+    def __init__(self, lang_dataset_id, batched=False):
         self.lang_dataset_id = lang_dataset_id
+        self.batched = batched
         self.param = LoadParameters.load_parameters(lang_dataset_id)
 
     def __call__(self, example):
-        example["text"] = ModifyingDocuments.modifying_documents(
-            document=example["text"],
+        if self.batched:
+            example["text"] = [
+                self.modifying_document(document) for document in example["text"]
+            ]
+        else:
+            example["text"] = self.modifying_document(example["text"])
+        return example
+
+    def modifying_document(self, document):
+        document = ModifyingDocuments.modifying_documents(
+            document=document,
             cond_uniform_whitespace=self.param["cond_uniform_whitespace"],
             cond_replace_unicode_punctuation=self.param[
                 "cond_replace_unicode_punctuation"
@@ -396,13 +483,141 @@ class FunctionDatasetModifyingDocuments:
             cond_remove_long_words=self.param["cond_remove_long_words"],
             length_word_max_cutoff=self.param["length_word_max_cutoff"],
         )
-        return example
+        return document
 
     def __reduce__(self):
-        return (self.__class__, (self.lang_dataset_id,))
+        return (self.__class__, (self.lang_dataset_id, self.batched))
+
+
+class DocumentAnalysis:
+    """Tokenize a document once and cache the lists of words
+    (and their augmentations) shared by the different filters.
+    Without it, each filter based on words normalizes
+    and tokenizes the document again."""
+
+    def __init__(self, document, sentencepiece_model_tok, strip_characters):
+        self.document = document
+        self.sentencepiece_model_tok = sentencepiece_model_tok
+        self.strip_characters = strip_characters
+        self._tokens = None
+        self._words = {}
+        self._augmentation = {}
+
+    def get_tokens(self):
+        if self._tokens is None:
+            self._tokens = ModifyingDocuments.get_tokens_from_document(
+                self.document, self.sentencepiece_model_tok
+            )
+        return self._tokens
+
+    def get_words(self, lower_case):
+        if lower_case not in self._words:
+            self._words[lower_case] = ModifyingDocuments.get_words_from_tokens(
+                self.get_tokens(), lower_case, self.strip_characters
+            )
+        return self._words[lower_case]
+
+    def get_augmentation(self, group_sizes, join_char):
+        """Augmentation of the lower cased words."""
+        key = (tuple(group_sizes), join_char)
+        if key not in self._augmentation:
+            self._augmentation[key] = ModifyingDocuments.get_augmentation(
+                self.get_words(lower_case=True), group_sizes, join_char
+            )
+        return self._augmentation[key]
 
 
 class Filtering:
+    # Names of the scores computed by compute_scores
+    scores_names = [
+        "number_words",
+        "character_repetition_ratio",
+        "word_repetition_ratio",
+        "special_characters_ratio",
+        "stopwords_ratio",
+        "flagged_words_ratio",
+        "lang_id_pred",
+        "lang_id_score",
+        "perplexity_score",
+    ]
+
+    # Names of the checks of filtering, in the default order
+    checks_names = [
+        "number_words",
+        "character_repetition_removal",
+        "word_repetition_removal",
+        "special_characters",
+        "stopwords",
+        "flagged_words",
+        "lang_id",
+        "perplexity",
+    ]
+
+    # Checks using the words of DocumentAnalysis, which tokenizes the
+    # document the first time one of them is done
+    words_checks_names = [
+        "number_words",
+        "word_repetition_removal",
+        "stopwords",
+        "flagged_words",
+    ]
+
+    # Under this length of document, the Python implementations
+    # of the character ratios are faster than the vectorized ones
+    min_length_vectorization = 500
+
+    # Boolean lookup tables over all the code points, by set of special characters
+    special_characters_tables = {}
+
+    @staticmethod
+    def get_codepoints(document):
+        return np.frombuffer(
+            document.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+        )
+
+    @staticmethod
+    def pack_characters(ranks, start, size, num_characters, num_bits):
+        """Pack num_characters consecutive ranks of characters, beginning at
+        start, ..., start + size - 1, in uint64 of num_bits bits per character."""
+        packed = np.zeros(size, dtype=np.uint64)
+        for i in range(num_characters):
+            packed <<= np.uint64(num_bits)
+            packed |= ranks[start + i : start + i + size]
+        return packed
+
+    @staticmethod
+    def get_freq_character_ngrams_vectorized(document, n):
+        """Frequencies of the distinct character n-grams, in no particular order.
+        The characters are replaced by their ranks among the characters
+        of the document, and as many as possible are packed in a uint64.
+        If the n-grams do not fit in 64 bits, the packed prefixes are replaced
+        by their ranks and extended with the next characters, until the n-grams
+        are complete. There is no hashing, so the frequencies are exact."""
+        codepoints = Filtering.get_codepoints(document)
+        characters, ranks = np.unique(codepoints, return_inverse=True)
+        ranks = ranks.astype(np.uint64)
+        num_bits = max((len(characters) - 1).bit_length(), 1)
+        ngram_length = min(n, 64 // num_bits)
+        ngrams = Filtering.pack_characters(
+            ranks, 0, len(codepoints) - ngram_length + 1, ngram_length, num_bits
+        )
+        while ngram_length < n:
+            prefixes, ngrams = np.unique(ngrams, return_inverse=True)
+            num_bits_prefixes = max((len(prefixes) - 1).bit_length(), 1)
+            extension_length = min(
+                n - ngram_length, (64 - num_bits_prefixes) // num_bits
+            )
+            size = len(codepoints) - (ngram_length + extension_length) + 1
+            ngrams = ngrams[:size].astype(np.uint64) << np.uint64(
+                extension_length * num_bits
+            )
+            ngrams |= Filtering.pack_characters(
+                ranks, ngram_length, size, extension_length, num_bits
+            )
+            ngram_length += extension_length
+        _, freq_character_ngrams = np.unique(ngrams, return_counts=True)
+        return freq_character_ngrams
+
     @staticmethod
     def check_number_words(
         document,
@@ -410,13 +625,13 @@ class Filtering:
         strip_characters,
         number_words_min_cutoff,
         number_words_max_cutoff,
+        document_analysis=None,
     ):
-        words = ModifyingDocuments.get_words_from_document(
-            document,
-            sentencepiece_model_tok,
-            lower_case=False,
-            strip_characters=strip_characters,
-        )
+        if document_analysis is None:
+            document_analysis = DocumentAnalysis(
+                document, sentencepiece_model_tok, strip_characters
+            )
+        words = document_analysis.get_words(lower_case=False)
         cond = (len(words) >= number_words_min_cutoff) and (
             len(words) <= number_words_max_cutoff
         )
@@ -435,21 +650,26 @@ class Filtering:
                 )
             return freq_character_ngrams
 
-        freq_character_ngrams = get_freq_character_ngrams(
-            document, character_repetition_length
-        )
-        if len(freq_character_ngrams) == 0:
+        if len(document) < character_repetition_length:
             return 0
-        freq_character_ngrams = list(freq_character_ngrams.values())
-        freq_character_ngrams = sorted(freq_character_ngrams, reverse=True)
-        val_less_than_one = len([el for el in freq_character_ngrams if el > 1])
+        if len(document) < Filtering.min_length_vectorization:
+            freq_character_ngrams = get_freq_character_ngrams(
+                document, character_repetition_length
+            )
+            freq_character_ngrams = np.array(list(freq_character_ngrams.values()))
+        else:
+            freq_character_ngrams = Filtering.get_freq_character_ngrams_vectorized(
+                document, character_repetition_length
+            )
+        freq_character_ngrams = np.sort(freq_character_ngrams)[::-1]
+        val_less_than_one = int(np.count_nonzero(freq_character_ngrams > 1))
         num_rep_character_ngrams = min(
             int(np.sqrt(len(freq_character_ngrams))),
             len(freq_character_ngrams) - val_less_than_one,
         )
-        character_repetition_ratio = sum(
-            freq_character_ngrams[:num_rep_character_ngrams]
-        ) / sum(freq_character_ngrams)
+        character_repetition_ratio = int(
+            freq_character_ngrams[:num_rep_character_ngrams].sum()
+        ) / int(freq_character_ngrams.sum())
         return character_repetition_ratio
 
     @staticmethod
@@ -466,17 +686,14 @@ class Filtering:
 
     @staticmethod
     def compute_word_repetition_ratio(
-        document, sentencepiece_model_tok, strip_characters, word_repetition_length
+        document,
+        sentencepiece_model_tok,
+        strip_characters,
+        word_repetition_length,
+        document_analysis=None,
     ):
-        def get_freq_word_ngrams(
-            document, sentencepiece_model_tok, strip_characters, n
-        ):
-            words = ModifyingDocuments.get_words_from_document(
-                document,
-                sentencepiece_model_tok,
-                lower_case=True,
-                strip_characters=strip_characters,
-            )
+        def get_freq_word_ngrams(document_analysis, n):
+            words = document_analysis.get_words(lower_case=True)
             word_ngrams = [
                 " ".join(words[i : i + n]) for i in range(len(words) - n + 1)
             ]
@@ -485,8 +702,12 @@ class Filtering:
                 freq_word_ngrams[word_ngram] = freq_word_ngrams.get(word_ngram, 0) + 1
             return freq_word_ngrams
 
+        if document_analysis is None:
+            document_analysis = DocumentAnalysis(
+                document, sentencepiece_model_tok, strip_characters
+            )
         freq_word_ngrams = get_freq_word_ngrams(
-            document, sentencepiece_model_tok, strip_characters, word_repetition_length
+            document_analysis, word_repetition_length
         )
         if len(freq_word_ngrams) == 0:
             return 0
@@ -503,20 +724,45 @@ class Filtering:
         strip_characters,
         word_repetition_length,
         word_repetition_max_cutoff,
+        document_analysis=None,
     ):
         word_repetition_ratio = Filtering.compute_word_repetition_ratio(
-            document, sentencepiece_model_tok, strip_characters, word_repetition_length
+            document,
+            sentencepiece_model_tok,
+            strip_characters,
+            word_repetition_length,
+            document_analysis,
         )
         cond = word_repetition_ratio <= word_repetition_max_cutoff
         return cond
 
+    @staticmethod
+    def get_special_characters_table(special_characters):
+        key = id(special_characters)
+        if key not in Filtering.special_characters_tables:
+            table = np.zeros(0x110000, dtype=bool)
+            for char in special_characters:
+                # Strings of several characters never match a single character
+                if len(char) == 1:
+                    table[ord(char)] = True
+            # Keep a reference to special_characters so that its id is not reused
+            Filtering.special_characters_tables[key] = (special_characters, table)
+        return Filtering.special_characters_tables[key][1]
+
     @staticmethod
     def compute_special_characters_ratio(document, special_characters):
         if len(document) == 0:
             return 0
-        special_characters_ratio = len(
-            [char for char in document if char in special_characters]
-        ) / len(document)
+        if len(document) < Filtering.min_length_vectorization:
+            num_special_characters = len(
+                [char for char in document if char in special_characters]
+            )
+        else:
+            table = Filtering.get_special_characters_table(special_characters)
+            num_special_characters = int(
+                np.count_nonzero(table[Filtering.get_codepoints(document)])
+            )
+        special_characters_ratio = num_special_characters / len(document)
         return special_characters_ratio
 
     @staticmethod
@@ -540,24 +786,20 @@ class Filtering:
         words_augmentation_group_sizes,
         words_augmentation_join_char,
         stopwords,
+        document_analysis=None,
     ):
-        words = ModifyingDocuments.get_words_from_document(
-            document,
-            sentencepiece_model_tok,
-            lower_case=True,
-            strip_characters=strip_characters,
-        )
+        if document_analysis is None:
+            document_analysis = DocumentAnalysis(
+                document, sentencepiece_model_tok, strip_characters
+            )
+        words = document_analysis.get_words(lower_case=True)
         if not words:
             return 0
         augmentation = []
         if cond_words_augmentation:
-            augmentation = [
-                ModifyingDocuments.words_augmentation(
-                    words, group_size, words_augmentation_join_char
-                )
-                for group_size in words_augmentation_group_sizes
-            ]
-            augmentation = [word for augm in augmentation for word in augm]
+            augmentation = document_analysis.get_augmentation(
+                words_augmentation_group_sizes, words_augmentation_join_char
+            )
         stopwords_ratio = len(
             [word for word in words + augmentation if word in stopwords]
         ) / len(words)
@@ -575,6 +817,7 @@ class Filtering:
         words_augmentation_join_char,
         stopwords,
         stopwords_min_cutoff,
+        document_analysis=None,
     ):
         cond = True
         if stopwords:
@@ -586,6 +829,7 @@ class Filtering:
                 words_augmentation_group_sizes,
                 words_augmentation_join_char,
                 stopwords,
+                document_analysis,
             )
             cond = stopwords_ratio >= stopwords_min_cutoff
         return cond
@@ -599,24 +843,20 @@ class Filtering:
         words_augmentation_group_sizes,
         words_augmentation_join_char,
         flagged_words,
+        document_analysis=None,
     ):
-        words = ModifyingDocuments.get_words_from_document(
-            document,
-            sentencepiece_model_tok,
-            lower_case=True,
-            strip_characters=strip_characters,
-        )
+        if document_analysis is None:
+            document_analysis = DocumentAnalysis(
+                document, sentencepiece_model_tok, strip_characters
+            )
+        words = document_analysis.get_words(lower_case=True)
         if not words:
             return 0
         augmentation = []
         if cond_words_augmentation:
-            augmentation = [
-                ModifyingDocuments.words_augmentation(
-                    words, group_size, words_augmentation_join_char
-                )
-                for group_size in words_augmentation_group_sizes
-            ]
-            augmentation = [word for augm in augmentation for word in augm]
+            augmentation = document_analysis.get_augmentation(
+                words_augmentation_group_sizes, words_augmentation_join_char
+            )
         flagged_words_ratio = len(
             [word for word in words + augmentation if word in flagged_words]
         ) / len(words)
@@ -634,6 +874,7 @@ class Filtering:
         words_augmentation_join_char,
         flagged_words,
         flagged_words_max_cutoff,
+        document_analysis=None,
     ):
         cond = True
         if flagged_words:
@@ -645,42 +886,88 @@ class Filtering:
                 words_augmentation_group_sizes,
                 words_augmentation_join_char,
                 flagged_words,
+                document_analysis,
             )
             cond = flagged_words_ratio <= flagged_words_max_cutoff
         return cond
 
     @staticmethod
-    def compute_lang_id_pred_score(document, model_lang_id):
+    def get_lang_pred_dataset_id(label_pred):
+        return fasttext_label_to_dataset_id.get(label_pred, "unknown")
+
+    @staticmethod
+    def prepare_document_lang_id(document, lang_id_max_length=None):
+        """The Fasttext model predicts on a single line. If lang_id_max_length
+        is not None, only the beginning of the document is used,
+        which is faster for long documents."""
+        if lang_id_max_length is not None:
+            document = document[:lang_id_max_length]
         document = document.lower().replace("\n", " ")
+        return document
+
+    @staticmethod
+    def compute_lang_id_pred_score(document, model_lang_id, lang_id_max_length=None):
+        document = Filtering.prepare_document_lang_id(document, lang_id_max_length)
         pred = model_lang_id.predict(document)
-        lang_pred_fasttext_id = pred[0][0].replace("__label__", "")
+        lang_pred_dataset_id = Filtering.get_lang_pred_dataset_id(pred[0][0])
         score_pred = pred[1][0]
-        lang_pred_dataset_id = langs_id.loc[
-            langs_id["fasttext_id"] == lang_pred_fasttext_id, "dataset_id"
-        ]
-        if len(lang_pred_dataset_id) > 0:
-            lang_pred_dataset_id = lang_pred_dataset_id.iloc[0]
-        else:
-            lang_pred_dataset_id = "unknown"
         return lang_pred_dataset_id, score_pred
 
+    @staticmethod
+    def compute_lang_id_pred_scores(documents, model_lang_id, lang_id_max_length=None):
+        """Batched version of compute_lang_id_pred_score,
+        with a single call to the Fasttext model."""
+        documents = [
+            Filtering.prepare_document_lang_id(document, lang_id_max_length)
+            for document in documents
+        ]
+        if not documents:
+            return []
+        labels_pred, scores_pred = model_lang_id.predict(documents)
+        lang_id_pred_scores = [
+            (Filtering.get_lang_pred_dataset_id(label_pred[0]), score_pred[0])
+            for label_pred, score_pred in zip(labels_pred, scores_pred)
+        ]
+        return lang_id_pred_scores
+
     @staticmethod
     def check_lang_id(
         document,
         lang_dataset_id,
         model_lang_id,
         lang_id_min_cutoff,
+        lang_id_max_length=None,
     ):
         cond = True
         if model_lang_id:
             lang_pred_dataset_id, score_pred = Filtering.compute_lang_id_pred_score(
-                document, model_lang_id
+                document, model_lang_id, lang_id_max_length
             )
             cond = (lang_pred_dataset_id == lang_dataset_id) and (
                 score_pred >= lang_id_min_cutoff
             )
         return cond
 
+    @staticmethod
+    def check_lang_id_batch(
+        documents,
+        lang_dataset_id,
+        model_lang_id,
+        lang_id_min_cutoff,
+        lang_id_max_length=None,
+    ):
+        if not model_lang_id:
+            return [True] * len(documents)
+        lang_id_pred_scores = Filtering.compute_lang_id_pred_scores(
+            documents, model_lang_id, lang_id_max_length
+        )
+        conds = [
+            (lang_pred_dataset_id == lang_dataset_id)
+            and (score_pred >= lang_id_min_cutoff)
+            for lang_pred_dataset_id, score_pred in lang_id_pred_scores
+        ]
+        return conds
+
     @staticmethod
     def compute_perplexity_score(document, sentencepiece_model, kenlm_model):
         document = ModifyingDocuments.normalization(
@@ -720,6 +1007,142 @@ class Filtering:
             cond = score <= perplexity_max_cutoff
         return cond
 
+    @staticmethod
+    def get_checks(
+        cond_check_number_words,
+        sentencepiece_model_tok,
+        strip_characters,
+        number_words_min_cutoff,
+        number_words_max_cutoff,
+        cond_check_character_repetition_removal,
+        character_repetition_length,
+        character_repetition_max_cutoff,
+        cond_check_word_repetition_removal,
+        word_repetition_length,
+        word_repetition_max_cutoff,
+        cond_check_special_characters,
+        special_characters,
+        special_characters_max_cutoff,
+        cond_words_augmentation,
+        words_augmentation_group_sizes,
+        words_augmentation_join_char,
+        cond_check_stopwords,
+        stopwords,
+        stopwords_min_cutoff,
+        cond_check_flagged_words,
+        flagged_words,
+        flagged_words_max_cutoff,
+        cond_check_lang_id,
+        lang_dataset_id,
+        model_lang_id,
+        lang_id_min_cutoff,
+        cond_check_perplexity,
+        sentencepiece_model,
+        kenlm_model,
+        perplexity_max_cutoff,
+        lang_id_max_length=None,
+        checks_order=None,
+    ):
+        """The checks of Filtering.filtering activated by the parameters,
+        in checks_order (default: Filtering.checks_names), as a list of
+        (check_name, check), check(document, document_analysis) telling
+        if the document is kept. They only depend on the parameters, so
+        they are built once and reused for all the documents."""
+        checks = {
+            "number_words": (
+                cond_check_number_words,
+                lambda document, document_analysis: Filtering.check_number_words(
+                    document,
+                    sentencepiece_model_tok,
+                    strip_characters,
+                    number_words_min_cutoff,
+                    number_words_max_cutoff,
+                    document_analysis,
+                ),
+            ),
+            "character_repetition_removal": (
+                cond_check_character_repetition_removal,
+                lambda document, document_analysis: Filtering.check_character_repetition_removal(
+                    document,
+                    character_repetition_length,
+                    character_repetition_max_cutoff,
+                ),
+            ),
+            "word_repetition_removal": (
+                cond_check_word_repetition_removal,
+                lambda document, document_analysis: Filtering.check_word_repetition_removal(
+                    document,
+                    sentencepiece_model_tok,
+                    strip_characters,
+                    word_repetition_length,
+                    word_repetition_max_cutoff,
+                    document_analysis,
+                ),
+            ),
+            "special_characters": (
+                cond_check_special_characters,
+                lambda document, document_analysis: Filtering.check_special_characters(
+                    document,
+                    special_characters,
+                    special_characters_max_cutoff,
+                ),
+            ),
+            "stopwords": (
+                cond_check_stopwords,
+                lambda document, document_analysis: Filtering.check_stopwords(
+                    document,
+                    sentencepiece_model_tok,
+                    strip_characters,
+                    cond_words_augmentation,
+                    words_augmentation_group_sizes,
+                    words_augmentation_join_char,
+                    stopwords,
+                    stopwords_min_cutoff,
+                    document_analysis,
+                ),
+            ),
+            "flagged_words": (
+                cond_check_flagged_words,
+                lambda document, document_analysis: Filtering.check_flagged_words(
+                    document,
+                    sentencepiece_model_tok,
+                    strip_characters,
+                    cond_words_augmentation,
+                    words_augmentation_group_sizes,
+                    words_augmentation_join_char,
+                    flagged_words,
+                    flagged_words_max_cutoff,
+                    document_analysis,
+                ),
+            ),
+            "lang_id": (
+                cond_check_lang_id,
+                lambda document, document_analysis: Filtering.check_lang_id(
+                    document,
+                    lang_dataset_id,
+                    model_lang_id,
+                    lang_id_min_cutoff,
+                    lang_id_max_length,
+                ),
+            ),
+            "perplexity": (
+                cond_check_perplexity,
+                lambda document, document_analysis: Filtering.check_perplexity(
+                    document,
+                    sentencepiece_model,
+                    kenlm_model,
+                    perplexity_max_cutoff,
+                ),
+            ),
+        }
+        if checks_order is None:
+            checks_order = Filtering.checks_names
+        return [
+            (check_name, checks[check_name][1])
+            for check_name in checks_order
+            if checks[check_name][0]
+        ]
+
     @staticmethod
     def filtering(
         document,
@@ -754,41 +1177,282 @@ class Filtering:
         sentencepiece_model,
         kenlm_model,
         perplexity_max_cutoff,
+        lang_id_max_length=None,
+        checks_order=None,
+        checks_statistics=None,
+        checks=None,
     ):
-        if cond_check_number_words:
-            if not Filtering.check_number_words(
-                document,
-                sentencepiece_model_tok,
-                strip_characters,
-                number_words_min_cutoff,
-                number_words_max_cutoff,
-            ):
-                return False
-        if cond_check_character_repetition_removal:
-            if not Filtering.check_character_repetition_removal(
-                document,
-                character_repetition_length,
-                character_repetition_max_cutoff,
-            ):
-                return False
-        if cond_check_word_repetition_removal:
-            if not Filtering.check_word_repetition_removal(
-                document,
-                sentencepiece_model_tok,
-                strip_characters,
-                word_repetition_length,
-                word_repetition_max_cutoff,
-            ):
-                return False
-        if cond_check_special_characters:
-            if not Filtering.check_special_characters(
-                document,
-                special_characters,
-                special_characters_max_cutoff,
-            ):
+        """checks_order is the order in which the checks, named as
+        in Filtering.checks_names, are done (default: Filtering.checks_names).
+        Only the checks in checks_order are done.
+        If checks_statistics (a ChecksStatistics) is given, the time and
+        the result of each check are recorded in it.
+        checks, returned by Filtering.get_checks with the same parameters
+        and checks_order, avoids building them again for each document."""
+        if checks is None:
+            checks = Filtering.get_checks(
+                cond_check_number_words=cond_check_number_words,
+                sentencepiece_model_tok=sentencepiece_model_tok,
+                strip_characters=strip_characters,
+                number_words_min_cutoff=number_words_min_cutoff,
+                number_words_max_cutoff=number_words_max_cutoff,
+                cond_check_character_repetition_removal=cond_check_character_repetition_removal,
+                character_repetition_length=character_repetition_length,
+                character_repetition_max_cutoff=character_repetition_max_cutoff,
+                cond_check_word_repetition_removal=cond_check_word_repetition_removal,
+                word_repetition_length=word_repetition_length,
+                word_repetition_max_cutoff=word_repetition_max_cutoff,
+                cond_check_special_characters=cond_check_special_characters,
+                special_characters=special_characters,
+                special_characters_max_cutoff=special_characters_max_cutoff,
+                cond_words_augmentation=cond_words_augmentation,
+                words_augmentation_group_sizes=words_augmentation_group_sizes,
+                words_augmentation_join_char=words_augmentation_join_char,
+                cond_check_stopwords=cond_check_stopwords,
+                stopwords=stopwords,
+                stopwords_min_cutoff=stopwords_min_cutoff,
+                cond_check_flagged_words=cond_check_flagged_words,
+                flagged_words=flagged_words,
+                flagged_words_max_cutoff=flagged_words_max_cutoff,
+                cond_check_lang_id=cond_check_lang_id,
+                lang_dataset_id=lang_dataset_id,
+                model_lang_id=model_lang_id,
+                lang_id_min_cutoff=lang_id_min_cutoff,
+                cond_check_perplexity=cond_check_perplexity,
+                sentencepiece_model=sentencepiece_model,
+                kenlm_model=kenlm_model,
+                perplexity_max_cutoff=perplexity_max_cutoff,
+                lang_id_max_length=lang_id_max_length,
+                checks_order=checks_order,
+            )
+        document_analysis = DocumentAnalysis(
+            document, sentencepiece_model_tok, strip_characters
+        )
+        if checks_statistics is not None:
+            return checks_statistics.run_checks(checks, document, document_analysis)
+        for _, check in checks:
+            if not check(document, document_analysis):
                 return False
-        if cond_check_stopwords:
-            if not Filtering.check_stopwords(
+        return True
+
+    @staticmethod
+    def filtering_batch(
+        documents,
+        cond_check_number_words,
+        sentencepiece_model_tok,
+        strip_characters,
+        number_words_min_cutoff,
+        number_words_max_cutoff,
+        cond_check_character_repetition_removal,
+        character_repetition_length,
+        character_repetition_max_cutoff,
+        cond_check_word_repetition_removal,
+        word_repetition_length,
+        word_repetition_max_cutoff,
+        cond_check_special_characters,
+        special_characters,
+        special_characters_max_cutoff,
+        cond_words_augmentation,
+        words_augmentation_group_sizes,
+        words_augmentation_join_char,
+        cond_check_stopwords,
+        stopwords,
+        stopwords_min_cutoff,
+        cond_check_flagged_words,
+        flagged_words,
+        flagged_words_max_cutoff,
+        cond_check_lang_id,
+        lang_dataset_id,
+        model_lang_id,
+        lang_id_min_cutoff,
+        cond_check_perplexity,
+        sentencepiece_model,
+        kenlm_model,
+        perplexity_max_cutoff,
+        lang_id_max_length=None,
+        checks_order=None,
+        checks_statistics=None,
+        checks=None,
+    ):
+        """Batched version of filtering. The cheap filters are applied
+        document by document, then the language identification is done
+        with a single call to the Fasttext model on the documents kept,
+        and the perplexity is finally computed on the remaining ones,
+        whatever checks_order. checks, as in filtering, are the checks
+        returned by Filtering.get_checks without the language identification
+        and the perplexity, which are built for the batch if not given."""
+        if checks is None:
+            checks = Filtering.get_checks(
+                cond_check_number_words=cond_check_number_words,
+                sentencepiece_model_tok=sentencepiece_model_tok,
+                strip_characters=strip_characters,
+                number_words_min_cutoff=number_words_min_cutoff,
+                number_words_max_cutoff=number_words_max_cutoff,
+                cond_check_character_repetition_removal=cond_check_character_repetition_removal,
+                character_repetition_length=character_repetition_length,
+                character_repetition_max_cutoff=character_repetition_max_cutoff,
+                cond_check_word_repetition_removal=cond_check_word_repetition_removal,
+                word_repetition_length=word_repetition_length,
+                word_repetition_max_cutoff=word_repetition_max_cutoff,
+                cond_check_special_characters=cond_check_special_characters,
+                special_characters=special_characters,
+                special_characters_max_cutoff=special_characters_max_cutoff,
+                cond_words_augmentation=cond_words_augmentation,
+                words_augmentation_group_sizes=words_augmentation_group_sizes,
+                words_augmentation_join_char=words_augmentation_join_char,
+                cond_check_stopwords=cond_check_stopwords,
+                stopwords=stopwords,
+                stopwords_min_cutoff=stopwords_min_cutoff,
+                cond_check_flagged_words=cond_check_flagged_words,
+                flagged_words=flagged_words,
+                flagged_words_max_cutoff=flagged_words_max_cutoff,
+                cond_check_lang_id=False,
+                lang_dataset_id=lang_dataset_id,
+                model_lang_id=model_lang_id,
+                lang_id_min_cutoff=lang_id_min_cutoff,
+                cond_check_perplexity=False,
+                sentencepiece_model=sentencepiece_model,
+                kenlm_model=kenlm_model,
+                perplexity_max_cutoff=perplexity_max_cutoff,
+                lang_id_max_length=lang_id_max_length,
+                checks_order=checks_order,
+            )
+        keep_documents = [
+            Filtering.filtering(
+                document=document,
+                cond_check_number_words=cond_check_number_words,
+                sentencepiece_model_tok=sentencepiece_model_tok,
+                strip_characters=strip_characters,
+                number_words_min_cutoff=number_words_min_cutoff,
+                number_words_max_cutoff=number_words_max_cutoff,
+                cond_check_character_repetition_removal=cond_check_character_repetition_removal,
+                character_repetition_length=character_repetition_length,
+                character_repetition_max_cutoff=character_repetition_max_cutoff,
+                cond_check_word_repetition_removal=cond_check_word_repetition_removal,
+                word_repetition_length=word_repetition_length,
+                word_repetition_max_cutoff=word_repetition_max_cutoff,
+                cond_check_special_characters=cond_check_special_characters,
+                special_characters=special_characters,
+                special_characters_max_cutoff=special_characters_max_cutoff,
+                cond_words_augmentation=cond_words_augmentation,
+                words_augmentation_group_sizes=words_augmentation_group_sizes,
+                words_augmentation_join_char=words_augmentation_join_char,
+                cond_check_stopwords=cond_check_stopwords,
+                stopwords=stopwords,
+                stopwords_min_cutoff=stopwords_min_cutoff,
+                cond_check_flagged_words=cond_check_flagged_words,
+                flagged_words=flagged_words,
+                flagged_words_max_cutoff=flagged_words_max_cutoff,
+                cond_check_lang_id=False,
+                lang_dataset_id=lang_dataset_id,
+                model_lang_id=model_lang_id,
+                lang_id_min_cutoff=lang_id_min_cutoff,
+                cond_check_perplexity=False,
+                sentencepiece_model=sentencepiece_model,
+                kenlm_model=kenlm_model,
+                perplexity_max_cutoff=perplexity_max_cutoff,
+                lang_id_max_length=lang_id_max_length,
+                checks_order=checks_order,
+                checks_statistics=checks_statistics,
+                checks=checks,
+            )
+            for document in documents
+        ]
+        if cond_check_lang_id:
+            start = time.perf_counter()
+            ind_kept = [ind for ind, keep in enumerate(keep_documents) if keep]
+            conds = Filtering.check_lang_id_batch(
+                [documents[ind] for ind in ind_kept],
+                lang_dataset_id,
+                model_lang_id,
+                lang_id_min_cutoff,
+                lang_id_max_length,
+            )
+            for ind, cond in zip(ind_kept, conds):
+                keep_documents[ind] = cond
+            if checks_statistics is not None:
+                checks_statistics.add(
+                    [
+                        (
+                            "lang_id",
+                            time.perf_counter() - start,
+                            len(conds),
+                            len(conds) - sum(conds),
+                        )
+                    ]
+                )
+        if cond_check_perplexity and kenlm_model:
+            start = time.perf_counter()
+            num_calls = 0
+            num_rejections = 0
+            check_perplexity = Filtering.check_perplexity
+            for ind, document in enumerate(documents):
+                if keep_documents[ind]:
+                    keep_documents[ind] = check_perplexity(
+                        document,
+                        sentencepiece_model,
+                        kenlm_model,
+                        perplexity_max_cutoff,
+                    )
+                    num_calls += 1
+                    num_rejections += not keep_documents[ind]
+            if checks_statistics is not None:
+                checks_statistics.add(
+                    [
+                        (
+                            "perplexity",
+                            time.perf_counter() - start,
+                            num_calls,
+                            num_rejections,
+                        )
+                    ]
+                )
+        return keep_documents
+
+    @staticmethod
+    def compute_scores(
+        document,
+        sentencepiece_model_tok,
+        strip_characters,
+        character_repetition_length,
+        word_repetition_length,
+        special_characters,
+        cond_words_augmentation,
+        words_augmentation_group_sizes,
+        words_augmentation_join_char,
+        stopwords,
+        flagged_words,
+        model_lang_id,
+        sentencepiece_model,
+        kenlm_model,
+        lang_id_max_length=None,
+    ):
+        """Compute the scores of all the filters, whether they are activated
+        or not, so that the cutoffs can be tuned afterwards with apply_cutoffs
+        without computing the scores again.
+        A score is None when the resource needed to compute it is missing."""
+        document_analysis = DocumentAnalysis(
+            document, sentencepiece_model_tok, strip_characters
+        )
+        scores = {name: None for name in Filtering.scores_names}
+        scores["number_words"] = len(document_analysis.get_words(lower_case=False))
+        scores[
+            "character_repetition_ratio"
+        ] = Filtering.compute_character_repetition_ratio(
+            document, character_repetition_length
+        )
+        scores["word_repetition_ratio"] = Filtering.compute_word_repetition_ratio(
+            document,
+            sentencepiece_model_tok,
+            strip_characters,
+            word_repetition_length,
+            document_analysis,
+        )
+        scores["special_characters_ratio"] = Filtering.compute_special_characters_ratio(
+            document, special_characters
+        )
+        if stopwords:
+            scores["stopwords_ratio"] = Filtering.compute_stopwords_ratio(
                 document,
                 sentencepiece_model_tok,
                 strip_characters,
@@ -796,11 +1460,10 @@ class Filtering:
                 words_augmentation_group_sizes,
                 words_augmentation_join_char,
                 stopwords,
-                stopwords_min_cutoff,
-            ):
-                return False
-        if cond_check_flagged_words:
-            if not Filtering.check_flagged_words(
+                document_analysis,
+            )
+        if flagged_words:
+            scores["flagged_words_ratio"] = Filtering.compute_flagged_words_ratio(
                 document,
                 sentencepiece_model_tok,
                 strip_characters,
@@ -808,26 +1471,380 @@ class Filtering:
                 words_augmentation_group_sizes,
                 words_augmentation_join_char,
                 flagged_words,
-                flagged_words_max_cutoff,
-            ):
-                return False
+                document_analysis,
+            )
+        if model_lang_id:
+            lang_pred_dataset_id, score_pred = Filtering.compute_lang_id_pred_score(
+                document, model_lang_id, lang_id_max_length
+            )
+            scores["lang_id_pred"] = lang_pred_dataset_id
+            scores["lang_id_score"] = float(score_pred)
+        if kenlm_model:
+            scores["perplexity_score"] = Filtering.compute_perplexity_score(
+                document, sentencepiece_model, kenlm_model
+            )
+        # The ratios can be the integer 0, but the type
+        # of a column must be the same for all the documents
+        for name in Filtering.scores_names:
+            if name.endswith("_ratio") and scores[name] is not None:
+                scores[name] = float(scores[name])
+        return scores
+
+    @staticmethod
+    def compute_scores_batch(
+        documents,
+        sentencepiece_model_tok,
+        strip_characters,
+        character_repetition_length,
+        word_repetition_length,
+        special_characters,
+        cond_words_augmentation,
+        words_augmentation_group_sizes,
+        words_augmentation_join_char,
+        stopwords,
+        flagged_words,
+        model_lang_id,
+        sentencepiece_model,
+        kenlm_model,
+        lang_id_max_length=None,
+    ):
+        """Batched version of compute_scores, with a single call
+        to the Fasttext model. Returns a dict of lists of scores."""
+        scores = [
+            Filtering.compute_scores(
+                document=document,
+                sentencepiece_model_tok=sentencepiece_model_tok,
+                strip_characters=strip_characters,
+                character_repetition_length=character_repetition_length,
+                word_repetition_length=word_repetition_length,
+                special_characters=special_characters,
+                cond_words_augmentation=cond_words_augmentation,
+                words_augmentation_group_sizes=words_augmentation_group_sizes,
+                words_augmentation_join_char=words_augmentation_join_char,
+                stopwords=stopwords,
+                flagged_words=flagged_words,
+                model_lang_id=None,
+                sentencepiece_model=sentencepiece_model,
+                kenlm_model=kenlm_model,
+                lang_id_max_length=lang_id_max_length,
+            )
+            for document in documents
+        ]
+        scores = {
+            name: [score[name] for score in scores] for name in Filtering.scores_names
+        }
+        if model_lang_id:
+            lang_id_pred_scores = Filtering.compute_lang_id_pred_scores(
+                documents, model_lang_id, lang_id_max_length
+            )
+            scores["lang_id_pred"] = [pred for pred, _ in lang_id_pred_scores]
+            scores["lang_id_score"] = [
+                float(score_pred) for _, score_pred in lang_id_pred_scores
+            ]
+        return scores
+
+    @staticmethod
+    def apply_cutoffs(
+        scores,
+        cond_check_number_words,
+        number_words_min_cutoff,
+        number_words_max_cutoff,
+        cond_check_character_repetition_removal,
+        character_repetition_max_cutoff,
+        cond_check_word_repetition_removal,
+        word_repetition_max_cutoff,
+        cond_check_special_characters,
+        special_characters_max_cutoff,
+        cond_check_stopwords,
+        stopwords_min_cutoff,
+        cond_check_flagged_words,
+        flagged_words_max_cutoff,
+        cond_check_lang_id,
+        lang_dataset_id,
+        lang_id_min_cutoff,
+        cond_check_perplexity,
+        perplexity_max_cutoff,
+    ):
+        """Vectorized version of filtering on the scores computed by
+        compute_scores_batch. Returns a boolean mask of the documents to keep.
+        Missing scores (None) pass the checks, as in filtering."""
+
+        def get_scores(name):
+            # None is converted to nan, and comparisons with nan are False
+            return np.array(scores[name], dtype=float)
+
+        keep_documents = np.ones(len(scores["number_words"]), dtype=bool)
+        if cond_check_number_words:
+            number_words = get_scores("number_words")
+            keep_documents &= ~(number_words < number_words_min_cutoff)
+            keep_documents &= ~(number_words > number_words_max_cutoff)
+        if cond_check_character_repetition_removal:
+            keep_documents &= ~(
+                get_scores("character_repetition_ratio")
+                > character_repetition_max_cutoff
+            )
+        if cond_check_word_repetition_removal:
+            keep_documents &= ~(
+                get_scores("word_repetition_ratio") > word_repetition_max_cutoff
+            )
+        if cond_check_special_characters:
+            keep_documents &= ~(
+                get_scores("special_characters_ratio") > special_characters_max_cutoff
+            )
+        if cond_check_stopwords:
+            keep_documents &= ~(get_scores("stopwords_ratio") < stopwords_min_cutoff)
+        if cond_check_flagged_words:
+            keep_documents &= ~(
+                get_scores("flagged_words_ratio") > flagged_words_max_cutoff
+            )
         if cond_check_lang_id:
-            if not Filtering.check_lang_id(
-                document,
-                lang_dataset_id,
-                model_lang_id,
-                lang_id_min_cutoff,
-            ):
-                return False
+            lang_id_pred = np.array(scores["lang_id_pred"], dtype=object)
+            cond_lang_id = (lang_id_pred == lang_dataset_id) & ~(
+                get_scores("lang_id_score") < lang_id_min_cutoff
+            )
+            keep_documents &= np.equal(lang_id_pred, None) | cond_lang_id
         if cond_check_perplexity:
-            if not Filtering.check_perplexity(
+            keep_documents &= ~(get_scores("perplexity_score") > perplexity_max_cutoff)
+        return keep_documents
+
+
+class SchedulingChecks:
+    """Order the checks of Filtering.filtering to minimize the expected cost
+    per document, from their costs and rejection rates measured on a sample
+    of documents. With independent rejections, it is optimal to do the checks
+    by increasing ratio of cost to rejection rate, so that cheap checks
+    rejecting a lot of documents are done first. The tokenization is shared
+    by the checks using the words, so it is only counted in the cost of the
+    first of them."""
+
+    @staticmethod
+    def profile_checks(documents, filtering_parameters):
+        """Time each activated check and count its rejections on the documents,
+        the checks being done independently of each other.
+        filtering_parameters are the arguments of Filtering.filtering
+        except the document. Returns the profile of the checks by name,
+        and the average time of the tokenization."""
+        checks_profile = {
+            check_name: {"time": 0.0, "num_rejections": 0}
+            for check_name in Filtering.checks_names
+            if filtering_parameters[f"cond_check_{check_name}"]
+        }
+        checks = {
+            check_name: Filtering.get_checks(
+                **filtering_parameters, checks_order=[check_name]
+            )
+            for check_name in checks_profile
+        }
+        tokenization_time = 0.0
+        for document in documents:
+            start = time.perf_counter()
+            DocumentAnalysis(
                 document,
-                sentencepiece_model,
-                kenlm_model,
-                perplexity_max_cutoff,
-            ):
-                return False
-        return True
+                filtering_parameters["sentencepiece_model_tok"],
+                filtering_parameters["strip_characters"],
+            ).get_tokens()
+            tokenization_time += time.perf_counter() - start
+            for check_name, check_profile in checks_profile.items():
+                start = time.perf_counter()
+                keep_document = Filtering.filtering(
+                    document=document,
+                    **filtering_parameters,
+                    checks_order=[check_name],
+                    checks=checks[check_name],
+                )
+                check_profile["time"] += time.perf_counter() - start
+                check_profile["num_rejections"] += not keep_document
+        num_documents = max(len(documents), 1)
+        tokenization_time /= num_documents
+        for check_name, check_profile in checks_profile.items():
+            check_profile["time"] /= num_documents
+            if check_name in Filtering.words_checks_names:
+                # The time of the tokenization is counted separately
+                check_profile["time"] = max(
+                    check_profile["time"] - tokenization_time, 0.0
+                )
+            check_profile["rejection_rate"] = (
+                check_profile["num_rejections"] / num_documents
+            )
+        return checks_profile, tokenization_time
+
+    @staticmethod
+    def order_checks(checks_profile, tokenization_time, batched=False):
+        """Greedy order of the profiled checks, followed by the other checks
+        (which are deactivated) in the default order.
+        In batched mode, Filtering.filtering_batch does the language
+        identification and the perplexity last, so they are kept last."""
+        checks_order = []
+        remaining_checks = list(checks_profile)
+        if batched:
+            remaining_checks = [
+                check_name
+                for check_name in remaining_checks
+                if check_name not in ["lang_id", "perplexity"]
+            ]
+        is_tokenized = False
+
+        def rank(check_name):
+            cost = checks_profile[check_name]["time"]
+            if check_name in Filtering.words_checks_names and not is_tokenized:
+                cost += tokenization_time
+            rejection_rate = checks_profile[check_name]["rejection_rate"]
+            if rejection_rate == 0:
+                return (float("inf"), cost)
+            return (cost / rejection_rate, cost)
+
+        while remaining_checks:
+            check_name = min(remaining_checks, key=rank)
+            checks_order.append(check_name)
+            remaining_checks.remove(check_name)
+            if check_name in Filtering.words_checks_names:
+                is_tokenized = True
+        checks_order += [
+            check_name
+            for check_name in Filtering.checks_names
+            if check_name not in checks_order
+        ]
+        return checks_order
+
+    @staticmethod
+    def expected_cost(checks_order, checks_profile, tokenization_time):
+        """Expected time per document of the checks done in this order,
+        assuming that their rejections are independent."""
+        expected_cost = 0.0
+        prob_kept = 1.0
+        is_tokenized = False
+        for check_name in checks_order:
+            if check_name not in checks_profile:
+                continue
+            cost = checks_profile[check_name]["time"]
+            if check_name in Filtering.words_checks_names and not is_tokenized:
+                cost += tokenization_time
+                is_tokenized = True
+            expected_cost += prob_kept * cost
+            prob_kept *= 1 - checks_profile[check_name]["rejection_rate"]
+        return expected_cost
+
+    @staticmethod
+    def report(checks_order, checks_profile, tokenization_time):
+        lines = [
+            f"{'check':<30}{'time (ms)':>12}{'rejection rate':>16}",
+        ]
+        for check_name in checks_order:
+            if check_name not in checks_profile:
+                continue
+            check_profile = checks_profile[check_name]
+            lines.append(
+                f"{check_name:<30}{1000 * check_profile['time']:>12.3f}"
+                f"{check_profile['rejection_rate']:>16.3f}"
+            )
+        lines.append(f"{'tokenization':<30}{1000 * tokenization_time:>12.3f}")
+        default_cost = SchedulingChecks.expected_cost(
+            Filtering.checks_names, checks_profile, tokenization_time
+        )
+        cost = SchedulingChecks.expected_cost(
+            checks_order, checks_profile, tokenization_time
+        )
+        lines.append(
+            f"Expected time per document: {1000 * cost:.3f} ms "
+            f"(default order: {1000 * default_cost:.3f} ms)"
+        )
+        return "\n".join(lines)
+
+
+class ChecksStatistics:
+    """Opt-in instrumentation of Filtering.filtering, recording the wall time,
+    the number of calls and the number of rejections of each check,
+    as well as the number of documents filtered and kept.
+    The statistics are stored in shared memory created in the main process.
+    The workers forked by the datasets library when num_proc > 1 find it
+    in the registry inherited from the main process, so the statistics
+    are aggregated across the workers. The times are summed over the workers."""
+
+    registry = {}
+    statistics_names = ["time", "num_calls", "num_rejections"]
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.ind_checks = {
+            check_name: ind for ind, check_name in enumerate(Filtering.checks_names)
+        }
+        num_statistics = len(ChecksStatistics.statistics_names)
+        # The last two values are the numbers of documents filtered and kept
+        self.values = multiprocessing.Array(
+            "d", num_statistics * len(Filtering.checks_names) + 2
+        )
+        ChecksStatistics.registry[self.id] = self
+
+    def add(self, records):
+        """records is a list of (check_name, time, num_calls, num_rejections)."""
+        num_statistics = len(ChecksStatistics.statistics_names)
+        with self.values.get_lock():
+            for check_name, time_check, num_calls, num_rejections in records:
+                ind = num_statistics * self.ind_checks[check_name]
+                self.values[ind] += time_check
+                self.values[ind + 1] += num_calls
+                self.values[ind + 2] += num_rejections
+
+    def add_documents(self, num_documents, num_documents_kept):
+        with self.values.get_lock():
+            self.values[-2] += num_documents
+            self.values[-1] += num_documents_kept
+
+    def run_checks(self, checks, document, document_analysis):
+        """Do the checks as in Filtering.filtering, recording each of them."""
+        records = []
+        keep_document = True
+        for check_name, check in checks:
+            start = time.perf_counter()
+            keep_document = check(document, document_analysis)
+            records.append(
+                (check_name, time.perf_counter() - start, 1, not keep_document)
+            )
+            if not keep_document:
+                break
+        self.add(records)
+        return keep_document
+
+    def get_statistics(self):
+        num_statistics = len(ChecksStatistics.statistics_names)
+        values = self.values[:]
+        checks_statistics = {}
+        for check_name, ind_check in self.ind_checks.items():
+            ind = num_statistics * ind_check
+            num_calls = int(values[ind + 1])
+            num_rejections = int(values[ind + 2])
+            checks_statistics[check_name] = {
+                "time": values[ind],
+                "num_calls": num_calls,
+                "num_rejections": num_rejections,
+                "rejection_rate": num_rejections / num_calls if num_calls else 0.0,
+            }
+        return {
+            "num_documents": int(values[-2]),
+            "num_documents_kept": int(values[-1]),
+            "checks": checks_statistics,
+        }
+
+    def summary(self):
+        statistics = self.get_statistics()
+        lines = [
+            f"Kept {statistics['num_documents_kept']:_} documents "
+            f"out of {statistics['num_documents']:_}."
+        ]
+        for check_name, check_statistics in statistics["checks"].items():
+            if not check_statistics["num_calls"]:
+                continue
+            lines.append(
+                f"{check_name}: {check_statistics['num_calls']:_} calls "
+                f"in {check_statistics['time']:.1f}s, "
+                f"{check_statistics['num_rejections']:_} rejections "
+                f"({100 * check_statistics['rejection_rate']:.1f}%)."
+            )
+        return lines
+
+    def save(self, path_file):
+        with open(path_file, "w", encoding="utf-8") as f:
+            json.dump(self.get_statistics(), f, indent=2)
 
 
 class FunctionDatasetFiltering:
@@ -837,11 +1854,23 @@ class FunctionDatasetFiltering:
         path_fasttext_model,
         path_sentencepiece_model,
         path_kenlm_model,
+        batched=False,
+        checks_order=None,
+        checks_statistics_id=None,
     ):
         self.lang_dataset_id = lang_dataset_id
         self.path_fasttext_model = path_fasttext_model
         self.path_sentencepiece_model = path_sentencepiece_model
         self.path_kenlm_model = path_kenlm_model
+        self.batched = batched
+        self.checks_order = checks_order
+        # Found in the registry inherited by the workers with fork,
+        # and None if the instrumentation is not activated
+        self.checks_statistics_id = checks_statistics_id
+        self.checks_statistics = ChecksStatistics.registry.get(checks_statistics_id)
+        # The checks built by get_checks for each checks_order,
+        # which DatasetFiltering may set after the scheduling
+        self.checks = {}
 
         self.param = LoadParameters.load_parameters(lang_dataset_id)
         self.stopwords = LoadParameters.load_stopwords(lang_dataset_id)
@@ -859,47 +1888,94 @@ class FunctionDatasetFiltering:
             lang_dataset_id, path_kenlm_model
         )
 
-    def __call__(self, example):
-        keep_example = Filtering.filtering(
-            document=example["text"],
-            cond_check_number_words=self.param["cond_check_number_words"],
-            sentencepiece_model_tok=self.sentencepiece_model_tok,
-            strip_characters=self.param["strip_characters"],
-            number_words_min_cutoff=self.param["number_words_min_cutoff"],
-            number_words_max_cutoff=self.param["number_words_max_cutoff"],
-            cond_check_character_repetition_removal=self.param[
+        self.filtering_parameters = {
+            "cond_check_number_words": self.param["cond_check_number_words"],
+            "sentencepiece_model_tok": self.sentencepiece_model_tok,
+            "strip_characters": self.param["strip_characters"],
+            "number_words_min_cutoff": self.param["number_words_min_cutoff"],
+            "number_words_max_cutoff": self.param["number_words_max_cutoff"],
+            "cond_check_character_repetition_removal": self.param[
                 "cond_check_character_repetition_removal"
             ],
-            character_repetition_length=self.param["character_repetition_length"],
-            character_repetition_max_cutoff=self.param[
+            "character_repetition_length": self.param["character_repetition_length"],
+            "character_repetition_max_cutoff": self.param[
                 "character_repetition_max_cutoff"
             ],
-            cond_check_word_repetition_removal=self.param[
+            "cond_check_word_repetition_removal": self.param[
                 "cond_check_word_repetition_removal"
             ],
-            word_repetition_length=self.param["word_repetition_length"],
-            word_repetition_max_cutoff=self.param["word_repetition_max_cutoff"],
-            cond_check_special_characters=self.param["cond_check_special_characters"],
-            special_characters=self.param["special_characters"],
-            special_characters_max_cutoff=self.param["special_characters_max_cutoff"],
-            cond_words_augmentation=self.param["cond_words_augmentation"],
-            words_augmentation_group_sizes=self.param["words_augmentation_group_sizes"],
-            words_augmentation_join_char=self.param["words_augmentation_join_char"],
-            cond_check_stopwords=self.param["cond_check_stopwords"],
-            stopwords=self.stopwords,
-            stopwords_min_cutoff=self.param["stopwords_min_cutoff"],
-            cond_check_flagged_words=self.param["cond_check_flagged_words"],
-            flagged_words=self.flagged_words,
-            flagged_words_max_cutoff=self.param["flagged_words_max_cutoff"],
-            cond_check_lang_id=self.param["cond_check_lang_id"],
-            lang_dataset_id=self.lang_dataset_id,
-            model_lang_id=self.model_lang_id,
-            lang_id_min_cutoff=self.param["lang_id_min_cutoff"],
-            cond_check_perplexity=self.param["cond_check_perplexity"],
-            sentencepiece_model=self.sentencepiece_model,
-            kenlm_model=self.kenlm_model,
-            perplexity_max_cutoff=self.param["perplexity_max_cutoff"],
+            "word_repetition_length": self.param["word_repetition_length"],
+            "word_repetition_max_cutoff": self.param["word_repetition_max_cutoff"],
+            "cond_check_special_characters": self.param[
+                "cond_check_special_characters"
+            ],
+            "special_characters": self.param["special_characters"],
+            "special_characters_max_cutoff": self.param[
+                "special_characters_max_cutoff"
+            ],
+            "cond_words_augmentation": self.param["cond_words_augmentation"],
+            "words_augmentation_group_sizes": self.param[
+                "words_augmentation_group_sizes"
+            ],
+            "words_augmentation_join_char": self.param["words_augmentation_join_char"],
+            "cond_check_stopwords": self.param["cond_check_stopwords"],
+            "stopwords": self.stopwords,
+            "stopwords_min_cutoff": self.param["stopwords_min_cutoff"],
+            "cond_check_flagged_words": self.param["cond_check_flagged_words"],
+            "flagged_words": self.flagged_words,
+            "flagged_words_max_cutoff": self.param["flagged_words_max_cutoff"],
+            "cond_check_lang_id": self.param["cond_check_lang_id"],
+            "lang_dataset_id": self.lang_dataset_id,
+            "model_lang_id": self.model_lang_id,
+            "lang_id_min_cutoff": self.param["lang_id_min_cutoff"],
+            "cond_check_perplexity": self.param["cond_check_perplexity"],
+            "sentencepiece_model": self.sentencepiece_model,
+            "kenlm_model": self.kenlm_model,
+            "perplexity_max_cutoff": self.param["perplexity_max_cutoff"],
+            "lang_id_max_length": self.param["lang_id_max_length"],
+        }
+
+    def get_checks(self):
+        """The checks of Filtering.filtering for the current checks_order,
+        built once. In batched mode, they don't include the language
+        identification and the perplexity, done by batches."""
+        key = None if self.checks_order is None else tuple(self.checks_order)
+        if key not in self.checks:
+            filtering_parameters = self.filtering_parameters
+            if self.batched:
+                filtering_parameters = {
+                    **filtering_parameters,
+                    "cond_check_lang_id": False,
+                    "cond_check_perplexity": False,
+                }
+            self.checks[key] = Filtering.get_checks(
+                **filtering_parameters, checks_order=self.checks_order
+            )
+        return self.checks[key]
+
+    def __call__(self, example):
+        if self.batched:
+            keep_examples = Filtering.filtering_batch(
+                documents=example["text"],
+                **self.filtering_parameters,
+                checks_order=self.checks_order,
+                checks_statistics=self.checks_statistics,
+                checks=self.get_checks(),
+            )
+            if self.checks_statistics is not None:
+                self.checks_statistics.add_documents(
+                    len(keep_examples), sum(keep_examples)
+                )
+            return keep_examples
+        keep_example = Filtering.filtering(
+            document=example["text"],
+            **self.filtering_parameters,
+            checks_order=self.checks_order,
+            checks_statistics=self.checks_statistics,
+            checks=self.get_checks(),
         )
+        if self.checks_statistics is not None:
+            self.checks_statistics.add_documents(1, keep_example)
         return keep_example
 
     def __reduce__(self):
@@ -910,10 +1986,116 @@ class FunctionDatasetFiltering:
                 self.path_fasttext_model,
                 self.path_sentencepiece_model,
                 self.path_kenlm_model,
+                self.batched,
+                self.checks_order,
+                self.checks_statistics_id,
+            ),
+        )
+
+
+class FunctionDatasetScoring(FunctionDatasetFiltering):
+    """Add the scores of all the filters as new columns
+    instead of removing documents."""
+
+    def __init__(
+        self,
+        lang_dataset_id,
+        path_fasttext_model,
+        path_sentencepiece_model,
+        path_kenlm_model,
+        batched=False,
+    ):
+        super().__init__(
+            lang_dataset_id,
+            path_fasttext_model,
+            path_sentencepiece_model,
+            path_kenlm_model,
+            batched,
+        )
+        self.scoring_parameters = {
+            "sentencepiece_model_tok": self.sentencepiece_model_tok,
+            "strip_characters": self.param["strip_characters"],
+            "character_repetition_length": self.param["character_repetition_length"],
+            "word_repetition_length": self.param["word_repetition_length"],
+            "special_characters": self.param["special_characters"],
+            "cond_words_augmentation": self.param["cond_words_augmentation"],
+            "words_augmentation_group_sizes": self.param[
+                "words_augmentation_group_sizes"
+            ],
+            "words_augmentation_join_char": self.param["words_augmentation_join_char"],
+            "stopwords": self.stopwords,
+            "flagged_words": self.flagged_words,
+            "model_lang_id": self.model_lang_id,
+            "sentencepiece_model": self.sentencepiece_model,
+            "kenlm_model": self.kenlm_model,
+            "lang_id_max_length": self.param["lang_id_max_length"],
+        }
+
+    def __call__(self, example):
+        if self.batched:
+            scores = Filtering.compute_scores_batch(
+                documents=example["text"], **self.scoring_parameters
+            )
+        else:
+            scores = Filtering.compute_scores(
+                document=example["text"], **self.scoring_parameters
+            )
+        example.update(scores)
+        return example
+
+    def __reduce__(self):
+        return (
+            self.__class__,
+            (
+                self.lang_dataset_id,
+                self.path_fasttext_model,
+                self.path_sentencepiece_model,
+                self.path_kenlm_model,
+                self.batched,
             ),
         )
 
 
+class FunctionDatasetApplyingCutoffs:
+    """Batched function for Dataset.filter, applied on
+    the columns Filtering.scores_names added by FunctionDatasetScoring."""
+
+    def __init__(self, lang_dataset_id):
+        self.lang_dataset_id = lang_dataset_id
+        self.param = LoadParameters.load_parameters(lang_dataset_id)
+        self.cutoffs_parameters = {
+            name: self.param[name]
+            for name in [
+                "cond_check_number_words",
+                "number_words_min_cutoff",
+                "number_words_max_cutoff",
+                "cond_check_character_repetition_removal",
+                "character_repetition_max_cutoff",
+                "cond_check_word_repetition_removal",
+                "word_repetition_max_cutoff",
+                "cond_check_special_characters",
+                "special_characters_max_cutoff",
+                "cond_check_stopwords",
+                "stopwords_min_cutoff",
+                "cond_check_flagged_words",
+                "flagged_words_max_cutoff",
+                "cond_check_lang_id",
+                "lang_id_min_cutoff",
+                "cond_check_perplexity",
+                "perplexity_max_cutoff",
+            ]
+        }
+        self.cutoffs_parameters["lang_dataset_id"] = lang_dataset_id
+
+    def __call__(self, *scores):
+        scores = dict(zip(Filtering.scores_names, scores))
+        keep_examples = Filtering.apply_cutoffs(scores, **self.cutoffs_parameters)
+        return keep_examples.tolist()
+
+    def __reduce__(self):
+        return (self.__class__, (self.lang_dataset_id,))
+
+
 class DatasetFiltering:
     def __init__(
         self,
@@ -924,6 +2106,10 @@ class DatasetFiltering:
         path_kenlm_model,
         num_proc,
         path_dir_save_dataset,
+        batched=False,
+        schedule_checks=False,
+        num_documents_scheduling=1000,
+        instrument_checks=False,
     ):
         self.ds = dataset
         self.lang_dataset_id = lang_dataset_id
@@ -932,21 +2118,87 @@ class DatasetFiltering:
         self.path_kenlm_model = path_kenlm_model
         self.num_proc = num_proc
         self.path_dir_save_dataset = path_dir_save_dataset
+        self.batched = batched
+        self.schedule_checks = schedule_checks
+        self.num_documents_scheduling = num_documents_scheduling
+        self.instrument_checks = instrument_checks
+        self.checks_statistics = None
 
     def modifying_documents(self):
         func_dataset_modifying_documents = FunctionDatasetModifyingDocuments(
-            self.lang_dataset_id
+            self.lang_dataset_id, self.batched
+        )
+        self.ds = self.ds.map(
+            func_dataset_modifying_documents,
+            batched=self.batched,
+            num_proc=self.num_proc,
         )
-        self.ds = self.ds.map(func_dataset_modifying_documents, num_proc=self.num_proc)
 
     def filtering(self):
+        if self.instrument_checks:
+            self.checks_statistics = ChecksStatistics()
         func_dataset_filtering = FunctionDatasetFiltering(
             self.lang_dataset_id,
             self.path_fasttext_model,
             self.path_sentencepiece_model,
             self.path_kenlm_model,
+            self.batched,
+            checks_statistics_id=(
+                self.checks_statistics.id if self.checks_statistics else None
+            ),
+        )
+        if self.schedule_checks:
+            func_dataset_filtering.checks_order = self.scheduling_checks(
+                func_dataset_filtering
+            )
+        self.ds = self.ds.filter(
+            func_dataset_filtering, batched=self.batched, num_proc=self.num_proc
+        )
+
+    def scheduling_checks(self, func_dataset_filtering):
+        """Profile the checks on the first documents of the dataset,
+        print the report and return the order of the checks
+        minimizing the expected cost per document."""
+        num_documents = min(self.num_documents_scheduling, len(self.ds))
+        documents = self.ds.select(range(num_documents))["text"]
+        checks_profile, tokenization_time = SchedulingChecks.profile_checks(
+            documents, func_dataset_filtering.filtering_parameters
+        )
+        checks_order = SchedulingChecks.order_checks(
+            checks_profile, tokenization_time, self.batched
+        )
+        print(
+            f"Order of the checks for {self.lang_dataset_id}, "
+            f"profiled on {num_documents} documents:"
+        )
+        print(SchedulingChecks.report(checks_order, checks_profile, tokenization_time))
+        return checks_order
+
+    def scoring(self):
+        func_dataset_scoring = FunctionDatasetScoring(
+            self.lang_dataset_id,
+            self.path_fasttext_model,
+            self.path_sentencepiece_model,
+            self.path_kenlm_model,
+            self.batched,
+        )
+        self.ds = self.ds.map(
+            func_dataset_scoring, batched=self.batched, num_proc=self.num_proc
+        )
+
+    def applying_cutoffs(self):
+        """Filter a dataset already scored with the method scoring.
+        Only the columns of the scores are read, and the checks are vectorized,
+        so the cutoffs can be tuned quickly."""
+        func_dataset_applying_cutoffs = FunctionDatasetApplyingCutoffs(
+            self.lang_dataset_id
+        )
+        self.ds = self.ds.filter(
+            func_dataset_applying_cutoffs,
+            input_columns=Filtering.scores_names,
+            batched=True,
+            num_proc=self.num_proc,
         )
-        self.ds = self.ds.filter(func_dataset_filtering, num_proc=self.num_proc)
 
     def save_dataset(self):
         pathlib.Path(self.path_dir_save_dataset).mkdir(parents=True, exist_ok=True)
@@ -955,3 +2207,155 @@ class DatasetFiltering:
         )
         pathlib.Path(path_dir_save_dataset).mkdir(parents=True, exist_ok=True)
         self.ds.save_to_disk(path_dir_save_dataset)
+        if self.checks_statistics is not None:
+            print("\n".join(self.checks_statistics.summary()))
+            self.checks_statistics.save(
+                pathlib.PurePath(
+                    self.path_dir_save_dataset,
+                    f"{self.lang_dataset_id}_checks_statistics.json",
+                )
+            )
+
+
+class StreamingDatasetFiltering:
+    """Filtering of a dataset loaded with streaming=True, so that the dataset
+    does not need to be downloaded entirely before the filtering starts.
+    The documents are modified and filtered by batches, and the documents
+    kept are saved in gzipped JSON Lines shards of about
+    num_documents_per_shard documents. Each time a shard is completed,
+    the number of documents read is saved in a checkpoint file,
+    so that an interrupted filtering resumes after the last completed shard."""
+
+    def __init__(
+        self,
+        dataset,
+        lang_dataset_id,
+        path_fasttext_model,
+        path_sentencepiece_model,
+        path_kenlm_model,
+        path_dir_save_dataset,
+        batch_size=1000,
+        num_documents_per_shard=100000,
+    ):
+        self.ds = dataset
+        self.lang_dataset_id = lang_dataset_id
+        self.path_fasttext_model = path_fasttext_model
+        self.path_sentencepiece_model = path_sentencepiece_model
+        self.path_kenlm_model = path_kenlm_model
+        self.path_dir_save_dataset = pathlib.PurePath(
+            path_dir_save_dataset, lang_dataset_id
+        )
+        self.batch_size = batch_size
+        self.num_documents_per_shard = num_documents_per_shard
+        self.path_checkpoint = pathlib.PurePath(
+            self.path_dir_save_dataset, "checkpoint.json"
+        )
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.path_checkpoint):
+            return {
+                "num_documents_read": 0,
+                "num_documents_kept": 0,
+                "num_shards": 0,
+                "done": False,
+            }
+        with open(self.path_checkpoint) as f:
+            checkpoint = json.load(f)
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint):
+        path_checkpoint_tmp = f"{self.path_checkpoint}.tmp"
+        with open(path_checkpoint_tmp, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(path_checkpoint_tmp, self.path_checkpoint)
+
+    def get_path_shard(self, ind_shard):
+        return pathlib.PurePath(
+            self.path_dir_save_dataset, f"shard_{ind_shard:05d}.jsonl.gz"
+        )
+
+    def iter_batches(self, dataset):
+        batch = []
+        for example in dataset:
+            batch.append(example)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def filter_batch(self, batch, func_modifying_documents, func_filtering):
+        texts = func_modifying_documents({"text": [ex["text"] for ex in batch]})["text"]
+        keep_examples = func_filtering({"text": texts})
+        kept_examples = []
+        for example, text, keep_example in zip(batch, texts, keep_examples):
+            if keep_example:
+                example["text"] = text
+                kept_examples.append(example)
+        return kept_examples
+
+    def filtering(self):
+        pathlib.Path(self.path_dir_save_dataset).mkdir(parents=True, exist_ok=True)
+        checkpoint = self.load_checkpoint()
+        if checkpoint["done"]:
+            print(f"The filtering of {self.path_dir_save_dataset} is already done.")
+            return
+        dataset = self.ds
+        if checkpoint["num_documents_read"] > 0:
+            print(
+                f"Resuming after {checkpoint['num_documents_read']} documents "
+                f"and {checkpoint['num_shards']} shards."
+            )
+            dataset = dataset.skip(checkpoint["num_documents_read"])
+
+        func_modifying_documents = FunctionDatasetModifyingDocuments(
+            self.lang_dataset_id, batched=True
+        )
+        func_filtering = FunctionDatasetFiltering(
+            self.lang_dataset_id,
+            self.path_fasttext_model,
+            self.path_sentencepiece_model,
+            self.path_kenlm_model,
+            batched=True,
+        )
+
+        num_documents_read = checkpoint["num_documents_read"]
+        num_documents_kept_shard = 0
+        path_shard_tmp = None
+        shard = None
+
+        def close_shard():
+            shard.close()
+            os.replace(path_shard_tmp, self.get_path_shard(checkpoint["num_shards"]))
+            checkpoint["num_documents_read"] = num_documents_read
+            checkpoint["num_documents_kept"] += num_documents_kept_shard
+            checkpoint["num_shards"] += 1
+            self.save_checkpoint(checkpoint)
+
+        for batch in self.iter_batches(dataset):
+            kept_examples = self.filter_batch(
+                batch, func_modifying_documents, func_filtering
+            )
+            num_documents_read += len(batch)
+            if kept_examples and shard is None:
+                # A shard left unfinished by an interrupted run is overwritten
+                path_shard_tmp = f"{self.get_path_shard(checkpoint['num_shards'])}.tmp"
+                shard = gzip.open(path_shard_tmp, "wt", encoding="utf-8")
+            for kept_example in kept_examples:
+                shard.write(
+                    json.dumps(kept_example, ensure_ascii=False, default=str) + "\n"
+                )
+            num_documents_kept_shard += len(kept_examples)
+            if num_documents_kept_shard >= self.num_documents_per_shard:
+                close_shard()
+                shard = None
+                num_documents_kept_shard = 0
+        if shard is not None:
+            close_shard()
+        checkpoint["num_documents_read"] = num_documents_read
+        checkpoint["done"] = True
+        self.save_checkpoint(checkpoint)
+        print(
+            f"Kept {checkpoint['num_documents_kept']} documents out of "
+            f"{checkpoint['num_documents_read']} in {checkpoint['num_shards']} shards."
+        )
@@ -229,3 +229,11 @@ langs_id = [
     },
 ]
 langs_id = pd.DataFrame(langs_id)
+
+# Dataset id by label predicted by the Fasttext model, to avoid
+# looking up the dataframe for each document
+fasttext_label_to_dataset_id = {}
+for fasttext_id, dataset_id in zip(langs_id["fasttext_id"], langs_id["dataset_id"]):
+    label = f"__label__{fasttext_id}"
+    if fasttext_id and label not in fasttext_label_to_dataset_id:
+        fasttext_label_to_dataset_id[label] = dataset_id
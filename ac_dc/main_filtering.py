@@ -3,10 +3,11 @@
 from multiprocessing import cpu_count
 
 import argparse
+import os
 
-from datasets import load_dataset
+from datasets import load_dataset, load_from_disk
 
-from filtering import DatasetFiltering
+from filtering import DatasetFiltering, StreamingDatasetFiltering
 
 
 def check_num_proc(num_proc: int = -1) -> int:
@@ -44,6 +45,19 @@ def check_num_proc(num_proc: int = -1) -> int:
 
 def parseArgs():
     parser = argparse.ArgumentParser(description="Filtering.")
+    parser.add_argument(
+        "--mode",
+        type=str,
+        default="filtering",
+        choices=["filtering", "scoring", "applying_cutoffs"],
+        help="'filtering' removes the documents directly. 'scoring' saves the dataset with the scores of all the filters as new columns, and 'applying_cutoffs' filters such a scored dataset, which is fast enough to tune the cutoffs.",
+    )
+    parser.add_argument(
+        "--path_dir_scored_dataset",
+        type=str,
+        default=None,
+        help="Path to the dataset saved in the 'scoring' mode. Only used in the 'applying_cutoffs' mode.",
+    )
     parser.add_argument(
         "--dataset_name",
         type=str,
@@ -98,6 +112,44 @@ def parseArgs():
         default=-1,
         help="Number of processes for multiprocessing. Default at the number of processors available.",
     )
+    parser.add_argument(
+        "--batched",
+        action="store_true",
+        help="Process the documents by batches. Faster, since the language identification is done with one call to the Fasttext model per batch.",
+    )
+    parser.add_argument(
+        "--schedule_checks",
+        action="store_true",
+        help="Order the checks by increasing ratio of cost to rejection rate, measured on the first documents of the dataset.",
+    )
+    parser.add_argument(
+        "--num_documents_scheduling",
+        type=int,
+        default=1000,
+        help="Number of documents used to measure the costs and rejection rates of the checks with --schedule_checks.",
+    )
+    parser.add_argument(
+        "--instrument_checks",
+        action="store_true",
+        help="Record the wall time, the number of calls and the number of rejections of each check, aggregated across the processes, and save them in a json file next to the saved dataset. Only for the 'filtering' mode without streaming.",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Load the dataset in streaming mode instead of downloading it first, and save the documents kept in gzipped JSON Lines shards. An interrupted filtering resumes after the last completed shard. Only for the 'filtering' mode.",
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1000,
+        help="Number of documents filtered at once in streaming mode.",
+    )
+    parser.add_argument(
+        "--num_documents_per_shard",
+        type=int,
+        default=100000,
+        help="Minimum number of documents kept per shard in streaming mode.",
+    )
     parser.add_argument(
         "--path_dir_save_dataset",
         type=str,
@@ -105,18 +157,56 @@ def parseArgs():
         help="Path to the directory where the filtered version of the dataset will be saved.",
     )
     args = parser.parse_args()
+    if args.streaming:
+        if args.mode != "filtering":
+            parser.error("--streaming is only supported in the 'filtering' mode")
+        if args.instrument_checks:
+            parser.error("--instrument_checks is not supported with --streaming")
+    if args.mode == "applying_cutoffs":
+        if args.path_dir_scored_dataset is None:
+            parser.error(
+                "--path_dir_scored_dataset is required in the 'applying_cutoffs' mode"
+            )
+        if not os.path.isdir(args.path_dir_scored_dataset):
+            parser.error(
+                f"--path_dir_scored_dataset {args.path_dir_scored_dataset} is not a directory"
+            )
     return args
 
 
 def main():
     args = parseArgs()
 
-    dataset = load_dataset(
-        args.dataset_name,
-        args.config_name,
-        data_files=args.data_files,
-        split=args.split,
-    )
+    if args.streaming:
+        dataset = load_dataset(
+            args.dataset_name,
+            args.config_name,
+            data_files=args.data_files,
+            split=args.split,
+            streaming=True,
+        )
+        streaming_dataset_filtering = StreamingDatasetFiltering(
+            dataset=dataset,
+            lang_dataset_id=args.lang_dataset_id,
+            path_fasttext_model=args.path_fasttext_model,
+            path_sentencepiece_model=args.path_sentencepiece_model,
+            path_kenlm_model=args.path_kenlm_model,
+            path_dir_save_dataset=args.path_dir_save_dataset,
+            batch_size=args.batch_size,
+            num_documents_per_shard=args.num_documents_per_shard,
+        )
+        streaming_dataset_filtering.filtering()
+        return
+
+    if args.mode == "applying_cutoffs":
+        dataset = load_from_disk(args.path_dir_scored_dataset)
+    else:
+        dataset = load_dataset(
+            args.dataset_name,
+            args.config_name,
+            data_files=args.data_files,
+            split=args.split,
+        )
 
     dataset_filtering = DatasetFiltering(
         dataset=dataset,
@@ -126,9 +216,19 @@ def main():
         path_kenlm_model=args.path_kenlm_model,
         num_proc=check_num_proc(args.num_proc),
         path_dir_save_dataset=args.path_dir_save_dataset,
+        batched=args.batched,
+        schedule_checks=args.schedule_checks,
+        num_documents_scheduling=args.num_documents_scheduling,
+        instrument_checks=args.instrument_checks,
     )
-    dataset_filtering.modifying_documents()
-    dataset_filtering.filtering()
+    if args.mode == "filtering":
+        dataset_filtering.modifying_documents()
+        dataset_filtering.filtering()
+    elif args.mode == "scoring":
+        dataset_filtering.modifying_documents()
+        dataset_filtering.scoring()
+    else:
+        dataset_filtering.applying_cutoffs()
     dataset_filtering.save_dataset()
 
 
@@ -46,6 +46,7 @@ parameters_filtering_default = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.70,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -80,6 +81,7 @@ parameters_filtering_af = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.6,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 3000000,
 }
@@ -114,6 +116,7 @@ parameters_filtering_ar = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 1000000,
 }
@@ -148,6 +151,7 @@ parameters_filtering_arz = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -182,6 +186,7 @@ parameters_filtering_as = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -216,6 +221,7 @@ parameters_filtering_bn = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 575000,
 }
@@ -250,6 +256,7 @@ parameters_filtering_ca = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 1750000,
 }
@@ -284,6 +291,7 @@ parameters_filtering_en = {
     "flagged_words_max_cutoff": 0.045,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.80,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 2500,
 }
@@ -318,6 +326,7 @@ parameters_filtering_es = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 2500000,
 }
@@ -352,6 +361,7 @@ parameters_filtering_eu = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -386,6 +396,7 @@ parameters_filtering_fr = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 3000000,
 }
@@ -420,6 +431,7 @@ parameters_filtering_gu = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 250000,
 }
@@ -454,6 +466,7 @@ parameters_filtering_hi = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 600000,
 }
@@ -488,6 +501,7 @@ parameters_filtering_id = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 2500000,
 }
@@ -522,6 +536,7 @@ parameters_filtering_kn = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 400000,
 }
@@ -556,6 +571,7 @@ parameters_filtering_ml = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 1600000,
 }
@@ -590,6 +606,7 @@ parameters_filtering_mr = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 425000,
 }
@@ -624,6 +641,7 @@ parameters_filtering_pt = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": True,
     "perplexity_max_cutoff": 3000000,
 }
@@ -658,6 +676,7 @@ parameters_filtering_so = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -692,6 +711,7 @@ parameters_filtering_sw = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -726,6 +746,7 @@ parameters_filtering_ta = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -760,6 +781,7 @@ parameters_filtering_te = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -794,6 +816,7 @@ parameters_filtering_ur = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -828,6 +851,7 @@ parameters_filtering_vi = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -862,6 +886,7 @@ parameters_filtering_yo = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
@@ -896,6 +921,7 @@ parameters_filtering_zh = {
     "flagged_words_max_cutoff": 0.2,
     "cond_check_lang_id": True,
     "lang_id_min_cutoff": 0.75,
+    "lang_id_max_length": None,
     "cond_check_perplexity": False,
     "perplexity_max_cutoff": 3000000,
 }
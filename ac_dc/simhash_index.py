@@ -0,0 +1,567 @@
+"""Exact near-duplicate search over 64-bit simhashes.
+
+Two simhashes within `threshold` bits of each other agree exactly on at least
+`num_blocks - threshold` of the `num_blocks` blocks their bits are split into
+(pigeonhole principle). For each choice of these blocks, the index keeps a
+table of the hashes sorted by their bits in the chosen blocks, so that all the
+candidates of a query are found with binary searches, and then checked with
+their exact Hamming distance. All the arrays are saved as `.npy` files and
+memory-mapped when the index is loaded.
+"""
+import fcntl
+import itertools
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def bits_to_uint64(bits: np.ndarray) -> np.ndarray:
+    """
+    Pack arrays of 64 bits, most significant bit first, into uint64 hashes.
+
+    Parameters
+    ----------
+    bits : np.ndarray
+        Array of shape (n, 64) of 0 and 1
+
+    Returns
+    -------
+    np.ndarray
+        Array of n uint64 hashes
+
+    Examples
+    --------
+    >>> bits_to_uint64(np.array([[0] * 63 + [1], [1] + [0] * 63]))
+    array([                  1, 9223372036854775808], dtype=uint64)
+    """
+    packed = np.packbits(np.asarray(bits, dtype=np.uint8).reshape(-1, 64), axis=1)
+    return packed.view(">u8").ravel().astype(np.uint64)
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    """
+    Number of bits set in each element of an uint64 array.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Array of uint64
+
+    Returns
+    -------
+    np.ndarray
+        Array of the numbers of bits set, with the same length as x
+
+    Examples
+    --------
+    >>> popcount(np.array([0, 1, 3, 2**64 - 1], dtype=np.uint64))
+    array([ 0,  1,  2, 64])
+    """
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    return POPCOUNT_TABLE[x.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int64)
+
+
+def hamming_distances(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Element-wise Hamming distances between two arrays of uint64 hashes."""
+    return popcount(np.bitwise_xor(x, y))
+
+
+def block_masks(num_blocks: int) -> List[int]:
+    """Masks of `num_blocks` contiguous blocks of bits of nearly equal sizes covering the 64 bits."""
+    bounds = [round(i * 64 / num_blocks) for i in range(num_blocks + 1)]
+    return [
+        ((1 << (end - start)) - 1) << start for start, end in zip(bounds, bounds[1:])
+    ]
+
+
+def default_num_blocks(max_threshold: int) -> int:
+    """
+    Default number of blocks for a maximum distance: `max_threshold + 3`, so that each table keys
+    on 3 of the blocks, about 32 bits at the usual threshold of 3 (C(6, 3) = 20 tables). With fewer
+    blocks, the keys are short and each query gets a share of the N records as candidates.
+
+    Examples
+    --------
+    >>> default_num_blocks(3)
+    6
+    """
+    return min(max_threshold + 3, 64)
+
+
+def nearest_k(
+    queries: np.ndarray,
+    ids: np.ndarray,
+    distances: np.ndarray,
+    num_queries: int,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The `k` nearest records of each query, as fixed-size arrays, from results sorted by query and then by distance.
+
+    Parameters
+    ----------
+    queries : np.ndarray
+        Positions of the queries, sorted
+    ids : np.ndarray
+        Ids of the matching records
+    distances : np.ndarray
+        Distances of the matching records, sorted for each query
+    num_queries : int
+        Number of queries
+    k : int
+        Number of neighbours per query
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        Ids and distances of the neighbours of each query, of shape (num_queries, k), by increasing distance,
+        padded with -1 when a query has less than `k` neighbours
+
+    Examples
+    --------
+    >>> nearest_k(np.array([0, 0, 2]), np.array([5, 7, 9]), np.array([0, 2, 1]), 3, 1)
+    (array([[ 5],
+           [-1],
+           [ 9]]), array([[ 0],
+           [-1],
+           [ 1]]))
+    """
+    queries = np.asarray(queries, dtype=np.int64)
+    # Rank of each result among the results of its query
+    ranks = np.arange(len(queries)) - np.searchsorted(queries, queries, side="left")
+    kept = ranks < k
+    nearest_ids = np.full((num_queries, k), -1, dtype=np.int64)
+    nearest_distances = np.full((num_queries, k), -1, dtype=np.int64)
+    nearest_ids[queries[kept], ranks[kept]] = ids[kept]
+    nearest_distances[queries[kept], ranks[kept]] = distances[kept]
+    return nearest_ids, nearest_distances
+
+
+class SimhashIndex:
+    """
+    Exact Hamming-distance index over 64-bit simhashes.
+
+    Parameters
+    ----------
+    ids : np.ndarray
+        Ids of the indexed records (int64)
+    hashes : np.ndarray
+        Simhashes of the indexed records (uint64)
+    max_threshold : int
+        Maximum Hamming distance supported by the queries
+    num_blocks : int
+        Number of blocks the 64 bits are split into
+    tables : List[Tuple[int, np.ndarray, np.ndarray]]
+        For each table, the mask of its blocks, the sorted masked hashes,
+        and the positions of the records in this order
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        hashes: np.ndarray,
+        max_threshold: int,
+        num_blocks: int,
+        tables: List[Tuple[int, np.ndarray, np.ndarray]],
+    ):
+        self.ids = ids
+        self.hashes = hashes
+        self.max_threshold = max_threshold
+        self.num_blocks = num_blocks
+        self.tables = tables
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def table_masks(max_threshold: int, num_blocks: int) -> List[int]:
+        """Masks of the blocks kept by each table, one table per choice of `num_blocks - max_threshold` blocks."""
+        masks = block_masks(num_blocks)
+        return [
+            int(np.bitwise_or.reduce(np.array(chosen, dtype=np.uint64)))
+            for chosen in itertools.combinations(masks, num_blocks - max_threshold)
+        ]
+
+    @classmethod
+    def build(
+        cls,
+        ids: np.ndarray,
+        hashes: np.ndarray,
+        max_threshold: int = 3,
+        num_blocks: Optional[int] = None,
+        num_threads: int = 1,
+    ) -> "SimhashIndex":
+        """
+        Build the index. The time complexity is O(T * N log N) with T the number of tables.
+
+        Parameters
+        ----------
+        ids : np.ndarray
+            Ids of the records
+        hashes : np.ndarray
+            Simhashes of the records (uint64)
+        max_threshold : int, optional
+            Maximum Hamming distance supported by the queries, by default 3
+        num_blocks : Optional[int], optional
+            Number of blocks, by default `default_num_blocks(max_threshold)`. More blocks means more
+            tables (C(num_blocks, max_threshold) of them) but longer keys and fewer candidates per query
+        num_threads : int, optional
+            Number of threads sorting the tables, by default 1 (NumPy releases the GIL while sorting)
+
+        Returns
+        -------
+        SimhashIndex
+            The index
+        """
+        num_blocks = (
+            num_blocks if num_blocks is not None else default_num_blocks(max_threshold)
+        )
+        if not 0 <= max_threshold < num_blocks <= 64:
+            raise ValueError(
+                f"Expected 0 <= max_threshold < num_blocks <= 64, got {max_threshold} and {num_blocks}"
+            )
+        ids = np.asarray(ids, dtype=np.int64)
+        hashes = np.asarray(hashes, dtype=np.uint64)
+
+        def build_table(mask):
+            keys = hashes & np.uint64(mask)
+            order = np.argsort(keys, kind="stable")
+            return mask, keys[order], order
+
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            tables = list(
+                executor.map(build_table, cls.table_masks(max_threshold, num_blocks))
+            )
+        return cls(ids, hashes, max_threshold, num_blocks, tables)
+
+    def save(self, output_dir: str):
+        """Save the index as `.npy` files in `output_dir`."""
+        os.makedirs(output_dir, exist_ok=True)
+        np.save(os.path.join(output_dir, "ids.npy"), self.ids)
+        np.save(os.path.join(output_dir, "hashes.npy"), self.hashes)
+        for i, (_, keys, order) in enumerate(self.tables):
+            np.save(os.path.join(output_dir, f"table_{i}_keys.npy"), keys)
+            np.save(os.path.join(output_dir, f"table_{i}_order.npy"), order)
+        with open(os.path.join(output_dir, "index.json"), "w") as f:
+            json.dump(
+                {
+                    "max_threshold": self.max_threshold,
+                    "num_blocks": self.num_blocks,
+                    "masks": [mask for mask, _, _ in self.tables],
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "SimhashIndex":
+        """Load an index saved with `save`, memory-mapping its arrays by default."""
+        mmap_mode = "r" if mmap else None
+        with open(os.path.join(index_dir, "index.json")) as f:
+            config = json.load(f)
+        tables = [
+            (
+                mask,
+                np.load(os.path.join(index_dir, f"table_{i}_keys.npy"), mmap_mode),
+                np.load(os.path.join(index_dir, f"table_{i}_order.npy"), mmap_mode),
+            )
+            for i, mask in enumerate(config["masks"])
+        ]
+        return cls(
+            np.load(os.path.join(index_dir, "ids.npy"), mmap_mode),
+            np.load(os.path.join(index_dir, "hashes.npy"), mmap_mode),
+            config["max_threshold"],
+            config["num_blocks"],
+            tables,
+        )
+
+    def query(
+        self, hashes: np.ndarray, threshold: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Find all the indexed records within `threshold` bits of each query hash.
+
+        Parameters
+        ----------
+        hashes : np.ndarray
+            Query simhashes (uint64)
+        threshold : int
+            Maximum Hamming distance, at most the `max_threshold` of the index
+
+        Returns
+        -------
+        Tuple[np.ndarray, np.ndarray, np.ndarray]
+            Positions of the queries in `hashes`, ids of the matching records and their distances,
+            sorted by query and then by distance
+        """
+        if threshold > self.max_threshold:
+            raise ValueError(
+                f"The index supports a threshold up to {self.max_threshold}, got {threshold}"
+            )
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        queries = []
+        positions = []
+        for mask, keys, order in self.tables:
+            masked = hashes & np.uint64(mask)
+            left = np.searchsorted(keys, masked, side="left")
+            right = np.searchsorted(keys, masked, side="right")
+            lengths = right - left
+            total = int(lengths.sum())
+            if total == 0:
+                continue
+            # Expand each range [left, right) of sorted positions
+            starts = np.repeat(left - (np.cumsum(lengths) - lengths), lengths)
+            queries.append(np.repeat(np.arange(len(hashes)), lengths))
+            positions.append(np.asarray(order[starts + np.arange(total)]))
+        if not queries:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, empty
+        queries = np.concatenate(queries)
+        positions = np.concatenate(positions)
+        distances = hamming_distances(hashes[queries], self.hashes[positions])
+        matched = distances <= threshold
+        queries, positions, distances = (
+            queries[matched],
+            positions[matched],
+            distances[matched],
+        )
+        # The same pair can be found by several tables
+        _, unique = np.unique(queries * len(self) + positions, return_index=True)
+        queries, positions, distances = (
+            queries[unique],
+            positions[unique],
+            distances[unique],
+        )
+        order = np.lexsort((distances, queries))
+        return (
+            queries[order],
+            np.asarray(self.ids[positions[order]]),
+            distances[order],
+        )
+
+    def query_nearest(
+        self, hashes: np.ndarray, k: int, threshold: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids and distances of the `k` nearest records within `threshold` bits of each hash, see `nearest_k`."""
+        queries, ids, distances = self.query(hashes, threshold)
+        return nearest_k(queries, ids, distances, len(hashes), k)
+
+    def get_nns(self, hash: int, threshold: int) -> Tuple[List[int], List[int]]:
+        """Ids and distances of all the indexed records within `threshold` bits of one hash, by increasing distance."""
+        _, ids, distances = self.query(np.array([hash], dtype=np.uint64), threshold)
+        return ids.tolist(), distances.tolist()
+
+
+class SegmentedSimhashIndex:
+    """
+    Persistent index made of immutable `SimhashIndex` segments, so that new records are added
+    by building a segment for them only, in time proportional to their number. The segments are
+    listed in `segments.json`, which is replaced atomically, under a lock, when segments are added
+    or merged. Merging segments (for instance in a background process) only reduces the number
+    of segments to query, the results of the queries being the same.
+
+    Parameters
+    ----------
+    index_dir : str
+        Directory of the index
+    max_threshold : int
+        Maximum Hamming distance supported by the queries
+    num_blocks : int
+        Number of blocks the 64 bits are split into
+    segments : List[str]
+        Names of the directories of the segments in `index_dir`
+    """
+
+    def __init__(
+        self, index_dir: str, max_threshold: int, num_blocks: int, segments: List[str]
+    ):
+        self.index_dir = index_dir
+        self.max_threshold = max_threshold
+        self.num_blocks = num_blocks
+        self.segments = segments
+        self.loaded_segments = {}
+
+    @staticmethod
+    def is_segmented_index(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, "segments.json"))
+
+    @classmethod
+    def open(
+        cls,
+        index_dir: str,
+        max_threshold: int = 3,
+        num_blocks: Optional[int] = None,
+    ) -> "SegmentedSimhashIndex":
+        """Open the index in `index_dir`, creating an empty one if it does not exist."""
+        if not cls.is_segmented_index(index_dir):
+            num_blocks = (
+                num_blocks
+                if num_blocks is not None
+                else default_num_blocks(max_threshold)
+            )
+            os.makedirs(index_dir, exist_ok=True)
+            index = cls(index_dir, max_threshold, num_blocks, [])
+            with index.lock():
+                if not cls.is_segmented_index(index_dir):
+                    index.write_manifest()
+        index = cls(index_dir, 0, 0, [])
+        with index.lock():
+            index.read_manifest()
+        return index
+
+    def lock(self):
+        return FileLock(os.path.join(self.index_dir, "segments.lock"))
+
+    def read_manifest(self):
+        """
+        Read the list of segments and open all of them, under the lock, so that a merge cannot delete
+        a segment before it is opened. The files of an opened (memory-mapped) segment stay readable
+        after they are deleted, so the index can still be queried while other processes merge it.
+        """
+        with open(os.path.join(self.index_dir, "segments.json")) as f:
+            manifest = json.load(f)
+        self.max_threshold = manifest["max_threshold"]
+        self.num_blocks = manifest["num_blocks"]
+        self.segments = manifest["segments"]
+        self.loaded_segments = {
+            segment: self.get_segment(segment) for segment in self.segments
+        }
+
+    def write_manifest(self):
+        path = os.path.join(self.index_dir, "segments.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(
+                {
+                    "max_threshold": self.max_threshold,
+                    "num_blocks": self.num_blocks,
+                    "segments": self.segments,
+                },
+                f,
+            )
+        os.replace(path + ".tmp", path)
+
+    def get_segment(self, segment: str) -> SimhashIndex:
+        if segment not in self.loaded_segments:
+            self.loaded_segments[segment] = SimhashIndex.load(
+                os.path.join(self.index_dir, segment)
+            )
+        return self.loaded_segments[segment]
+
+    def __len__(self) -> int:
+        return sum(len(self.get_segment(segment)) for segment in self.segments)
+
+    def new_segment_name(self) -> str:
+        return f"segment_{time.time_ns():020d}_{os.getpid()}"
+
+    def add(self, ids: np.ndarray, hashes: np.ndarray, num_threads: int = 1):
+        """Add the records as a new segment."""
+        if not len(ids):
+            return
+        segment = self.new_segment_name()
+        SimhashIndex.build(
+            ids, hashes, self.max_threshold, self.num_blocks, num_threads
+        ).save(os.path.join(self.index_dir, segment))
+        with self.lock():
+            self.read_manifest()
+            self.segments.append(segment)
+            self.write_manifest()
+            self.get_segment(segment)
+
+    def merge(self, max_segments: int = 1, num_threads: int = 1):
+        """
+        Merge the smallest segments so that at most `max_segments` segments are left. Segments added
+        while merging are kept as they are, and the merged segments are deleted once replaced. If
+        another process merged some of them in the meantime, the new segment is discarded instead.
+        """
+        with self.lock():
+            self.read_manifest()
+            if len(self.segments) <= max_segments:
+                return
+            sizes = {
+                segment: len(self.get_segment(segment)) for segment in self.segments
+            }
+        merged = sorted(self.segments, key=sizes.get)[
+            : len(self.segments) - max_segments + 1
+        ]
+        segment = self.new_segment_name()
+        SimhashIndex.build(
+            np.concatenate([self.get_segment(name).ids for name in merged]),
+            np.concatenate([self.get_segment(name).hashes for name in merged]),
+            self.max_threshold,
+            self.num_blocks,
+            num_threads,
+        ).save(os.path.join(self.index_dir, segment))
+        with self.lock():
+            self.read_manifest()
+            # Another process may have merged some of these segments in the meantime
+            replaced = all(name in self.segments for name in merged)
+            if replaced:
+                position = self.segments.index(merged[0])
+                self.segments = [name for name in self.segments if name not in merged]
+                self.segments.insert(min(position, len(self.segments)), segment)
+                self.write_manifest()
+                self.get_segment(segment)
+        if not replaced:
+            shutil.rmtree(os.path.join(self.index_dir, segment))
+            return
+        for name in merged:
+            self.loaded_segments.pop(name, None)
+            # The files of a memory-mapped segment stay readable by the processes using it
+            shutil.rmtree(os.path.join(self.index_dir, name))
+
+    def query(
+        self, hashes: np.ndarray, threshold: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Same as `SimhashIndex.query`, over all the segments."""
+        results = [
+            self.get_segment(segment).query(hashes, threshold)
+            for segment in self.segments
+        ]
+        if not results:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, empty
+        queries, ids, distances = (np.concatenate(arrays) for arrays in zip(*results))
+        order = np.lexsort((distances, queries))
+        return queries[order], ids[order], distances[order]
+
+    def query_nearest(
+        self, hashes: np.ndarray, k: int, threshold: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Ids and distances of the `k` nearest records within `threshold` bits of each hash, see `nearest_k`."""
+        queries, ids, distances = self.query(hashes, threshold)
+        return nearest_k(queries, ids, distances, len(hashes), k)
+
+    def get_nns(self, hash: int, threshold: int) -> Tuple[List[int], List[int]]:
+        """Ids and distances of all the indexed records within `threshold` bits of one hash, by increasing distance."""
+        _, ids, distances = self.query(np.array([hash], dtype=np.uint64), threshold)
+        return ids.tolist(), distances.tolist()
+
+
+class FileLock:
+    """Exclusive lock on a file, for the processes updating the same index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, "w")
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def load_index(index_dir: str):
+    """Load a `SegmentedSimhashIndex` or a `SimhashIndex`, which have the same query methods."""
+    if SegmentedSimhashIndex.is_segmented_index(index_dir):
+        return SegmentedSimhashIndex.open(index_dir)
+    return SimhashIndex.load(index_dir)
@@ -0,0 +1,67 @@
+import pytest
+
+from anonymization import RegexAnonymizer, apply_regex_anonymization
+
+
+@pytest.mark.parametrize(
+    "sentence",
+    [
+        "Graphic design studio, reach us via our mailbox 5551234567@gmail.com",
+        "Our phone line is closed this week, so reach us via our mailbox 5551234567@gmail.com",
+    ],
+)
+def test_rejected_match_falls_back_to_other_rules(sentence):
+    # The phone number has no context word around it, the email is matched from the same position
+    output, ner = apply_regex_anonymization(sentence, "en")
+    assert output == sentence.replace("5551234567@gmail.com", " <EMAIL> ")
+    assert ner["<EMAIL>"] == "EMAIL"
+    assert "<PHONE>" not in ner
+
+
+def test_overlapping_tags():
+    sentence = "Write to john.doe@example.com or call our phone 555-123-4567"
+    output, ner = apply_regex_anonymization(sentence, "en")
+    # The reported domain names don't hide the email they are part of
+    assert output == "Write to  <EMAIL>  or call our phone <PHONE> "
+    assert ner == {
+        "john.doe": "DOMAIN_NAME",
+        "example.com": "DOMAIN_NAME",
+        "<EMAIL>": "EMAIL",
+        "<PHONE>": "PHONE",
+    }
+
+
+def test_regional_lang_id():
+    sentence = "My SSN is 123-45-6789 and my passport 123456789"
+    output, ner = apply_regex_anonymization(sentence, "en_US")
+    assert output == "My SSN is  <GOVT_ID>  and my passport  <GOVT_ID> "
+    assert ner == {"<GOVT_ID>": "GOVT_ID"}
+    # The regexes of the other regions of the language are not used
+    for lang_id in ["en", "en_CA"]:
+        assert apply_regex_anonymization(sentence, lang_id) == (sentence, {})
+
+
+def test_context_words_are_whole_words():
+    anonymizer = RegexAnonymizer("en_US")
+    sentence = "Because the graphic shipment was delayed, the status of the documentary is unclear."
+    assert anonymizer.find_keywords(sentence) == {}
+    assert anonymizer(sentence) == (sentence, {})
+    # Only the rules without context words were tried
+    tried = {i for rule_ids in anonymizer.patterns for i in rule_ids}
+    assert tried and all(anonymizer.rules[i][2] is None for i in tried)
+
+    keywords = anonymizer.find_keywords("Ph: 1, passport# 2, passport#3, US 4")
+    assert keywords == {"ph": [0], "passport": [7, 20], "passport#": [7], "us": [32]}
+
+
+@pytest.mark.parametrize(
+    "sentence,anonymized",
+    [
+        ("Call our phone: 555-123-4567", True),
+        ("Our phone line is closed this week: 555-123-4567", False),
+        ("The graphic number 555-123-4567", False),
+    ],
+)
+def test_context_window(sentence, anonymized):
+    output, _ = apply_regex_anonymization(sentence, "en")
+    assert ("<PHONE>" in output) == anonymized
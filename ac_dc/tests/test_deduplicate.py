@@ -0,0 +1,182 @@
+import random
+
+import numpy as np
+import pytest
+from datasets import Dataset, DatasetDict, load_from_disk
+from simhash import Simhash
+
+import deduplicate
+from simhash_index import SegmentedSimhashIndex, SimhashIndex
+
+
+def save_split(path, **columns):
+    DatasetDict({"train": Dataset.from_dict(columns)}).save_to_disk(str(path))
+
+
+def test_merge_meta_without_duplicates_suffix(tmp_path):
+    hashes = np.array([0, 0b111, 2**63, 2**40 - 1], dtype=np.uint64)
+    data_dir = tmp_path / "hashes_00000"
+    save_split(data_dir, id=[0, 1, 2, 3], hash=hashes, text=["a", "b", "c", "d"])
+    meta_dir = tmp_path / "meta_00000"
+    # Only the records 0 and 2 have metadata, with other ids
+    meta = [dict(deduplicate.DEFAULT_METADATA, offset=i) for i in (10, 12)]
+    save_split(meta_dir, id=[10, 12], hash=hashes[[0, 2]], meta=meta)
+    index_file = str(tmp_path / "simhash_index")
+    SimhashIndex.build(np.array([10, 12]), hashes[[0, 2]], max_threshold=1).save(
+        index_file
+    )
+
+    deduplicate.merge_meta(
+        index_file,
+        data_dirs=[str(data_dir)],
+        meta_data_dirs=[str(meta_dir)],
+        split="train",
+        num_proc=1,
+        k=1,
+        threshold=1,
+        chunk_size=2,
+    )
+
+    ds = load_from_disk(str(tmp_path / "hashes_00000_with_meta"))["train"]
+    assert ds["text"] == ["a", "b", "c", "d"]
+    assert [m["offset"] for m in ds["meta"]] == [10, -1, 12, -1]
+    # The input is left untouched
+    assert "meta" not in load_from_disk(str(data_dir))["train"].column_names
+
+
+def deduplicate_incremental(data_dir, index_dir):
+    deduplicate.deduplicate_incremental(
+        [str(data_dir)],
+        index_dir,
+        split="train",
+        num_proc=1,
+        threshold=1,
+        max_threshold=1,
+        num_blocks=None,
+        max_segments=None,
+    )
+    return load_from_disk(str(data_dir) + "_deduplicated")["train"]["id"]
+
+
+def test_deduplicate_incremental(tmp_path):
+    index_dir = str(tmp_path / "index")
+    base_dir = tmp_path / "base"
+    # 1 is a duplicate of 0
+    base_hashes = np.array([0, 0b1, 2**40 - 1, 0xF0 << 56], dtype=np.uint64)
+    save_split(base_dir, id=[0, 1, 2, 3], hash=base_hashes)
+    assert [0, 2, 3] == deduplicate_incremental(base_dir, index_dir)
+    assert 3 == len(SegmentedSimhashIndex.open(index_dir))
+
+    delta_dir = tmp_path / "delta"
+    delta_hashes = np.array(
+        [
+            # Duplicates of the records 0 and 2 kept in the base shard
+            0b10,
+            (2**40 - 1) ^ 2**50,
+            # New records, 13 being a duplicate of 12
+            0xFFFF0000,
+            0xFFFF0001,
+            0x123456789,
+        ],
+        dtype=np.uint64,
+    )
+    # The records are not sorted by id
+    save_split(delta_dir, id=[10, 11, 13, 12, 14], hash=delta_hashes[[0, 1, 3, 2, 4]])
+    assert [12, 14] == deduplicate_incremental(delta_dir, index_dir)
+
+    index = SegmentedSimhashIndex.open(index_dir)
+    assert 2 == len(index.segments)
+    assert 5 == len(index)
+    assert [12, 14] == sorted(index.get_segment(index.segments[-1]).ids.tolist())
+
+
+def random_texts(rng, vocabulary, num_texts, num_words=300):
+    return [" ".join(rng.choices(vocabulary, k=num_words)) for _ in range(num_texts)]
+
+
+def edit_words(rng, vocabulary, text, num_edits=5):
+    words = text.split()
+    for _ in range(num_edits):
+        words[rng.randrange(len(words))] = rng.choice(vocabulary)
+    return " ".join(words)
+
+
+def hamming_distances(hashes, other_hashes):
+    return np.unpackbits((hashes ^ other_hashes).view(np.uint8)).reshape(-1, 64).sum(1)
+
+
+def test_hash_backends_same_distances():
+    rng = random.Random(0)
+    vocabulary = [
+        "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(2, 8)))
+        for _ in range(1000)
+    ]
+    texts = random_texts(rng, vocabulary, 200)
+    near_duplicates = [edit_words(rng, vocabulary, text) for text in texts]
+    unrelated = random_texts(rng, vocabulary, 200)
+
+    distances = {}
+    for backend, simhashes in [
+        ("numpy", deduplicate.compute_simhashes),
+        (
+            "simhash",
+            lambda texts: np.array(
+                [Simhash(deduplicate.create_shingles(text, 4)).value for text in texts],
+                dtype=np.uint64,
+            ),
+        ),
+    ]:
+        hashes = simhashes(texts)
+        near = hamming_distances(hashes, simhashes(near_duplicates))
+        other = hamming_distances(hashes, simhashes(unrelated))
+        # The near duplicates are well separated from the unrelated texts
+        assert near.max() < other.min()
+        distances[backend] = near, other
+
+    for numpy_distances, simhash_distances in zip(
+        distances["numpy"], distances["simhash"]
+    ):
+        assert numpy_distances.mean() == pytest.approx(simhash_distances.mean(), abs=1)
+        assert np.median(numpy_distances) == pytest.approx(
+            np.median(simhash_distances), abs=1
+        )
+
+
+def test_compute_simhashes_batch_size():
+    rng = random.Random(0)
+    texts = random_texts(rng, ["lorem", "ipsum", "dolor", "sit", "amet"], 10, 20)
+    texts += ["", "a", "abcd", "abcde", "!!!!!!", "😀🙏 emoji"]
+    hashes = deduplicate.compute_simhashes(texts)
+    for batch_size in [1, 3, 7]:
+        batches = [
+            deduplicate.compute_simhashes(texts[i : i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        ]
+        np.testing.assert_array_equal(hashes, np.concatenate(batches))
+
+
+def test_remove_duplicates_clusters(tmp_path):
+    a_dir = tmp_path / "a_duplicates"
+    b_dir = tmp_path / "b_duplicates"
+    # 7 - 4 - 9 is a chain across the datasets, 2 and 1 have duplicates in the other
+    # dataset, and 0 is only known as a duplicate of 3
+    save_split(a_dir, id=[7, 4, 2, 1, 3], duplicates=[[4, -1], [9], [20], [], [0, 3]])
+    save_split(b_dir, id=[9, 20, 6, 11], duplicates=[[], [], [1], [11]])
+    clusters_file = str(tmp_path / "clusters.npy")
+
+    deduplicate.remove_duplicates(
+        [str(a_dir), str(b_dir)],
+        split="train",
+        num_proc=1,
+        chunk_size=2,
+        clusters_file=clusters_file,
+    )
+
+    assert [4, 2, 1, 3] == load_from_disk(str(tmp_path / "a_deduplicated"))["train"][
+        "id"
+    ]
+    assert [11] == load_from_disk(str(tmp_path / "b_deduplicated"))["train"]["id"]
+    clusters = np.load(clusters_file)
+    assert {1: 1, 2: 2, 3: 3, 4: 4, 6: 1, 7: 4, 9: 4, 11: 11, 20: 2} == dict(
+        zip(clusters["id"].tolist(), clusters["representative"].tolist())
+    )
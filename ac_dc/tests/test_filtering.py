@@ -0,0 +1,245 @@
+import gzip
+import inspect
+import json
+import random
+from pathlib import Path
+
+import numpy as np
+import pytest
+from datasets import Dataset
+
+import filtering
+from filtering import Filtering, LoadParameters
+from parameters_filtering import parameters_filtering
+
+
+def character_repetition_ratio_loop(document, character_repetition_length):
+    """Former implementation of Filtering.compute_character_repetition_ratio."""
+
+    def get_freq_character_ngrams(document, n):
+        character_ngrams = [document[i : i + n] for i in range(len(document) - n + 1)]
+        freq_character_ngrams = {}
+        for character_ngram in character_ngrams:
+            freq_character_ngrams[character_ngram] = (
+                freq_character_ngrams.get(character_ngram, 0) + 1
+            )
+        return freq_character_ngrams
+
+    freq_character_ngrams = get_freq_character_ngrams(
+        document, character_repetition_length
+    )
+    if len(freq_character_ngrams) == 0:
+        return 0
+    freq_character_ngrams = list(freq_character_ngrams.values())
+    freq_character_ngrams = sorted(freq_character_ngrams, reverse=True)
+    val_less_than_one = len([el for el in freq_character_ngrams if el > 1])
+    num_rep_character_ngrams = min(
+        int(np.sqrt(len(freq_character_ngrams))),
+        len(freq_character_ngrams) - val_less_than_one,
+    )
+    character_repetition_ratio = sum(
+        freq_character_ngrams[:num_rep_character_ngrams]
+    ) / sum(freq_character_ngrams)
+    return character_repetition_ratio
+
+
+def special_characters_ratio_loop(document, special_characters):
+    """Former implementation of Filtering.compute_special_characters_ratio."""
+    if len(document) == 0:
+        return 0
+    special_characters_ratio = len(
+        [char for char in document if char in special_characters]
+    ) / len(document)
+    return special_characters_ratio
+
+
+# Sample WET file of the repository, with English, Chinese and Russian documents
+SAMPLE_FILE = (
+    Path(__file__).parents[2] / "kenlm_training" / "tests" / "data" / "sample.warc.txt"
+)
+
+
+def get_documents():
+    """The documents of the sample file, the whole file as a long document, and edge cases."""
+    sample = SAMPLE_FILE.read_text()
+    # The content of a record follows the first empty line
+    documents = [
+        record.split("\n\n", 1)[1] for record in sample.split("WARC/1.0\n")[2:]
+    ]
+    rng = random.Random(0)
+    emoji = "".join(chr(rng.randint(0x1F600, 0x1F64F)) for _ in range(300))
+    documents += [
+        sample,
+        "",
+        "a",
+        "abcdefghi",
+        "a" * 1000,
+        # Characters outside of the Basic Multilingual Plane
+        emoji,
+        "😀🙏" * 400,
+        documents[0].replace(" ", " 𝔘𝔫𝔦𝔠𝔬𝔡𝔢 ") + emoji,
+        # As many distinct characters as possible, so that the n-grams
+        # do not fit in 64 bits
+        "".join(chr(rng.randint(0x20, 0x2FFFF)) for _ in range(2000)),
+    ]
+    return documents
+
+
+@pytest.fixture(params=[True, False], ids=["vectorized", "python"])
+def vectorization(request, monkeypatch):
+    """Use the vectorized implementations for all the documents, or never."""
+    min_length_vectorization = 0 if request.param else float("inf")
+    monkeypatch.setattr(Filtering, "min_length_vectorization", min_length_vectorization)
+
+
+@pytest.mark.parametrize("character_repetition_length", [1, 3, 10, 40])
+def test_character_repetition_ratio(vectorization, character_repetition_length):
+    for document in get_documents():
+        assert Filtering.compute_character_repetition_ratio(
+            document, character_repetition_length
+        ) == character_repetition_ratio_loop(
+            document, character_repetition_length
+        ), document
+
+
+def test_special_characters_ratio(vectorization):
+    special_characters = parameters_filtering["default"]["special_characters"]
+    for document in get_documents():
+        assert Filtering.compute_special_characters_ratio(
+            document, special_characters
+        ) == special_characters_ratio_loop(document, special_characters), document
+
+
+def get_filtering_parameters(lang_dataset_id):
+    """The parameters of Filtering.filtering, without the models."""
+    param = LoadParameters.load_parameters(lang_dataset_id)
+    filtering_parameters = {
+        name: value
+        for name, value in param.items()
+        if name in inspect.signature(Filtering.filtering).parameters
+    }
+    filtering_parameters.update(
+        sentencepiece_model_tok=None,
+        stopwords=LoadParameters.load_stopwords(lang_dataset_id),
+        flagged_words=LoadParameters.load_flagged_words(lang_dataset_id),
+        cond_check_lang_id=False,
+        lang_dataset_id=lang_dataset_id,
+        model_lang_id=None,
+        cond_check_perplexity=False,
+        sentencepiece_model=None,
+        kenlm_model=None,
+    )
+    return filtering_parameters
+
+
+@pytest.mark.parametrize(
+    "checks_order", [None, Filtering.checks_names[::-1]], ids=["default", "reversed"]
+)
+def test_filtering_prebuilt_checks(checks_order):
+    filtering_parameters = get_filtering_parameters("en")
+    checks = Filtering.get_checks(**filtering_parameters, checks_order=checks_order)
+    assert [
+        check_name
+        for check_name in checks_order or Filtering.checks_names
+        if filtering_parameters[f"cond_check_{check_name}"]
+    ] == [check_name for check_name, _ in checks]
+
+    documents = get_documents()
+    keep_documents = [
+        Filtering.filtering(
+            document=document,
+            **filtering_parameters,
+            checks_order=checks_order,
+            checks=checks,
+        )
+        for document in documents
+    ]
+    # A document is kept if and only if each check, done alone, keeps it
+    assert [
+        all(
+            Filtering.filtering(
+                document=document, **filtering_parameters, checks_order=[check_name]
+            )
+            for check_name, _ in checks
+        )
+        for document in documents
+    ] == keep_documents
+    assert 0 < sum(keep_documents) < len(documents)
+    assert keep_documents == Filtering.filtering_batch(
+        documents=documents, **filtering_parameters, checks_order=checks_order
+    )
+
+
+class KeepEven:
+    """Stands for the filtering functions, keeping the documents with an even
+    number, and failing once after `num_batches` batches if it is set."""
+
+    num_batches = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, examples):
+        if KeepEven.num_batches == 0:
+            KeepEven.num_batches = None
+            raise KeyboardInterrupt
+        if KeepEven.num_batches is not None:
+            KeepEven.num_batches -= 1
+        return [int(text.split()[1]) % 2 == 0 for text in examples["text"]]
+
+
+class Unchanged:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, examples):
+        return examples
+
+
+def read_shards(path_dir):
+    texts = []
+    for path in sorted(path_dir.glob("shard_*.jsonl.gz")):
+        with gzip.open(path, "rt") as f:
+            texts += [json.loads(line)["text"] for line in f]
+    return texts
+
+
+def test_streaming_filtering_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(filtering, "FunctionDatasetModifyingDocuments", Unchanged)
+    monkeypatch.setattr(filtering, "FunctionDatasetFiltering", KeepEven)
+    texts = [f"document {i}" for i in range(50)]
+
+    def run():
+        dataset = Dataset.from_dict({"text": texts}).to_iterable_dataset()
+        filtering.StreamingDatasetFiltering(
+            dataset,
+            "en",
+            None,
+            None,
+            None,
+            str(tmp_path),
+            batch_size=4,
+            num_documents_per_shard=3,
+        ).filtering()
+
+    # Interrupted at the 6th batch, after 2 completed shards, with
+    # the documents of the 5th batch written in an unfinished shard
+    monkeypatch.setattr(KeepEven, "num_batches", 5)
+    with pytest.raises(KeyboardInterrupt):
+        run()
+    checkpoint = json.loads((tmp_path / "en" / "checkpoint.json").read_text())
+    assert (16, 2, False) == (
+        checkpoint["num_documents_read"],
+        checkpoint["num_shards"],
+        checkpoint["done"],
+    )
+    assert (tmp_path / "en" / "shard_00002.jsonl.gz.tmp").exists()
+
+    run()
+    assert texts[::2] == read_shards(tmp_path / "en")
+    checkpoint = json.loads((tmp_path / "en" / "checkpoint.json").read_text())
+    assert (50, 25, True) == (
+        checkpoint["num_documents_read"],
+        checkpoint["num_documents_kept"],
+        checkpoint["done"],
+    )
@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+import pytest
+
+from simhash_index import SegmentedSimhashIndex, SimhashIndex, hamming_distances
+
+
+def flip_bits(rng, hashes, num_bits):
+    """Copies of the hashes with `num_bits` random bits flipped in each one."""
+    flipped = hashes.copy()
+    for i in range(len(hashes)):
+        for bit in rng.choice(64, num_bits, replace=False):
+            flipped[i] ^= np.uint64(1) << np.uint64(bit)
+    return flipped
+
+
+@pytest.mark.parametrize(
+    "max_threshold,num_blocks", [(0, None), (1, None), (3, None), (3, 4), (3, 7)]
+)
+def test_query_brute_force(max_threshold, num_blocks):
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 2**64, 50, dtype=np.uint64)
+    # Clusters of hashes at every distance around the threshold, and unrelated hashes
+    hashes = np.concatenate(
+        [base]
+        + [flip_bits(rng, base, num_bits) for num_bits in range(1, 6)]
+        + [rng.integers(0, 2**64, 100, dtype=np.uint64)]
+    )
+    ids = rng.permutation(len(hashes)) + 1000
+    index = SimhashIndex.build(ids, hashes, max_threshold, num_blocks)
+    queries = np.concatenate([hashes[::3], flip_bits(rng, hashes[::7], 2)])
+
+    distances = hamming_distances(
+        np.repeat(queries, len(hashes)), np.tile(hashes, len(queries))
+    ).reshape(len(queries), len(hashes))
+    for threshold in range(max_threshold + 1):
+        expected_queries, positions = np.nonzero(distances <= threshold)
+        expected = sorted(
+            zip(
+                expected_queries.tolist(),
+                ids[positions].tolist(),
+                distances[expected_queries, positions].tolist(),
+            )
+        )
+        result_queries, result_ids, result_distances = index.query(queries, threshold)
+        assert expected == sorted(
+            zip(result_queries.tolist(), result_ids.tolist(), result_distances.tolist())
+        )
+
+
+def test_concurrent_merges(tmp_path):
+    index_dir = str(tmp_path / "index")
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2**63, 30, dtype=np.uint64)
+    index = SegmentedSimhashIndex.open(index_dir, max_threshold=1)
+    for i in range(0, 30, 10):
+        index.add(np.arange(i, i + 10), hashes[i : i + 10])
+    expected = index.query(hashes, threshold=1)
+
+    first = SegmentedSimhashIndex.open(index_dir)
+    other = SegmentedSimhashIndex.open(index_dir)
+    new_segment_name = first.new_segment_name
+
+    def merge_other():
+        # The other process merges the same segments while the first one builds its segment
+        other.merge()
+        return new_segment_name()
+
+    first.new_segment_name = merge_other
+    first.merge()
+
+    index = SegmentedSimhashIndex.open(index_dir)
+    assert other.segments == index.segments
+    assert 1 == len(index.segments)
+    assert sorted(index.segments + ["segments.json", "segments.lock"]) == sorted(
+        os.listdir(index_dir)
+    )
+    for result, expected_result in zip(index.query(hashes, threshold=1), expected):
+        np.testing.assert_array_equal(result, expected_result)
+
+
+def test_query_during_merge(tmp_path):
+    index_dir = str(tmp_path / "index")
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2**63, 30, dtype=np.uint64)
+    index = SegmentedSimhashIndex.open(index_dir, max_threshold=1)
+    for i in range(0, 30, 10):
+        index.add(np.arange(i, i + 10), hashes[i : i + 10])
+    expected = index.query(hashes, threshold=1)
+
+    # A reader opened before the merge, which has not queried the index yet
+    reader = SegmentedSimhashIndex.open(index_dir)
+    SegmentedSimhashIndex.open(index_dir).merge()
+    assert 1 == len(SegmentedSimhashIndex.open(index_dir).segments)
+    assert not any(
+        os.path.exists(os.path.join(index_dir, segment)) for segment in reader.segments
+    )
+
+    for result, expected_result in zip(reader.query(hashes, threshold=1), expected):
+        np.testing.assert_array_equal(result, expected_result)
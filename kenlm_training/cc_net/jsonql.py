@@ -251,6 +251,26 @@ class Transformer:
     def do(self, x):
         raise NotImplementedError(f"'do' not implemented in {type(self)}")
 
+    def call_batch(self, batch: List) -> List:
+        """Same as `__call__` for a list of documents. `None` results are removed."""
+        assert self.ready, f"{self} is not ready."
+        batch = [x for x in batch if x is not None]
+        if not batch:
+            return []
+        results = self.do_batch(batch)
+        self.processed += len(batch)
+        if time.time() - self.__last_log > self._log_freq:
+            self.log_summary()
+        return [y for y in results if y is not None]
+
+    def do_batch(self, batch: List) -> List:
+        """Transforms a list of documents, and returns the results in the same order.
+
+        `None` results can be omitted.
+        Override it to amortize the cost of each call to `do`.
+        """
+        return [self.do(x) for x in batch]
+
     def summary(self) -> List[str]:
         return [self.speed_summary()]
 
@@ -284,6 +304,17 @@ class Transformer:
                 for x in source:
                     yield self(x)
 
+    def map_batches(self, source: Iterable, batch_size: int) -> Iterator:
+        """Same as `map`, but calls `do_batch` on `batch_size` documents at once."""
+        if self.ready:
+            for batch in grouper(source, batch_size):
+                yield from self.call_batch(batch)
+            return
+        else:
+            with self:
+                for batch in grouper(source, batch_size):
+                    yield from self.call_batch(batch)
+
     def __getstate__(self) -> Tuple[tuple, dict, bool]:
         return (self.__args, self.__kwargs, self.expect_json)
 
@@ -347,6 +378,11 @@ class MultiTransformer(Transformer):
             x = t(x)
         return x
 
+    def do_batch(self, batch):
+        for t in self.transformers:
+            batch = t.call_batch(batch)
+        return batch
+
     def _prepare(self):
         for t in self.transformers:
             t.__enter__()
@@ -390,7 +426,7 @@ def run_pipes(
     file: ReadableFileLike = None,
     output: WritableFileLike = None,
     processes: int = 1,
-    chunksize: int = 10_000,
+    chunksize: Optional[int] = None,
 ):
     """
     Run full document processing pipeline.
@@ -403,7 +439,10 @@ def run_pipes(
     - file: if inputs is not given, will read documents from this file.
     - output: writable file like.
     - processes: number of processes to use. -1 means all CPU available.
-    - chunksize: chunksize for multiprocessing.Pool.imap_unordered
+    - chunksize: number of documents given at once to the transformers `do_batch`,
+        and to each of the processes (10_000 by default). With a single process,
+        the documents are only given by batches if `chunksize` is set, so that
+        they are streamed one by one otherwise.
     """
     expect_json = len(fns) and isinstance(fns[0], Transformer) and fns[0].expect_json
     if expect_json and inputs is None:
@@ -426,12 +465,16 @@ def run_pipes(
     if processes == -1:
         processes = os.cpu_count() or 0
 
+    serialized = False
     with contextlib.suppress(BrokenPipeError), contextlib.ExitStack() as stack:
         if transformers:
             log(f"preparing {transformers}")
             transform = stack.enter_context(compose(transformers))
             if processes <= 1:
-                data = transform.map(data)
+                if chunksize:
+                    data = transform.map_batches(data, chunksize)
+                else:
+                    data = transform.map(data)
             else:
                 p = multiprocessing.current_process()
                 log(f"Will start {processes} processes from {p.name}, Pid: {p.pid}")
@@ -442,9 +485,15 @@ def run_pipes(
                         initargs=(transform,),
                     )
                 )
+                # When nothing else is run on the documents, the processes serialize
+                # them, and this process only writes what it receives.
+                serialized = not pipes
                 data = pool.imap_unordered(
-                    _global_transformer, data, chunksize=chunksize
+                    functools.partial(_global_transformer, serialize=serialized),
+                    grouper(data, chunksize or 10_000),
                 )
+                if not serialized:
+                    data = itertools.chain.from_iterable(data)
 
         for fn in pipes:
             if isinstance(fn, Transformer):
@@ -452,7 +501,10 @@ def run_pipes(
             else:
                 data = fn(data)
 
-        write_jsons(data, output)
+        if serialized:
+            write_serialized(data, output)
+        else:
+            write_jsons(data, output)
 
 
 # Allows to share transformer acroos subprocess.
@@ -470,9 +522,12 @@ def _set_global_transformer(transformer: Transformer):
     _GLOBAL_TRANSFORMER = transformer
 
 
-def _global_transformer(document: str) -> Optional[dict]:
+def _global_transformer(batch: List, serialize: bool) -> Union[List, str]:
     assert _GLOBAL_TRANSFORMER is not None
-    return _GLOBAL_TRANSFORMER(document)
+    results = _GLOBAL_TRANSFORMER.call_batch(batch)
+    if serialize:
+        return "".join(serialize_json(res) for res in results)
+    return results
 
 
 def lines(file: ReadableFileLike) -> Iterator[str]:
@@ -505,6 +560,22 @@ def write_jsons(source: Iterable[dict], file: WritableFileLike) -> None:
             print(res, file=o)
 
 
+def serialize_json(res) -> str:
+    """Serializes a result the same way than `write_jsons`."""
+    if isinstance(res, dict):
+        return json.dumps(res, ensure_ascii=False) + os.linesep
+    if isinstance(res, str):
+        res = res.rstrip("\n")
+    return f"{res}\n"
+
+
+def write_serialized(source: Iterable[str], file: WritableFileLike) -> None:
+    """Writes the output of `serialize_json`, concatenated by chunks."""
+    with open_write(file) as o:
+        for chunk in source:
+            o.write(chunk)
+
+
 class JsonReader(Transformer):
     def __init__(self, strict: bool = False):
         super().__init__()
@@ -924,7 +995,8 @@ def open_read(filename: ReadableFileLike) -> Iterable[str]:
     `filename` is something else -> returns the object wrapped in a `nullcontext`
         This allows to pass already openened files or iterables.
 
-    `open_read` will decompress gzip files, given they have ".gz" suffix.
+    `open_read` will decompress gzip, zstd and lz4 files,
+    given they have ".gz", ".zst" or ".lz4" suffix.
     """
     if filename is None:
         return sys.stdin
@@ -958,14 +1030,48 @@ def open_read(filename: ReadableFileLike) -> Iterable[str]:
         return block_reader(filename)
 
     logging.getLogger(__name__).info(f"Opening {filename} with mode 'rt'")
-    if filename.suffix == ".gz":
-        file: TextIO = gzip.open(filename, "rt")  # type: ignore
-    else:
-        file = open(filename, "rt")
+    file: TextIO = _open_compressed(filename, "rt")  # type: ignore
 
     return _close_when_exhausted(file)
 
 
+# Modules needed for the optional compression formats.
+_COMPRESSION_MODULES = {".zst": "zstandard", ".lz4": "lz4.frame"}
+
+
+def _compression_module(suffix: str):
+    module = _COMPRESSION_MODULES[suffix]
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(
+            f"Module '{module}' is required for '{suffix}' files."
+            " Try `pip install cc_net[compression]`"
+        ) from e
+
+
+def _open_compressed(file, mode: str = "rt", suffix: Optional[str] = None) -> tp.IO:
+    """Open a path or a binary file for reading, and decompress it according to `suffix`.
+
+    By default `suffix` is the one of the given path.
+    Concatenated gzip members, zstd frames and lz4 frames are read one after the other.
+    """
+    if suffix is None:
+        suffix = Path(file).suffix
+    if suffix == ".gz":
+        return gzip.open(file, mode)  # type: ignore
+    if suffix == ".lz4":
+        return _compression_module(suffix).open(file, mode)
+    if suffix == ".zst":
+        zstandard = _compression_module(suffix)
+        raw = file if hasattr(file, "read") else open(file, "rb")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            raw, read_across_frames=True
+        )
+        return reader if "b" in mode else io.TextIOWrapper(reader)
+    return open(file, mode)
+
+
 def _close_when_exhausted(file: TextIO) -> Iterable[str]:
     with file:
         yield from file
@@ -989,6 +1095,8 @@ def open_write(
     Write mode:
         replaces "?" from filename by numbers ranging from 0 to 9, generatings files of size `max_size`.
         If filename ends with ".gz", creates a blocked gzip file with random access.
+        If filename ends with ".zst", creates a blocked zstd file with random access.
+        If filename ends with ".lz4", creates a lz4 file.
     """
     if filename is None:
         return contextlib.nullcontext(sys.stdout)
@@ -1011,9 +1119,12 @@ def open_write(
         return sharded_file(filename, mode, max_size)
 
     logging.getLogger(__name__).info(f"Opening {filename} with mode {mode}")
-    # TODO: should we use another format ?
     if filename.suffix == ".gz":
         return BlockedGzipWriter(Path(filename), mode, block_size="64M")
+    if filename.suffix == ".zst":
+        return BlockedZstdWriter(Path(filename), mode, block_size="64M")
+    if filename.suffix == ".lz4":
+        return _compression_module(".lz4").open(filename, mode)
 
     return open(filename, "wt")
 
@@ -1082,10 +1193,10 @@ class MultiFile(SimpleIO):
 _session = functools.lru_cache()(requests.Session)
 
 
-def request_get_content(url: str, n_retry: int = 3) -> bytes:
+def request_get_content(url: str, n_retry: int = 3, retry_delay: float = 10) -> bytes:
     """Retrieve the binary content at url.
 
-    Retry on connection errors.
+    Retry on connection errors, waiting `retry_delay * 2 ** i` seconds before the i-th retry.
     """
     t0 = time.time()
     logging.info(f"Starting download of {url}")
@@ -1102,7 +1213,7 @@ def request_get_content(url: str, n_retry: int = 3) -> bytes:
             warnings.warn(
                 f"Swallowed error {e} while downloading {url} ({i} out of {n_retry})"
             )
-            time.sleep(10 * 2**i)
+            time.sleep(retry_delay * 2**i)
     dl_time = time.time() - t0
     dl_speed = len(r.content) / dl_time / 1024
     logging.info(
@@ -1111,7 +1222,9 @@ def request_get_content(url: str, n_retry: int = 3) -> bytes:
     return r.content
 
 
-def open_remote_file(url: str, cache: Path = None) -> Iterable[str]:
+def open_remote_file(
+    url: str, cache: Path = None, n_retry: int = 3, retry_delay: float = 10
+) -> Iterable[str]:
     """Download the files at the given url to memory and opens it as a file.
     Assumes that the file is small, and fetch it when this function is called.
     """
@@ -1121,7 +1234,7 @@ def open_remote_file(url: str, cache: Path = None) -> Iterable[str]:
     # TODO: open the remote file in streaming mode.
     # The hard part is that we need to write the content on disk at the same time,
     # to implement disk caching.
-    raw_bytes = request_get_content(url)
+    raw_bytes = request_get_content(url, n_retry=n_retry, retry_delay=retry_delay)
     content = io.BytesIO(raw_bytes)
     if url.endswith(".gz"):
         f: TextIO = gzip.open(content, mode="rt")  # type: ignore
@@ -1193,17 +1306,18 @@ class SplitFile:
 def get_block_readers(filename: Path, n_readers, mode="t"):
     index_filename = filename.parent / (filename.name + ".index")
     if not index_filename.exists():
-        return [gzip.open(filename, "r" + mode)]
-    index: List[int] = np.load(index_filename)
-    n_chunks = len(index)
+        return [_open_compressed(filename, "r" + mode)]
+    index: np.ndarray = np.load(index_filename)
+    offsets, reader = _block_offsets(index)
+    n_chunks = len(offsets)
     chunk_per_reader = int(np.ceil(n_chunks / n_readers))
     n_readers = int(np.ceil(n_chunks / chunk_per_reader))
 
     start = 0
     readers = []
     for i in range(n_readers):
-        end = index[min((i + 1) * chunk_per_reader - 1, n_chunks - 1)]
-        r = _blocked_gzip_reader(filename, start, end, mode)
+        end = offsets[min((i + 1) * chunk_per_reader - 1, n_chunks - 1)]
+        r = reader(filename, start, end, mode)
         readers.append(r)
         start = end
     return readers
@@ -1211,7 +1325,9 @@ def get_block_readers(filename: Path, n_readers, mode="t"):
 
 def block_reader(filename: Path) -> Iterable[str]:
     root, pattern = str(filename)[:-1].split("[", 1)
-    assert root.endswith(".gz"), "Can only read block of a .gz file for now."
+    assert root.endswith(".gz") or root.endswith(
+        ".zst"
+    ), "Can only read block of a .gz or .zst file for now."
 
     ii, nn = pattern.strip().split("/")
     i, n_readers = int(ii), int(nn)
@@ -1220,8 +1336,9 @@ def block_reader(filename: Path) -> Iterable[str]:
     assert os.path.exists(
         index_filename
     ), f"Index {index_filename} not found for {filename}"
-    index: List[int] = np.load(index_filename)
-    n_chunks = len(index)
+    index: np.ndarray = np.load(index_filename)
+    offsets, reader = _block_offsets(index)
+    n_chunks = len(offsets)
     chunk_per_reader = int(np.ceil(n_chunks / n_readers))
     n_readers = int(np.ceil(n_chunks / chunk_per_reader))
     # I'm not sure how to handle the case where there is less reader than expected.
@@ -1229,9 +1346,21 @@ def block_reader(filename: Path) -> Iterable[str]:
 
     start = 0
     if i > 0:
-        start = index[min((i - 1) * chunk_per_reader, n_chunks - 1)]
-    end = index[min(i * chunk_per_reader, n_chunks - 1)]
-    return _blocked_gzip_reader(root, start, end, mode="t")
+        start = offsets[min((i - 1) * chunk_per_reader, n_chunks - 1)]
+    end = offsets[min(i * chunk_per_reader, n_chunks - 1)]
+    return reader(root, start, end, mode="t")
+
+
+def _block_offsets(index: np.ndarray) -> Tuple[np.ndarray, Callable]:
+    """Offsets of the end of each block, and the function reading between two offsets.
+
+    The index of `BlockedGzipWriter` and `BlockedZstdWriter` holds the compressed
+    and uncompressed offsets of the blocks. Indexes of gzip files written by older
+    versions only hold uncompressed offsets.
+    """
+    if index.ndim == 2:
+        return index[:, 0], _blocks_reader
+    return index, _blocked_gzip_reader
 
 
 def _blocked_gzip_reader(filename, start, end, mode="t") -> Iterable[str]:
@@ -1247,36 +1376,107 @@ def _blocked_gzip_reader(filename, start, end, mode="t") -> Iterable[str]:
         handle.close()
 
 
-class BlockedGzipWriter(MultiFile):
-    """Writes a Gzip files which can be read by block.
+def _blocks_reader(filename, start, end, mode="t") -> Iterable[str]:
+    """Reads the blocks between the compressed offsets `start` and `end`.
+
+    Only those blocks are decompressed, whatever their position in the file.
+    """
+    file = _FileSlice(filename, start, end)
+    with _open_compressed(file, "r" + mode, suffix=Path(filename).suffix) as handle:
+        yield from handle
+
+
+class _FileSlice(io.RawIOBase):
+    """Read only view of the bytes between `start` and `end` of a file."""
+
+    def __init__(self, filename, start: int, end: int):
+        self.handle = open(filename, "rb")
+        self.handle.seek(start)
+        self.remaining = int(end) - int(start)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.remaining <= 0:
+            return 0
+        n = self.handle.readinto(memoryview(buffer)[: self.remaining])
+        self.remaining -= n
+        return n
+
+    def close(self) -> None:
+        self.handle.close()
+        super().close()
+
+
+class _CompressedBlock(io.RawIOBase):
+    """Compresses what is written to it into `file`, and ends the block when closed.
+
+    `compressor` is a `zlib.compressobj` or alike.
+    `file` is left open, so that the next block can follow.
+    """
+
+    def __init__(self, file: tp.BinaryIO, compressor):
+        self.file = file
+        self.compressor = compressor
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.size += len(data)
+        self.file.write(self.compressor.compress(data))
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.file.write(self.compressor.flush())
+        super().close()
+
 
+class _BlockedWriter(MultiFile):
+    """Writes a compressed file which can be read by block.
+
+    Each block is compressed independently, and the ".index" file lists the compressed
+    and uncompressed offsets of the end of each block.
+    This allows to decompress any block without decompressing the previous ones.
     Decreasing the block size may hurt compression, but provides more split points.
     """
 
     def __init__(self, filename: Path, mode: str, block_size: str = "256M"):
         assert "w" in mode
         self.filename = Path(filename)
-        self.index: List[int] = []
-        self.zipfile: Optional[gzip.GzipFile] = None
+        self.index: List[Tuple[int, int]] = []
+        self.raw: Optional[tp.BinaryIO] = None
+        self.block: Optional[_CompressedBlock] = None
+        self.uncompressed_size = 0
         super().__init__([], mode, block_size)
 
+    def _compressor(self):
+        raise NotImplementedError
+
     def _open_next_handle(self) -> bool:
-        """Here we never actually close/open handles,
-        we just write the end of block sequence."""
-        if not self.current_handle:
-            mode = self.mode + "t"
-            self.current_handle = tp.cast(TextIO, gzip.open(self.filename, mode))
-            assert isinstance(self.current_handle.buffer, gzip.GzipFile)
-            self.zipfile = self.current_handle.buffer
-            return True
-
-        # Use Z_FULL_FLUSH to allow random access:
-        # https://github.com/madler/zlib/blob/cacf7f1d4e3d44d871b605da3b647f07d718623f/zlib.h#L313
-        self.current_handle.buffer.flush(zlib_mode=zlib.Z_FULL_FLUSH)  # type: ignore
-        self.index.append(self.current_handle.tell())
+        """Here we never actually close/open the file,
+        we just end the current block and start a new one."""
+        if self.raw is None:
+            self.raw = open(self.filename, "wb")
+        else:
+            self._end_block()
+
+        self.block = _CompressedBlock(self.raw, self._compressor())
+        self.current_handle = io.TextIOWrapper(io.BufferedWriter(self.block))
         self.current_block_size = 0
         return True
 
+    def _end_block(self) -> None:
+        assert self.current_handle is not None and self.raw is not None
+        assert self.block is not None
+        # Writes the end of the block, but doesn't close `self.raw`.
+        self.current_handle.close()
+        self.uncompressed_size += self.block.size
+        self.index.append((self.raw.tell(), self.uncompressed_size))
+
     def flush(self):
         assert self.current_handle is not None
         self.current_handle.flush()
@@ -1284,15 +1484,41 @@ class BlockedGzipWriter(MultiFile):
     def close(self):
         if self.current_handle is None:
             return
-        self.current_handle.flush()
-        self.index.append(self.current_handle.tell())
-        self.current_handle.close()
+        self._end_block()
         self.current_handle = None
+        self.block = None
+        assert self.raw is not None
+        self.raw.close()
+        self.raw = None
         index = np.array(self.index, dtype=np.uint64)
         with open(str(self.filename) + ".index", "wb") as o:
             np.save(o, index)
 
 
+class BlockedGzipWriter(_BlockedWriter):
+    """Writes a Gzip files which can be read by block, each block being a gzip member."""
+
+    def _compressor(self):
+        # Same compression level than `gzip.open`.
+        return zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class BlockedZstdWriter(_BlockedWriter):
+    """Writes a zstd files which can be read by block, each block being a zstd frame.
+
+    zstd is several times faster than gzip to compress and decompress.
+    """
+
+    def __init__(
+        self, filename: Path, mode: str, block_size: str = "256M", level: int = 3
+    ):
+        self.zstd = _compression_module(".zst").ZstdCompressor(level=level)
+        super().__init__(filename, mode, block_size)
+
+    def _compressor(self):
+        return self.zstd.compressobj()
+
+
 def grouper(iterable, n):
     group = []
     for x in iterable:
@@ -71,6 +71,7 @@ class Config(NamedTuple):
     task_parallelism: max number of task to run in parallel
     pipeline: restricts the mining pipeline to the given steps. Order is important !
     experiments: (HACK) enable specific experiments in the code
+    prefetch_segments: number of WET segments downloaded in the background while one is parsed
     """
 
     config_name: str = "base"
@@ -97,6 +98,7 @@ class Config(NamedTuple):
     pipeline: Sequence[str] = DEFAULT_PIPELINE
     experiments: Sequence[str] = []
     cache_dir: Optional[Path] = None
+    prefetch_segments: int = 1
 
     def get_executor(
         self, name: str, timeout_hour: int = 1, mem_gb: int = 1, cpus: int = 1
@@ -126,6 +128,7 @@ class Config(NamedTuple):
             num_segments_per_shard=self.num_segments_per_shard,
             min_len=self.min_len,
             cache_dir=dump_cache,
+            prefetch=self.prefetch_segments,
         )
 
     @classmethod
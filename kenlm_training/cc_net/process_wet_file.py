@@ -4,15 +4,28 @@
 # LICENSE file in the root directory of this source tree.
 #
 
+import collections
+import concurrent.futures
 import contextlib
 import functools
+import gzip
+import io
 import logging
 import re
 import tempfile
+import threading
 import time
 import urllib.request
 from pathlib import Path
-from typing import ContextManager, Iterable, Iterator, List, Optional, Sequence
+from typing import (
+    ContextManager,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 from urllib.parse import urlparse
 
 import func_argparse
@@ -164,15 +177,36 @@ def dl(
 
 class CCSegmentsReader(Iterable[dict]):
     def __init__(
-        self, segments: Sequence[str], min_len: int = 0, cache_dir: Path = None
+        self,
+        segments: Sequence[str],
+        min_len: int = 0,
+        cache_dir: Path = None,
+        prefetch: int = 1,
+        n_retry: int = 3,
+        retry_delay: float = 10,
     ):
+        """Downloads segments of Common Crawl, and yields dict.
+
+        Arguments:
+            segments: paths of the WET files
+            min_len: minimum length of the documents
+            cache_dir: folder where to keep the downloaded segments
+            prefetch: number of segments downloaded in the background while
+                the current one is parsed (0 to download them one by one)
+            n_retry: number of attempts at downloading a segment
+            retry_delay: delay before the first retry, doubled at each retry
+        """
         self._segments = segments
         self.min_len = min_len
         if cache_dir is not None:
             cache_dir = Path(cache_dir)
             cache_dir.mkdir(exist_ok=True)
         self.cache_dir = cache_dir
+        self.prefetch = prefetch
+        self.n_retry = n_retry
+        self.retry_delay = retry_delay
         self.retrieved_segments = 0
+        self._lock = threading.Lock()
 
     def segment_url(self, segment: str):
         return "/".join((WET_URL_ROOT, segment))
@@ -187,16 +221,47 @@ class CCSegmentsReader(Iterable[dict]):
         if self.cache_dir:
             file = self.cache_dir / segment.split("/")[-1]
         if not file or not file.exists():
-            self.retrieved_segments += 1
+            with self._lock:
+                self.retrieved_segments += 1
+
+        return jsonql.open_remote_file(
+            url, cache=file, n_retry=self.n_retry, retry_delay=self.retry_delay
+        )
 
-        return jsonql.open_remote_file(url, cache=file)
+    def open_segments(self) -> Iterator[Tuple[str, Iterable[str]]]:
+        """Opens the segments in order, downloading the next `prefetch` ones in threads.
+
+        `open_segment` downloads the whole segment, to memory or to the cache,
+        so only the parsing is left to the consumer.
+        """
+        if self.prefetch <= 0:
+            for segment in self.segments:
+                yield segment, self.open_segment(segment)
+            return
+
+        pending: collections.deque = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(self.prefetch) as executor:
+            try:
+                for segment in self.segments:
+                    future = executor.submit(self.open_segment, segment)
+                    pending.append((segment, future))
+                    if len(pending) > self.prefetch:
+                        segment, future = pending.popleft()
+                        yield segment, future.result()
+                while pending:
+                    segment, future = pending.popleft()
+                    yield segment, future.result()
+            finally:
+                # Don't wait for the downloads that didn't start when we stop early.
+                for _, future in pending:
+                    future.cancel()
 
     def __iter__(self) -> Iterator[dict]:
         n = len(self.segments)
-        for i, segment in enumerate(self.segments):
-            start = time.time()
-            # TODO: start downloading the next segment in the background
-            for doc in parse_warc_file(self.open_segment(segment), self.min_len):
+        # Includes the time spent waiting for the download of the segment.
+        start = time.time()
+        for i, (segment, lines) in enumerate(self.open_segments()):
+            for doc in parse_warc_file(lines, self.min_len):
                 doc["cc_segment"] = segment
                 yield doc
 
@@ -204,6 +269,7 @@ class CCSegmentsReader(Iterable[dict]):
                 continue
             end = time.time()
             delay = (end - start) / 3600 * (n - 1 - i)
+            start = end
             logger.info(
                 f"Parsed {i + 1} / {n} files. Estimated remaining time: {delay:.1f}h"
             )
@@ -218,6 +284,7 @@ class CCShardReader(CCSegmentsReader):
         num_segments_per_shard: int = 40,
         min_len: int = 300,
         cache_dir: Path = None,
+        prefetch: int = 1,
     ):
         """Downloads a shard of Common Crawl, and yields dict.
 
@@ -227,8 +294,9 @@ class CCShardReader(CCSegmentsReader):
             num_shards: total number of shards
             num_segments_per_shard: if set will limit the number of files by shard.
                 Useful for testing.
+            prefetch: number of segments downloaded in the background
         """
-        super().__init__([], min_len=min_len, cache_dir=cache_dir)
+        super().__init__([], min_len=min_len, cache_dir=cache_dir, prefetch=prefetch)
         self.dump = dump
         self.shard = shard
         assert num_shards > 0 or num_segments_per_shard > 0
@@ -258,11 +326,14 @@ def _tmp(prefix: str = None, suffix: str = None, dir: Path = None) -> Path:
 
 
 @contextlib.contextmanager
-def timer(name: str = "-"):
+def timer(name: str = "-", n_bytes: int = 0):
     start = time.time()
     yield None
     delay = time.time() - start
-    print(f"{name} took {delay:.1f}s")
+    if n_bytes:
+        print(f"{name} took {delay:.1f}s ({n_bytes / 1e6 / delay:.1f}MB/s)")
+    else:
+        print(f"{name} took {delay:.1f}s")
 
 
 def benchmark(tmp_path: Path):
@@ -277,9 +348,14 @@ def benchmark(tmp_path: Path):
     with timer("from network, with caching"):
         list(CCSegmentsReader(segments, cache_dir=tmp_path))
     assert seg_file.exists()
+    # Throughputs in MB of uncompressed WET file
+    content = gzip.decompress(seg_file.read_bytes())
+
+    with timer("from disk", len(content)):
+        list(CCSegmentsReader(segments, cache_dir=tmp_path))
 
-    with timer("from disk"):
-        CCSegmentsReader(segments, cache_dir=tmp_path)
+    with timer("parsing", len(content)):
+        list(parse_warc_file(io.StringIO(content.decode())))
     seg_file.unlink()
 
 
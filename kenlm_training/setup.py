@@ -51,6 +51,8 @@ setup(
         # This fork only compiles the kind of dict used by cc_net.
         # Full version is at https://github.com/atom-moyer/getpy
         "getpy": ["getpy @ git+https://github.com/gwenzek/getpy.git@v0.9.10-subset"],
+        # Faster compression of intermediate files, with ".zst" or ".lz4" suffix.
+        "compression": ["zstandard>=0.15", "lz4"],
     },
     package_data={"cc_net": ["data/*"]},
 )
@@ -4,9 +4,11 @@
 # LICENSE file in the root directory of this source tree.
 #
 
+import gzip
 import io
+import json
 from pathlib import Path
-from typing import Sequence
+from typing import List, Optional, Sequence
 
 import numpy as np
 import pytest
@@ -246,6 +248,87 @@ def test_blocked_gzip(tmp_path: Path):
     assert list(jsonql.grouper(expected, 10)) == read_as_several_files
 
 
+def test_blocked_gzip_random_access(tmp_path: Path):
+    file = tmp_path / "test.gz"
+    content = ['{"xx": %d}' % i for i in range(80)]
+    with jsonql.BlockedGzipWriter(file, "wt", block_size="20B") as o:
+        for line in content:
+            print(line, file=o)
+
+    index = np.load(str(file) + ".index")
+    assert index.shape == (40, 2)
+    assert index[-1, 0] == file.stat().st_size
+    assert index[-1, 1] == sum(len(line) + 1 for line in content)
+
+    # Corrupt the first block: reading the last one shouldn't decompress it.
+    first_end = int(index[0, 0])
+    data = bytearray(file.read_bytes())
+    data[20 : first_end - 8] = b"\xff" * (first_end - 28)
+    file.write_bytes(bytes(data))
+    jr = jsonql.JsonReader(strict=True)
+    assert list(jr.map(content[-2:])) == list(jsonql.read_jsons(f"{file}[39/40]"))
+    last_reader = jsonql.get_block_readers(file, 4)[-1]
+    assert list(jr.map(content[-20:])) == list(jsonql.read_jsons(last_reader))
+
+
+@pytest.mark.parametrize(
+    "suffix,module", [(".gz", "gzip"), (".zst", "zstandard"), (".lz4", "lz4.frame")]
+)
+def test_open_read_write_compressed(tmp_path: Path, suffix: str, module: str):
+    pytest.importorskip(module)
+    file = tmp_path / f"test.json{suffix}"
+    content = [dict(xx=i, text="Hello 🐍" * 3) for i in range(40)]
+    jsonql.write_jsons(content, file)
+    assert content == list(jsonql.read_jsons(file))
+
+    files = [tmp_path / f"test_{i}.json{suffix}" for i in range(10)]
+    with jsonql.open_write(files, max_size="1k") as o:
+        for doc in content:
+            print(json.dumps(doc), file=o)
+    written = [f for f in files if f.exists()]
+    assert len(written) > 1
+    assert content == list(jsonql.read_jsons(written))
+
+
+def test_blocked_zstd(tmp_path: Path):
+    pytest.importorskip("zstandard")
+    file = tmp_path / "test.json.zst"
+    content = ['{"xx": %d}' % i for i in range(80)]
+    with jsonql.BlockedZstdWriter(file, "wt", block_size="20B") as o:
+        for line in content:
+            print(line, file=o)
+
+    index = np.load(str(file) + ".index")
+    assert index.shape == (40, 2)
+    assert index[-1, 0] == file.stat().st_size
+
+    jr = jsonql.JsonReader(strict=True)
+    expected = list(jr.map(content))
+    assert expected == list(jsonql.read_jsons(file))
+    assert expected[-2:] == list(jsonql.read_jsons(f"{file}[39/40]"))
+    readers = jsonql.get_block_readers(file, 9)
+    read_as_several_files = [list(jsonql.read_jsons(r)) for r in readers]
+    assert list(jsonql.grouper(expected, 10)) == read_as_several_files
+
+
+def test_blocked_gzip_legacy_index(tmp_path: Path):
+    # Older indexes hold uncompressed offsets of a single gzip member.
+    file = tmp_path / "test.gz"
+    content = ['{"xx": %d}' % i for i in range(8)]
+    with gzip.open(file, "wt") as o:
+        for line in content:
+            print(line, file=o)
+    offsets = np.cumsum([len(line) + 1 for line in content]).astype(np.uint64)
+    with open(str(file) + ".index", "wb") as o:
+        np.save(o, offsets[1::2])
+
+    jr = jsonql.JsonReader(strict=True)
+    expected = list(jr.map(content))
+    assert expected[2:4] == list(jsonql.read_jsons(f"{file}[1/4]"))
+    readers = jsonql.get_block_readers(file, 2)
+    assert [expected[:4], expected[4:]] == [list(jsonql.read_jsons(r)) for r in readers]
+
+
 def test_enter_exit(capsys):
     class MyTransformer(jsonql.Transformer):
         def __enter__(self):
@@ -310,3 +393,70 @@ def test_multiprocess(capsys):
     jsonql.run_pipes(mult, processes=2, file=(str(x) for x in range(10)))
     out = set(capsys.readouterr().out.strip("\n").split("\n"))
     assert {f"2x = {2 * x}" for x in range(10)} == out
+
+
+class BatchSize(jsonql.Transformer):
+    """Adds the size of the batch to the even documents, drops the odd ones."""
+
+    def do(self, doc: dict) -> Optional[dict]:
+        return self.do_batch([doc])[0]
+
+    def do_batch(self, docs: List[dict]) -> List[Optional[dict]]:
+        return [
+            dict(doc, batch_size=len(docs)) if doc["x"] % 2 == 0 else None
+            for doc in docs
+        ]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_do_batch(tmp_path: Path, processes: int):
+    file = tmp_path / "in.json"
+    jsonql.write_jsons([dict(x=x) for x in range(10)], file)
+    output = tmp_path / "out.json"
+    # JsonReader and BatchSize are composed into a MultiTransformer.
+    jsonql.run_pipes(
+        BatchSize(), file=file, output=output, processes=processes, chunksize=4
+    )
+    results = sorted(jsonql.read_jsons(output), key=lambda doc: doc["x"])
+    # Batches of 4, 4 and 2 lines.
+    assert [dict(x=x, batch_size=4 if x < 8 else 2) for x in range(0, 10, 2)] == results
+
+
+@pytest.mark.parametrize("chunksize", [None, 4])
+def test_single_process_streaming(chunksize: Optional[int]):
+    n_read = 0
+
+    def inputs():
+        nonlocal n_read
+        for x in range(10):
+            n_read += 1
+            yield dict(x=x)
+
+    n_read_when_written = []
+
+    def record_reads(docs):
+        for doc in docs:
+            if doc is not None:
+                n_read_when_written.append(n_read)
+            yield doc
+
+    jsonql.run_pipes(
+        BatchSize(), record_reads, inputs=inputs(), output=None, chunksize=chunksize
+    )
+    if chunksize is None:
+        # Each document is written before the next one is read.
+        assert [1, 3, 5, 7, 9] == n_read_when_written
+    else:
+        assert [4, 4, 8, 8, 10] == n_read_when_written
+
+
+def test_multiprocess_with_pipes(capsys):
+    mult = jsonql.Mapper(lambda x: 2 * int(x))
+    jsonql.run_pipes(
+        mult,
+        lambda xs: (f"2x = {x}" for x in xs),
+        processes=2,
+        file=map(str, range(10)),
+    )
+    out = set(capsys.readouterr().out.strip("\n").split("\n"))
+    assert {f"2x = {2 * x}" for x in range(10)} == out
@@ -50,7 +50,7 @@ def test_minify():
 
 @pytest.fixture
 def http_from_disk(monkeypatch):
-    def read_sample_file(url: str, n_retry: int = 3) -> bytes:
+    def read_sample_file(url: str, n_retry: int = 3, retry_delay: float = 10) -> bytes:
         expected_url = process_wet_file.WET_URL_ROOT + "/crawl-data/sample.warc.wet"
         assert expected_url == url
         file = Path(__file__).parent / "data" / "sample.warc.txt"
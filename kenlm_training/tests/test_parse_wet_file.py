@@ -4,7 +4,13 @@
 # LICENSE file in the root directory of this source tree.
 #
 
+import http.server
+import threading
 from pathlib import Path
+from typing import Dict
+
+import pytest
+import requests
 
 from cc_net import process_wet_file
 
@@ -45,3 +51,102 @@ Fiction is obliged to stick to possibilities. Truth isn't.
 """
 
     assert expected_quotes == documents[0]["raw_content"]
+
+
+class SampleServer(http.server.BaseHTTPRequestHandler):
+    """Serves the sample WET file at every path, failing the first `n_failures` requests of each path."""
+
+    n_failures = 0
+    requests: Dict[str, int] = {}
+
+    def do_GET(self):
+        n = self.requests.get(self.path, 0)
+        self.requests[self.path] = n + 1
+        if n < self.n_failures:
+            self.send_error(503)
+            return
+        content = (Path(__file__).parent / "data" / "sample.warc.txt").read_bytes()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sample_server():
+    SampleServer.n_failures = 0
+    SampleServer.requests = {}
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SampleServer)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class LocalSegmentsReader(process_wet_file.CCSegmentsReader):
+    def __init__(self, root: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.root = root
+
+    def segment_url(self, segment: str):
+        return "/".join((self.root, segment))
+
+
+@pytest.mark.parametrize("prefetch", [0, 1, 3])
+def test_segments_reader_prefetch(sample_server, tmp_path: Path, prefetch: int):
+    segments = [f"crawl-data/segment_{i}.warc.wet" for i in range(5)]
+    reader = LocalSegmentsReader(
+        sample_server, segments, cache_dir=tmp_path, prefetch=prefetch
+    )
+    documents = list(reader)
+
+    assert reader.retrieved_segments == 5
+    assert [s for s in segments for _ in range(3)] == [
+        d["cc_segment"] for d in documents
+    ]
+    assert ["http://sample_english.com"] * 5 == [d["url"] for d in documents[::3]]
+    assert sorted(f"segment_{i}.warc.wet" for i in range(5)) == sorted(
+        f.name for f in tmp_path.iterdir()
+    )
+
+    # The second time the segments are read from the cache.
+    reader = LocalSegmentsReader(
+        sample_server, segments, cache_dir=tmp_path, prefetch=prefetch
+    )
+    assert documents == list(reader)
+    assert reader.retrieved_segments == 0
+    assert all(n == 1 for n in SampleServer.requests.values())
+
+
+def test_segments_reader_stops_early(sample_server):
+    segments = [f"crawl-data/segment_{i}.warc.wet" for i in range(10)]
+    reader = LocalSegmentsReader(sample_server, segments, prefetch=2)
+    documents = iter(reader)
+    assert "crawl-data/segment_0.warc.wet" == next(documents)["cc_segment"]
+    documents.close()  # type: ignore
+    # Only the segments being downloaded in the background were requested.
+    assert len(SampleServer.requests) <= 3
+
+
+def test_segments_reader_retry(sample_server):
+    SampleServer.n_failures = 1
+    segments = [f"crawl-data/segment_{i}.warc.wet" for i in range(3)]
+    reader = LocalSegmentsReader(
+        sample_server, segments, prefetch=2, n_retry=2, retry_delay=0
+    )
+    with pytest.warns(UserWarning, match="Swallowed error"):
+        documents = list(reader)
+    assert 9 == len(documents)
+    assert all(n == 2 for n in SampleServer.requests.values())
+
+    reader = LocalSegmentsReader(
+        sample_server, ["crawl-data/other.warc.wet"], n_retry=1
+    )
+    with pytest.raises(requests.exceptions.HTTPError):
+        list(reader)